@@ -0,0 +1,105 @@
+"""Export and import time and file size of a synthetic record.
+
+Compares the former export (dill stream per member, deflate level 9) with
+`Record.export` storing the columnar members as they are or compressed by
+a codec in a thread pool. Import time includes reading every member, peak
+is the memory traced by tracemalloc while exporting.
+
+    python benchmarks/bench_record_export.py [GB] [codec ...]
+"""
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from pathlib import Path
+
+import dill
+import numpy as np
+
+from qulab.scan import Scan
+from qulab.scan.record import BufferList, Record
+
+KEYS = 4
+POINT = 16384  # float64 values per point, 128 kB
+
+
+def make_record(path, gigabytes):
+    scan = Scan('bench', database=path)
+    scan.search('x', np.arange(1), level=0)
+    record = Record(None, path, scan.description)
+    points = int(gigabytes * 2**30 / KEYS / POINT / 8)
+    rng = np.random.default_rng(0)
+    for k in range(KEYS):
+        buf = BufferList(path / f'data{k}')
+        buf.lu, buf.rd, buf.inner_shape = (0, ), (points, ), (POINT, )
+        for i in range(points):
+            # a trace digitized to a few significant digits
+            buf.append((i, ), np.round(rng.normal(size=POINT), 2))
+        buf.flush()
+        record._items[f'trace{k}'] = buf
+    record.scripts = lambda: []
+    record.config = lambda: {}
+    return record
+
+
+def legacy_export(record, file):
+    with zipfile.ZipFile(file,
+                         'w',
+                         compression=zipfile.ZIP_DEFLATED,
+                         compresslevel=9) as z:
+        items = {}
+        for key in record.keys():
+            value = record.get(key)
+            v = BufferList()
+            v.lu, v.rd, v.inner_shape = value.lu, value.rd, value.inner_shape
+            items[key] = v
+            with z.open(f'{key}.buf', 'w') as f:
+                for pos, data in value.iter():
+                    dill.dump((pos, data), f)
+        with z.open('record.pkl', 'w') as f:
+            dill.dump((record.description, items), f)
+        with z.open('config.pkl', 'w') as f:
+            f.write(dill.dumps({}))
+
+
+def bench(gigabytes, codecs):
+    path = Path(tempfile.mkdtemp())
+    try:
+        record = make_record(path, gigabytes)
+        print(f'{gigabytes:.2f} GB in {KEYS} members')
+        print(f'{"export":>10} {"write s":>8} {"read s":>8} {"size MB":>8} '
+              f'{"peak MB":>8}')
+        for codec in codecs:
+            file = path / f'{codec}.zip'
+            tracemalloc.start()
+            start = time.perf_counter()
+            if codec == 'legacy':
+                legacy_export(record, file)
+            else:
+                record.export(file, codec=None if codec == 'none' else codec)
+            write = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            loaded = Record.load(file)
+            for key in loaded.keys():
+                loaded.get(key, buffer_to_array=True)
+            read = time.perf_counter() - start
+            size = file.stat().st_size / 2**20
+            print(f'{codec:>10} {write:8.2f} {read:8.2f} {size:8.1f} '
+                  f'{peak:8.1f}')
+            file.unlink()
+        record.flush()
+        del record, loaded
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    bench(
+        float(sys.argv[1]) if len(sys.argv) > 1 else 1.0,
+        sys.argv[2:] or ['legacy', 'none', 'zlib'],
+    )
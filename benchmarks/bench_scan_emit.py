@@ -0,0 +1,67 @@
+"""Per-point Python overhead of emitting a step to the record.
+
+Compares the former path, which matched every variable name against the
+hidden patterns and let `Record.append` inspect every key, with the plans
+`Scan._emit` and `Record.append` now keep per level and set of variables.
+
+    python benchmarks/bench_scan_emit.py [steps] [variables]
+"""
+import asyncio
+import inspect
+import sys
+import time
+
+import numpy as np
+
+from qulab.scan import Scan
+from qulab.scan.record import Record
+
+
+def make_scan(nvars):
+    scan = Scan('bench', database=None)
+    scan.search('x', np.arange(10), level=0)
+    variables = {'self': scan, 'config': {}, '__hidden': 0, '#note': ''}
+    variables.update({f'v{i}': 0.0 for i in range(nvars)})
+    return scan, variables
+
+
+async def legacy_emit(scan, position, variables):
+    for key, value in list(variables.items()):
+        if inspect.isawaitable(value) and not scan.hiden(key):
+            variables[key] = await value
+    variables = {k: v for k, v in variables.items() if not scan.hiden(k)}
+    scan.record._append_items(0, (position, ), variables)
+
+
+async def bench(steps, nvars):
+    scan, variables = make_scan(nvars)
+    scan.record = Record(None, None, scan.description)
+    start = time.perf_counter()
+    for i in range(steps):
+        variables['x'] = i
+        await legacy_emit(scan, i, variables.copy())
+    before = (time.perf_counter() - start) / steps
+    expected = scan.record.get('v0', buffer_to_array=True)
+
+    scan, variables = make_scan(nvars)
+    scan.record = Record(None, None, scan.description)
+    start = time.perf_counter()
+    for i in range(steps):
+        variables['x'] = i
+        await scan._emit(0, i, i, variables.copy())
+    after = (time.perf_counter() - start) / steps
+    assert np.array_equal(scan.record.get('v0', buffer_to_array=True),
+                          expected)
+
+    print(f'{nvars + 5} variables, {steps} steps')
+    print(f'regex filter:   {before * 1e6:8.2f} us/step')
+    print(f'compiled plans: {after * 1e6:8.2f} us/step')
+    print(f'speedup:        {before / after:8.2f}x')
+
+
+if __name__ == '__main__':
+    asyncio.run(
+        bench(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+        ))
@@ -0,0 +1,60 @@
+"""Wall-clock time of an optimization with a slow synthetic objective.
+
+Each evaluation of a shifted sphere function takes `delay` seconds, like a
+measurement. With `batch_size=k` the optimizer is asked for k points, the
+k promises run concurrently and the results are told back together.
+
+    python benchmarks/bench_scan_optimize.py [maxiter] [delay] [batch]
+"""
+import asyncio
+import sys
+import time
+
+import numpy as np
+
+from qulab.scan import Scan
+
+DIMS = 4
+
+
+async def sphere(delay, *x):
+    await asyncio.sleep(delay)
+    return float(np.sum((np.asarray(x) - 0.3)**2))
+
+
+def make_scan(maxiter, delay, batch_size):
+    scan = Scan('bench', database=None)
+    opt = scan.minimize('loss',
+                        level=0,
+                        maxiter=maxiter,
+                        batch_size=batch_size,
+                        budget=maxiter)
+    names = [f'x{i}' for i in range(DIMS)]
+    for name in names:
+        scan.search(name, opt.Real(-1, 1))
+    scan.set('loss',
+             eval(f"lambda self, {', '.join(names)}: "
+                  f"self.promise(sphere({delay}, {', '.join(names)}))",
+                  {'sphere': sphere}))
+    return scan
+
+
+async def bench(maxiter, delay, batch_size):
+    print(f'{DIMS} dims, {maxiter} evaluations of {delay * 1e3:.0f} ms')
+    for k in [1, batch_size]:
+        scan = make_scan(maxiter, delay, k)
+        start = time.perf_counter()
+        await scan.run()
+        elapsed = time.perf_counter() - start
+        x = [scan.variables[f'x{i}'] for i in range(DIMS)]
+        best = float(np.sum((np.asarray(x) - 0.3)**2))
+        print(f'batch_size={k:<3d} {elapsed:8.2f} s   f(best)={best:.4f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(
+        bench(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 64,
+            float(sys.argv[2]) if len(sys.argv) > 2 else 0.05,
+            int(sys.argv[3]) if len(sys.argv) > 3 else 8,
+        ))
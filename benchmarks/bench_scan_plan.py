@@ -0,0 +1,56 @@
+"""Per-step overhead of evaluating the dependents of a scan level.
+
+Compares `call_many_functions`, which merges dicts and inspects signatures
+on every step, with the plan compiled by `assymbly`.
+
+    python benchmarks/bench_scan_plan.py [steps]
+"""
+import asyncio
+import sys
+import time
+
+from qlispreg.expression import Symbol
+
+from qulab.scan.scan import _compile_plan, _run_plan, call_many_functions
+
+
+def make_level():
+    functions = {
+        'y': lambda x: x + 1,
+        'z': lambda x, y, k=2: x * y * k,
+        'u': lambda z, offset: z - offset,
+        'v': Symbol('x') * 2 + Symbol('y'),
+        'w': lambda u, v: u + v,
+    }
+    order = [['x'], ['y'], ['z', 'v'], ['u'], ['w']]
+    return order, functions
+
+
+async def bench(steps):
+    order, functions = make_level()
+    plan = _compile_plan(order, functions)
+    variables = {'x': 0, 'offset': 3}
+
+    start = time.perf_counter()
+    for x in range(steps):
+        variables['x'] = x
+        variables.update(await call_many_functions(order, functions,
+                                                   variables))
+    before = (time.perf_counter() - start) / steps
+    expected = dict(variables)
+
+    start = time.perf_counter()
+    for x in range(steps):
+        variables['x'] = x
+        variables.update(await _run_plan(plan, variables))
+    after = (time.perf_counter() - start) / steps
+    assert variables == expected
+
+    print(f'{len(functions)} dependents, {steps} steps')
+    print(f'call_many_functions: {before * 1e6:8.2f} us/step')
+    print(f'compiled plan:       {after * 1e6:8.2f} us/step')
+    print(f'speedup:             {before / after:8.2f}x')
+
+
+if __name__ == '__main__':
+    asyncio.run(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
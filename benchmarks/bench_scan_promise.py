@@ -0,0 +1,73 @@
+"""Latency of `Scan.promise` for a plain function run in a worker process.
+
+Compares shipping the pickled function with every call (the former
+behaviour) with `FunctionPool`, which ships each function once per worker
+and passes large arrays through shared memory.
+
+    python benchmarks/bench_scan_promise.py [calls] [array size]
+"""
+import asyncio
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import dill
+import numpy as np
+
+from qulab.scan.process import FunctionPool
+
+
+def _run_function_in_process(buf):
+    func, args, kwds = dill.loads(buf)
+    return func(*args, **kwds)
+
+
+def make_analysis():
+    # a closure dragging a sizeable table along, like a fit model
+    table = np.random.randn(200_000)
+
+    def analysis(data):
+        n = min(data.size, table.size)
+        return float(np.dot(data[:n], table[:n]))
+
+    return analysis
+
+
+async def bench(calls, size):
+    analysis = make_analysis()
+    data = np.random.randn(size)
+    loop = asyncio.get_running_loop()
+
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        await loop.run_in_executor(executor, abs, 0)
+        start = time.perf_counter()
+        for _ in range(calls):
+            buf = dill.dumps((analysis, (data, ), {}))
+            expected = await loop.run_in_executor(executor,
+                                                  _run_function_in_process,
+                                                  buf)
+        before = (time.perf_counter() - start) / calls
+
+    pool = FunctionPool(max_workers=4)
+    try:
+        await pool.submit(abs, 0)
+        start = time.perf_counter()
+        for _ in range(calls):
+            result = await pool.submit(analysis, data)
+        after = (time.perf_counter() - start) / calls
+    finally:
+        pool.shutdown()
+    assert result == expected
+
+    print(f'{calls} calls, argument {data.nbytes / 1e6:.1f} MB')
+    print(f'dill per call: {before * 1e3:8.2f} ms/call')
+    print(f'FunctionPool:  {after * 1e3:8.2f} ms/call')
+    print(f'speedup:       {before / after:8.2f}x')
+
+
+if __name__ == '__main__':
+    asyncio.run(
+        bench(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000,
+        ))
@@ -0,0 +1,74 @@
+"""Cost of appending points to a storage Dataset.
+
+Compares the former per-append bound updates (one session and commit per
+key and point, emulated here) with the write-behind bounds of `append`
+and with `append_many`.
+
+    python benchmarks/bench_storage_append.py [points]
+"""
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from qulab.storage.local import LocalStorage
+from qulab.storage.models import Array as ArrayModel
+
+
+def per_point_commit(ds, position, data):
+    for key, value in data.items():
+        arr = ds._array_for_append(key, value)
+        arr.append(position, value)
+        with ds.storage._get_session() as session:
+            arr_model = (session.query(ArrayModel).filter_by(
+                dataset_id=ds.id, name=key).first())
+            arr_model.lu = list(arr.lu)
+            arr_model.rd = list(arr.rd)
+            session.commit()
+
+
+def points(n):
+    for i in range(n):
+        yield (i // 100, i % 100), {'x': float(i), 'y': 2.0 * i}
+
+
+def bench(n):
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = LocalStorage(tmp)
+
+        # the former path is far slower, time a slice of it
+        m = min(n, 2000)
+        ds = storage.create_dataset('before', description={}).get()
+        start = time.perf_counter()
+        for position, data in points(m):
+            per_point_commit(ds, position, data)
+        ds.flush()
+        before = (time.perf_counter() - start) / m
+
+        ds = storage.create_dataset('append', description={}).get()
+        start = time.perf_counter()
+        for position, data in points(n):
+            ds.append(position, data)
+        ds.flush()
+        append = (time.perf_counter() - start) / n
+
+        ds = storage.create_dataset('append_many', description={}).get()
+        start = time.perf_counter()
+        positions, data = zip(*points(n))
+        ds.append_many(positions, data)
+        ds.flush()
+        many = (time.perf_counter() - start) / n
+
+        x = ds.get_array('x').toarray()
+        assert np.array_equal(x.ravel()[:n], np.arange(n, dtype=float))
+
+    print(f'{n} points, 2 keys')
+    print(f'commit per point: {before * 1e6:8.2f} us/point ({m} points)')
+    print(f'append:           {append * 1e6:8.2f} us/point')
+    print(f'append_many:      {many * 1e6:8.2f} us/point')
+    print(f'speedup:          {before / append:8.2f}x / {before / many:.2f}x')
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
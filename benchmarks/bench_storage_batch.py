@@ -0,0 +1,92 @@
+"""Bulk metadata calls over a loopback StorageServer.
+
+Pings the server, then fetches the keys and the info of many datasets,
+one call at a time, with `RemoteStorage.batch()` and with
+`RemoteStorage.abatch()`. Ping shows the cost of the round trips alone.
+
+    python benchmarks/bench_storage_batch.py [datasets] [port]
+"""
+import asyncio
+import multiprocessing
+import sys
+import tempfile
+import time
+
+from qulab.storage.local import LocalStorage
+from qulab.storage.remote import RemoteStorage
+from qulab.storage.server import StorageServer
+
+
+def serve(path, port):
+    StorageServer(LocalStorage(path), port=port).run_sync()
+
+
+def prepare(path, n):
+    storage = LocalStorage(path)
+    ids = []
+    for i in range(n):
+        ref = storage.create_dataset(f'ds{i}', description={})
+        ref.get().append((0, ), {'x': 1.0, 'y': 2.0})
+        ref.get().flush()
+        ids.append(ref.id)
+    return ids
+
+
+def keys(method, result):
+    # dataset_get also returns the access time, which changes
+    return result['keys'] if method == 'dataset_get' else result
+
+
+def args(method, id):
+    return {} if method == 'ping' else {'id': id}
+
+
+def bench(n, port):
+    with tempfile.TemporaryDirectory() as path:
+        ids = prepare(path, n)
+        # a forked child would inherit the SQLite connections of prepare()
+        server = multiprocessing.get_context('spawn').Process(
+            target=serve, args=(path, port), daemon=True)
+        server.start()
+        try:
+            remote = RemoteStorage(f'tcp://127.0.0.1:{port}', timeout=60)
+            remote._call('ping')
+
+            results = {}
+            for method in ['ping', 'dataset_keys', 'dataset_get']:
+                start = time.perf_counter()
+                expected = [
+                    keys(method, remote._call(method, **args(method, id))) for id in ids
+                ]
+                sequential = time.perf_counter() - start
+
+                start = time.perf_counter()
+                with remote.batch() as batch:
+                    futures = [batch.call(method, **args(method, id)) for id in ids]
+                batched = time.perf_counter() - start
+                assert [keys(method, f.result()) for f in futures] == expected
+
+                async def abatch():
+                    async with remote.abatch() as batch:
+                        futures = [batch.call(method, **args(method, id)) for id in ids]
+                    return [keys(method, f.result()) for f in futures]
+
+                start = time.perf_counter()
+                assert asyncio.run(abatch()) == expected
+                results[method] = sequential, batched, time.perf_counter() - start
+        finally:
+            server.kill()
+            server.join()
+
+    print(f'{n} datasets')
+    for method, (sequential, batched, async_batched) in results.items():
+        print(f'{method}')
+        print(f'  sequential: {sequential:8.3f} s')
+        print(f'  batch:      {batched:8.3f} s ({sequential / batched:.1f}x)')
+        print(f'  abatch:     {async_batched:8.3f} s '
+              f'({sequential / async_batched:.1f}x)')
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+          int(sys.argv[2]) if len(sys.argv) > 2 else 16792)
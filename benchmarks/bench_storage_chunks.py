@@ -0,0 +1,54 @@
+"""Write and read cost of appended arrays by storage type.
+
+Compares the pickled 'data' storage with binary 'chunks' storage for a
+2D scan of scalar points and of 1D traces.
+
+    python benchmarks/bench_storage_chunks.py [points]
+"""
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from qulab.storage.array import Array
+from qulab.storage.local import LocalStorage
+
+
+def run(storage, storage_type, n, inner):
+    array = Array.create(storage, 1, storage_type, storage_type=storage_type)
+    width = 100
+    values = np.random.default_rng(0).random((n, ) + inner)
+
+    start = time.perf_counter()
+    for i in range(n):
+        array.append((i // width, i % width), values[i])
+    array.flush()
+    write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    x = array.toarray()
+    read = time.perf_counter() - start
+
+    assert np.array_equal(x.reshape((-1, ) + inner)[:n], values)
+    return write, read
+
+
+def bench(n):
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = LocalStorage(tmp)
+        for inner in [(), (64, )]:
+            m = n if not inner else n // 10
+            print(f'{m} points of shape {inner}')
+            results = {}
+            for storage_type in ['data', 'chunks']:
+                write, read = run(storage, storage_type, m, inner)
+                results[storage_type] = read
+                print(f'  {storage_type:6}: write {write / m * 1e6:7.2f} '
+                      f'us/point, toarray {read * 1e3:8.1f} ms')
+            print(f'  toarray speedup: '
+                  f'{results["data"] / results["chunks"]:.1f}x')
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
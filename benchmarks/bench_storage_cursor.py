@@ -0,0 +1,68 @@
+"""Total time of paging through an array with StorageServer.array_iter.
+
+The former handler reopened the array and skipped to the requested start
+for every page, which is quadratic in the length of the array. Pages now
+resume from a server-side cursor. Handlers are called in process, so the
+numbers exclude the transport.
+
+    python benchmarks/bench_storage_cursor.py [page]
+"""
+import asyncio
+import sys
+import tempfile
+import time
+
+from qulab.storage.local import LocalStorage
+from qulab.storage.server import StorageServer
+
+
+async def legacy_iter(server, dataset_id, key, start, count):
+    ds = server.storage.get_dataset(dataset_id)
+    arr = ds.get_array(key)
+    arr.flush()
+    results = []
+    for i, item in enumerate(arr.iter()):
+        if i < start:
+            continue
+        if len(results) >= count:
+            break
+        results.append(item)
+    return results
+
+
+async def scan(handler, server, dataset_id, page):
+    n, start = 0, 0
+    while True:
+        items = await handler(dataset_id, 'x', start, page)
+        n += len(items)
+        start += len(items)
+        if len(items) < page:
+            return n
+
+
+async def bench(page):
+    print(f'page of {page} items, total time of a full scan')
+    print(f'{"items":>8} {"legacy":>10} {"cursor":>10}')
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = LocalStorage(tmp)
+        server = StorageServer(storage, workers=0)
+        for n in [2000, 4000, 8000, 16000]:
+            ref = storage.create_dataset(f'{n}', description={})
+            ds = ref.get()
+            ds.append_many([(i, ) for i in range(n)],
+                           [{'x': float(i)} for i in range(n)])
+            ds.flush()
+
+            times = []
+            for handler in [
+                    lambda *a: legacy_iter(server, *a),
+                    server.handle_array_iter
+            ]:
+                start = time.perf_counter()
+                assert await scan(handler, server, ref.id, page) == n
+                times.append(time.perf_counter() - start)
+            print(f'{n:8} {times[0]:9.3f}s {times[1]:9.3f}s')
+
+
+if __name__ == '__main__':
+    asyncio.run(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100))
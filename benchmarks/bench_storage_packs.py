@@ -0,0 +1,75 @@
+"""Random reads of small chunks from loose files and from packs.
+
+Saves many small chunks, reads them in random order as loose files,
+repacks them and reads them again through the former open/seek/read of
+the pack per chunk and through `load_chunk`, which looks the hash up in
+the merged sorted index and slices the mapped pack.
+
+    python benchmarks/bench_storage_packs.py [chunks]
+"""
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from qulab.storage import chunk
+from qulab.storage.chunk import (load_chunk, read_pack_index, repack_chunks,
+                                 save_chunk)
+
+
+def open_seek_read(base, index, hashstr):
+    pack, start, size = index[hashstr]
+    with open(base / 'packs' / pack, 'rb') as f:
+        f.seek(start)
+        return f.read(size)
+
+
+def timeit(func, hashes):
+    start = time.perf_counter()
+    for h in hashes:
+        func(h)
+    return time.perf_counter() - start
+
+
+def bench(n):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp)
+        hashes = [
+            save_chunk(rng.randbytes(rng.randint(64, 1024)),
+                       base_path=base)[0].name for _ in range(n)
+        ]
+        rng.shuffle(hashes)
+        load = lambda h: load_chunk(h, base_path=base)
+
+        loose = timeit(load, hashes)
+
+        start = time.perf_counter()
+        repack_chunks(base, grace=0)
+        repack = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = read_pack_index(base)
+        dict_index = time.perf_counter() - start
+        start = time.perf_counter()
+        chunk._pack_indexes[base] = chunk._merge_indexes(
+            base, chunk._read_packs(base))
+        merged_index = time.perf_counter() - start
+
+        seek = timeit(lambda h: open_seek_read(base, index, h), hashes)
+        mapped = timeit(load, hashes)
+        assert all(load(h) == open_seek_read(base, index, h)
+                   for h in hashes[:1000])
+
+    print(f'{n} chunks of 64-1024 bytes, random order')
+    print(f'  repack:                {repack:8.3f} s')
+    print(f'  index load: dict {dict_index * 1e3:8.1f} ms, '
+          f'merged {merged_index * 1e3:8.1f} ms')
+    for name, t in [('loose files', loose), ('pack open/seek/read', seek),
+                    ('pack mmap', mapped)]:
+        print(f'  {name:20} {t:8.3f} s {t / n * 1e6:8.2f} us/chunk')
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,98 @@
+"""Multi-client load test of the storage server.
+
+Starts a StorageServer in a separate process and runs client threads
+against it for a while: `heavy` clients pull a large array with
+`toarray`, `light` clients alternate `ping` and `document_get`. Latency
+percentiles of every method are reported for each worker count.
+
+    python benchmarks/bench_storage_server.py [--workers 0 4] [--heavy 4]
+        [--light 4] [--seconds 5] [--megabytes 16] [--port 16791]
+"""
+import argparse
+import multiprocessing
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from qulab.storage.local import LocalStorage
+from qulab.storage.remote import RemoteStorage
+from qulab.storage.server import StorageServer
+
+
+def serve(path, port, workers):
+    StorageServer(LocalStorage(path), port=port, workers=workers).run_sync()
+
+
+def prepare(path, megabytes):
+    storage = LocalStorage(path)
+    ref = storage.create_dataset('load', description={})
+    n = int(megabytes * 2**20 / 8)
+    ref.get().set_array('x', np.random.rand(n))
+    doc = storage.create_document('doc', data={'a': list(range(100))})
+    return ref.id, doc.id
+
+
+def client(address, calls, deadline, latencies):
+    remote = RemoteStorage(address, timeout=600)
+    while time.perf_counter() < deadline:
+        for method, kwds in calls:
+            start = time.perf_counter()
+            remote._call(method, **kwds)
+            latencies[method].append(time.perf_counter() - start)
+
+
+def run(path, port, workers, args, dataset_id, doc_id):
+    server = multiprocessing.Process(target=serve,
+                                     args=(path, port, workers),
+                                     daemon=True)
+    server.start()
+    address = f'tcp://127.0.0.1:{port}'
+    RemoteStorage(address, timeout=30)._call('ping')
+
+    heavy = [('array_toarray', {'dataset_id': dataset_id, 'key': 'x'})]
+    light = [('ping', {}), ('document_get', {'id': doc_id})]
+    latencies = defaultdict(list)
+    deadline = time.perf_counter() + args.seconds
+    threads = [
+        threading.Thread(target=client,
+                         args=(address, calls, deadline, latencies))
+        for calls in [heavy] * args.heavy + [light] * args.light
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    server.kill()
+    server.join()
+
+    print(f'workers={workers}')
+    for method, values in sorted(latencies.items()):
+        p50, p99 = np.percentile(values, [50, 99]) * 1e3
+        print(f'  {method:14} {len(values):6} calls  '
+              f'p50 {p50:9.2f} ms  p99 {p99:9.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 4])
+    parser.add_argument('--heavy', type=int, default=4)
+    parser.add_argument('--light', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--megabytes', type=float, default=16)
+    parser.add_argument('--port', type=int, default=16791)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        dataset_id, doc_id = prepare(path, args.megabytes)
+        print(f'{args.heavy} heavy clients ({args.megabytes:g} MB toarray), '
+              f'{args.light} light clients, {args.seconds:g} s')
+        for i, workers in enumerate(args.workers):
+            run(path, args.port + i, workers, args, dataset_id, doc_id)
+
+
+if __name__ == '__main__':
+    main()
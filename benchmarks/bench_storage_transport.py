@@ -0,0 +1,79 @@
+"""Throughput of RemoteArray.toarray over a loopback StorageServer.
+
+Compares the former transport, which sent `tolist()` of the array and
+rebuilt it with `np.array`, with the header plus raw buffer frames.
+
+    python benchmarks/bench_storage_transport.py [megabytes] [port]
+"""
+import asyncio
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from qulab.storage.local import LocalStorage
+from qulab.storage.remote import RemoteStorage
+from qulab.storage.server import StorageServer
+
+
+class LegacyServer(StorageServer):
+
+    async def handle_array_toarray_legacy(self, dataset_id, key):
+        result = await self.handle_array_toarray(dataset_id, key)
+        return {
+            "shape": result.shape,
+            "dtype": str(result.dtype),
+            "data": result.tolist()
+        }
+
+
+def timeit(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench(megabytes, port):
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = LocalStorage(tmp)
+        n = int(megabytes * 2**20 / 16)
+        x = np.random.rand(n) + 1j * np.random.rand(n)
+        ref = storage.create_dataset('transport', description={})
+        ref.get().set_array('x', x)
+
+        server = LegacyServer(storage, port=port)
+        thread = threading.Thread(target=server.run_sync, daemon=True)
+        thread.start()
+        time.sleep(0.5)
+
+        remote = RemoteStorage(f'tcp://127.0.0.1:{port}', timeout=600)
+        array = remote.get_dataset(ref.id).get_array('x')
+
+        def legacy():
+            result = remote._call('array_toarray_legacy',
+                                  dataset_id=ref.id,
+                                  key='x')
+            return np.array(result['data']).reshape(result['shape'])
+
+        before, y = timeit(legacy, 1)
+        assert np.array_equal(x, y)
+        after, y = timeit(array.toarray, 3)
+        assert np.array_equal(x, y)
+
+        server.stop()
+        thread.join()
+
+    print(f'{x.nbytes / 2**20:.0f} MB complex128 array')
+    print(f'tolist:  {before:8.3f} s, {x.nbytes / before / 2**20:8.1f} MB/s')
+    print(f'frames:  {after:8.3f} s, {x.nbytes / after / 2**20:8.1f} MB/s')
+    print(f'speedup: {before / after:8.1f}x')
+
+
+if __name__ == '__main__':
+    bench(float(sys.argv[1]) if len(sys.argv) > 1 else 32,
+          int(sys.argv[2]) if len(sys.argv) > 2 else 16790)
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections import deque
+
+import numpy as np
+
+
+class AdaptiveLimit():
+    """Concurrency limit sized by AIMD from observed latencies.
+
+    Each finished job reports its latency. The limit grows by about one
+    per window of jobs as long as the smoothed latency stays within
+    `tolerance` times the best latency seen recently (plus `slack`
+    seconds), and is cut by `backoff` when it does not, e.g. because the
+    record server falls behind and messages start to queue up. After a
+    cut, the jobs already in flight are not taken into account.
+
+    Every change of the integer limit is kept in `history` as
+    (time, limit, smoothed latency).
+    """
+
+    def __init__(self,
+                 limit: int,
+                 minimum: int = 1,
+                 maximum: int | None = None,
+                 tolerance: float = 2.0,
+                 slack: float = 1e-3,
+                 backoff: float = 0.5,
+                 adaptive: bool = True):
+        self.limit = float(max(limit, 1))
+        self.minimum = max(minimum, 1)
+        self.maximum = limit if maximum is None else maximum
+        self.tolerance = tolerance
+        self.slack = slack
+        self.backoff = backoff
+        self.adaptive = adaptive
+        self.inflight = 0
+        self.baseline = None
+        self.latency = None
+        self.history = [(time.time(), int(self.limit), 0.0)]
+        self._guard = 0
+        self._waiters = deque()
+
+    def locked(self) -> bool:
+        return self.inflight >= int(self.limit)
+
+    async def wait(self):
+        """Wait until a slot is free without taking it."""
+        while self.locked():
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    self._wake()
+                raise
+
+    async def acquire(self):
+        await self.wait()
+        self.inflight += 1
+
+    def release(self, latency: float | None = None):
+        self.inflight -= 1
+        if latency is not None:
+            self.observe(latency)
+        self._wake()
+
+    def _wake(self):
+        free = int(self.limit) - self.inflight
+        while free > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                free -= 1
+
+    def observe(self, latency: float):
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline += 1e-3 * (latency - self.baseline)
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += 0.1 * (latency - self.latency)
+
+        if not self.adaptive:
+            return
+        if self._guard > 0:
+            self._guard -= 1
+            return
+
+        last = int(self.limit)
+        if self.latency > self.tolerance * self.baseline + self.slack:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+            self._guard = self.inflight
+            self.latency = None
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        if int(self.limit) != last:
+            self.history.append(
+                (time.time(), int(self.limit), self.latency or latency))
+
+    def timeseries(self) -> dict[str, np.ndarray]:
+        t, limit, latency = zip(*self.history)
+        return {
+            'time': np.array(t),
+            'limit': np.array(limit),
+            'latency': np.array(latency)
+        }
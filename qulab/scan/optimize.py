@@ -1,6 +1,7 @@
 from typing import Any, Sequence
 
 import nevergrad as ng
+import numpy as np
 from scipy.optimize import OptimizeResult
 
 
@@ -11,6 +12,7 @@ class NgOptimizer():
         self.config = {
             'method': 'TBPSA',
             'budget': 100,
+            'num_workers': 1,
         }
         self.config.update(kwds)
         instrum = []
@@ -32,9 +34,10 @@ class NgOptimizer():
                                     lower=space.low,
                                     upper=space.high))
         self.instrum = ng.p.Instrumentation(*instrum)
-        self.opt = getattr(ng.optimizers,
-                           self.config['method'])(self.instrum,
-                                                  budget=self.config['budget'])
+        self.opt = getattr(ng.optimizers, self.config['method'])(
+            self.instrum,
+            budget=self.config['budget'],
+            num_workers=self.config['num_workers'])
 
     def suggest(self, *suggested):
         suggested = [
@@ -42,7 +45,9 @@ class NgOptimizer():
         ]
         self.opt.suggest(*suggested)
 
-    def ask(self):
+    def ask(self, n_points: int | None = None):
+        if n_points is not None:
+            return [self.ask() for _ in range(n_points)]
         tmp = self.opt.ask()
         return [
             space.inverse_transform(x)
@@ -50,6 +55,21 @@ class NgOptimizer():
         ]
 
     def tell(self, suggested: Sequence, value: Any):
+        """Tell the value of a point, or of a list of points.
+
+        Like skopt.Optimizer.tell, `suggested` is a list of points if its
+        first item is a point itself, and `value` then has one value for
+        each of them. The type of `value` is not looked at, a scalar value
+        may come as a numpy array.
+        """
+        if len(suggested) and isinstance(suggested[0],
+                                         (list, tuple, np.ndarray)):
+            if len(suggested) != len(value):
+                raise ValueError(f'got {len(value)} values for '
+                                 f'{len(suggested)} points')
+            for x, y in zip(suggested, value):
+                self.tell(x, y)
+            return
         self._all_x.append(suggested)
         self._all_y.append(value)
         suggested = tuple([
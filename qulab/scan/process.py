@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import dill
+import numpy as np
+
+SHARED_ARRAY_THRESHOLD = 1024 * 1024
+MAX_FUNCTIONS = 256
+
+# worker side: hash -> function
+_functions = {}
+_missing = object()
+
+
+class FunctionNotShipped(Exception):
+    pass
+
+
+class SharedArray():
+    """Placeholder for an ndarray argument living in shared memory."""
+    __slots__ = ('name', 'dtype', 'shape')
+
+    def __init__(self, name, dtype, shape):
+        self.name = name
+        self.dtype = dtype
+        self.shape = shape
+
+    @classmethod
+    def create(cls, array: np.ndarray):
+        shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
+        np.ndarray(array.shape, dtype=array.dtype,
+                   buffer=shm.buf)[...] = array
+        return cls(shm.name, array.dtype.str, array.shape), shm
+
+    def load(self):
+        shm = shared_memory.SharedMemory(name=self.name)
+        # the block is owned and unlinked by the submitting process
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        try:
+            return np.ndarray(self.shape, dtype=self.dtype,
+                              buffer=shm.buf).copy()
+        finally:
+            shm.close()
+
+
+def _share_arrays(args, kwds, threshold):
+    blocks = []
+
+    def share(x):
+        if (isinstance(x, np.ndarray) and x.nbytes >= threshold
+                and x.dtype.kind in 'biufc'):
+            x, shm = SharedArray.create(x)
+            blocks.append(shm)
+        return x
+
+    try:
+        args = tuple(share(x) for x in args)
+        kwds = {k: share(v) for k, v in kwds.items()}
+    except:
+        _release(blocks)
+        raise
+    return args, kwds, blocks
+
+
+def _release(blocks):
+    for shm in blocks:
+        try:
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _load_arrays(args, kwds):
+    args = tuple(x.load() if isinstance(x, SharedArray) else x for x in args)
+    kwds = {
+        k: v.load() if isinstance(v, SharedArray) else v
+        for k, v in kwds.items()
+    }
+    return args, kwds
+
+
+def _fingerprint(func):
+    """What a plain function closes over, to tell when it must be dumped
+    again: its code, defaults, closure cells and the globals it names.
+
+    Compared by identity, so rebinding a name is seen but mutating the
+    object it refers to is not.
+    """
+    code = func.__code__
+    cells = []
+    for cell in func.__closure__ or ():
+        try:
+            cells.append(cell.cell_contents)
+        except ValueError:
+            cells.append(_missing)  # empty cell
+    names = func.__globals__
+    return (code, func.__defaults__, func.__kwdefaults__, *cells,
+            *[names.get(name, _missing) for name in code.co_names])
+
+
+def run_shipped_function(key, func_buf, buf):
+    """Run in a worker process.
+
+    The function is looked up by `key` in the registry of the worker. If
+    it is missing and `func_buf` is None, `FunctionNotShipped` is raised
+    so that the caller can send it again together with the function.
+    """
+    try:
+        func = _functions[key]
+    except KeyError:
+        if func_buf is None:
+            raise FunctionNotShipped(key)
+        if len(_functions) >= MAX_FUNCTIONS:
+            _functions.clear()
+        func = _functions[key] = dill.loads(func_buf)
+    args, kwds = _load_arrays(*dill.loads(buf))
+    return func(*args, **kwds)
+
+
+class FunctionPool():
+    """Persistent process pool that ships each function only once.
+
+    Functions are identified by the hash of their serialized content;
+    every worker keeps the functions it has seen, so later calls only
+    transfer the hash and the arguments. The serialized function is kept
+    per function object and reused until the objects its closure cells
+    or globals refer to are rebound, which gives a new hash and ships it
+    to the workers again.
+
+    Large numeric ndarray arguments are passed through shared memory
+    instead of the pipe of the pool.
+    """
+
+    def __init__(self, max_workers=None, threshold=SHARED_ARRAY_THRESHOLD):
+        self.max_workers = max_workers
+        self.threshold = threshold
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        # function -> (fingerprint, hash, serialized function)
+        self._dumps = weakref.WeakKeyDictionary()
+
+    def _dump_function(self, func):
+        try:
+            fingerprint = _fingerprint(func)
+            cached = self._dumps.get(func)
+        except (AttributeError, TypeError):
+            # not a plain function or not weak referenceable
+            fingerprint = cached = None
+        if cached is not None and len(cached[0]) == len(fingerprint) and all(
+                a is b for a, b in zip(cached[0], fingerprint)):
+            return cached[1:]
+        func_buf = dill.dumps(func)
+        key = hashlib.sha1(func_buf).hexdigest()
+        if fingerprint is not None:
+            self._dumps[func] = fingerprint, key, func_buf
+        return key, func_buf
+
+    def pack(self, func, args=(), kwds={}):
+        """Serialize a call. Raises if it can not be run in a worker."""
+        key, func_buf = self._dump_function(func)
+        args, kwds, blocks = _share_arrays(args, kwds, self.threshold)
+        try:
+            buf = dill.dumps((args, kwds))
+        except:
+            _release(blocks)
+            raise
+        return key, func_buf, buf, blocks
+
+    async def run(self, key, func_buf, buf, blocks=()):
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                return await loop.run_in_executor(self._executor,
+                                                  run_shipped_function, key,
+                                                  None, buf)
+            except FunctionNotShipped:
+                return await loop.run_in_executor(self._executor,
+                                                  run_shipped_function, key,
+                                                  func_buf, buf)
+        finally:
+            _release(blocks)
+
+    @staticmethod
+    def release(call):
+        """Free the shared memory of a call made by `pack`.
+
+        `run` does it when it ends, this is for calls that may never run.
+        """
+        _release(call[3])
+
+    async def submit(self, func, *args, **kwds):
+        return await self.run(*self.pack(func, args, kwds))
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
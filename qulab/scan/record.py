@@ -1,9 +1,17 @@
+import bz2
 import itertools
 import lzma
+import os
 import pickle
+import shutil
+import struct
 import sys
+import tempfile
 import uuid
 import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from threading import Lock
 from types import EllipsisType
@@ -16,9 +24,30 @@ from qulab.sys.rpc.zmq_socket import ZMQContextManager
 
 from .curd import get_config
 from .space import Space
+from .utils import tuple_getter
 
 _not_given = object()
 
+# codecs for the members of exported records: name -> (compress, decompress)
+CODECS = {
+    'zlib': (lambda buf: zlib.compress(buf, 1), zlib.decompress),
+    'bz2': (lambda buf: bz2.compress(buf, 1), bz2.decompress),
+    'lzma': (lambda buf: lzma.compress(buf, preset=1), lzma.decompress),
+}
+
+try:
+    import zstandard
+
+    CODECS['zstd'] = (lambda buf: zstandard.ZstdCompressor().compress(buf),
+                      lambda buf: zstandard.ZstdDecompressor().decompress(buf))
+except ImportError:
+    pass
+
+
+def register_codec(name: str, compress, decompress):
+    """Make `name` available as the codec of `Record.export`."""
+    CODECS[name] = (compress, decompress)
+
 
 def random_path(base):
     while True:
@@ -45,6 +74,264 @@ def index_in_slice(slice_obj: slice | int, index: int):
         return stop < index <= start and (index - start) % step == 0
 
 
+# On-disk layout of a columnar BufferList file:
+#
+#   MAGIC, block, block, ...
+#
+# Each block is written by one `flush` and holds a run of items that share
+# the same value type:
+#
+#   head | meta | positions (int64, count x ndim) | payload | padding
+#
+# Numeric runs store the values as one typed array (`meta` holds the dtype
+# and inner shape, and `py` for Python scalars), so the whole file can be
+# memory mapped and scattered into the result with numpy.  Anything else is
+# dill dumped as a list.
+_MAGIC = b'\x93QBL\x01\x00\x00\x00'
+_BLOCK_HEAD = struct.Struct('<BBHQQ')  # kind, ndim, meta size, count, payload size
+_NUMERIC, _OBJECT = 0, 1
+
+# Remote BufferLists are streamed block by block, the client grants the
+# server credit for at most `_STREAM_WINDOW` blocks in flight.
+_STREAM_BLOCK_SIZE = 1000
+_STREAM_WINDOW = 16
+
+# Members of exported records compressed by a codec are a sequence of
+# independently compressed chunks, so that they are written and read in
+# pieces and the chunks of a member are compressed in parallel:
+#
+#   magic | (size (uint64) | compressed chunk) ...
+_CHUNKED_MAGIC = b'\x93QBZ\x01\x00\x00\x00'
+_CHUNK_HEAD = struct.Struct('<Q')
+_EXPORT_CHUNK_SIZE = 4 * 2**20
+
+
+def _align8(n):
+    return (n + 7) & ~7
+
+
+def _numeric_signature(value):
+    """Return (dtype, shape, python) of a numeric value, None otherwise.
+
+    `python` is true for Python scalars, which are read back as Python
+    scalars rather than numpy ones.
+    """
+    if isinstance(value, (bool, int, float, complex, np.generic, np.ndarray)):
+        a = np.asarray(value)
+        if a.dtype.kind in 'biufc':
+            return a.dtype.str, a.shape, not isinstance(
+                value, (np.generic, np.ndarray))
+    return None
+
+
+def _split_runs(items):
+    """Split (pos, value) items into runs of equal value signature.
+
+    A run holds at most `_STREAM_BLOCK_SIZE` items.
+    """
+    run, last = [], _not_given
+    for pos, value in items:
+        sig = _numeric_signature(value)
+        if run and (sig != last or len(run) >= _STREAM_BLOCK_SIZE):
+            yield last, run
+            run = []
+        run.append((pos, value))
+        last = sig
+    if run:
+        yield last, run
+
+
+def _pack_items(items):
+    """Yield (positions, block) of the columnar format for (pos, value)."""
+    for sig, run in _split_runs(items):
+        pos = np.asarray([p for p, _ in run],
+                         dtype='<i8').reshape(len(run), len(run[0][0]))
+        yield pos, _pack_block(sig, pos, [v for _, v in run])
+
+
+def _pack_block(sig, pos, values):
+    if sig is None:
+        kind, meta = _OBJECT, b''
+        payload = dill.dumps(values)
+    else:
+        dtype, shape, python = sig
+        kind = _NUMERIC
+        meta = f"{dtype}|{','.join(map(str, shape))}{'|py' * python}".encode()
+        payload = np.asarray(values, dtype=dtype).tobytes()
+    meta = meta.ljust(_align8(_BLOCK_HEAD.size + len(meta)) - _BLOCK_HEAD.size)
+    head = _BLOCK_HEAD.pack(kind, pos.shape[1], len(meta), len(values),
+                            len(payload))
+    return b''.join([
+        head, meta,
+        pos.astype('<i8').tobytes(), payload,
+        b'\x00' * (_align8(len(payload)) - len(payload))
+    ])
+
+
+def _block_positions(buf, offset):
+    """Read the header and positions of the block at `offset`.
+
+    Returns (size, kind, meta, pos, payload_start, payload_size).
+    """
+    kind, ndim, meta_size, count, payload_size = _BLOCK_HEAD.unpack_from(
+        buf, offset)
+    start = offset + _BLOCK_HEAD.size
+    meta = bytes(buf[start:start + meta_size]).decode().strip()
+    start += meta_size
+    pos = buf[start:start + count * ndim * 8].view('<i8').reshape(count, ndim)
+    start += count * ndim * 8
+    size = start + _align8(payload_size) - offset
+    return size, kind, meta, pos, start, payload_size
+
+
+def _parse_block(buf, offset):
+    """Return (size, kind, pos, values, python) of the block at `offset`.
+
+    `buf` is a uint8 ndarray (usually a np.memmap of the whole file), the
+    numeric values are returned as views into it without copying.
+    `python` tells if they were appended as Python scalars.
+    """
+    size, kind, meta, pos, start, payload_size = _block_positions(buf, offset)
+    python = False
+    if kind == _NUMERIC:
+        # the dtype of booleans and bytes starts with '|' too
+        python = meta.endswith('|py')
+        dtype, shape = meta.removesuffix('|py').rsplit('|', 1)
+        shape = tuple(int(i) for i in shape.split(',') if i)
+        values = buf[start:start + payload_size].view(dtype).reshape(
+            (len(pos), ) + shape)
+    else:
+        values = dill.loads(bytes(buf[start:start + payload_size]))
+    return size, kind, pos, values, python
+
+
+def _parse_blocks(buf, offset=len(_MAGIC)):
+    while offset + _BLOCK_HEAD.size <= len(buf):
+        size, kind, pos, values, python = _parse_block(buf, offset)
+        yield kind, pos, values, python
+        offset += size
+
+
+# The sidecar index (`<file>.idx`) has one fixed width entry per block,
+# appended by `flush` in the same order as the blocks.  Blocks are written
+# as the scan advances, so their bounding boxes follow the outer loop
+# coordinates and slicing only has to touch the blocks that intersect it.
+_INDEX_MAGIC = b'\x93QBI\x01\x00\x00'
+
+
+def _index_dtype(ndim):
+    return np.dtype([('offset', '<u8'), ('size', '<u8'), ('count', '<u8'),
+                     ('lu', '<i8', (ndim, )), ('rd', '<i8', (ndim, ))])
+
+
+def _index_entry(offset, size, pos):
+    entry = np.zeros(1, dtype=_index_dtype(pos.shape[1]))
+    entry['offset'], entry['size'], entry['count'] = offset, size, len(pos)
+    if len(pos):
+        entry['lu'] = pos.min(axis=0)
+        entry['rd'] = pos.max(axis=0) + 1
+    return entry
+
+
+def _slice_range(s):
+    """Return the half-open [lo, hi) range covered by a slice or an int."""
+    if isinstance(s, int):
+        return s, s + 1
+    start, stop, step = s.start, s.stop, s.step
+    if step is None or step > 0:
+        return 0 if start is None else start, sys.maxsize if stop is None else stop
+    else:
+        return -1 if stop is None else stop + 1, sys.maxsize if start is None else start + 1
+
+
+def _slice_mask(slice_tuple, pos):
+    """Vectorized version of `index_in_slice` over an (n, ndim) array."""
+    mask = np.ones(len(pos), dtype=bool)
+    for s, p in zip(slice_tuple, pos.T):
+        if isinstance(s, int):
+            mask &= p == s
+            continue
+        start, stop, step = s.start, s.stop, s.step
+        if start is None:
+            start = 0
+        if step is None:
+            step = 1
+        if stop is None:
+            stop = sys.maxsize
+        if step > 0:
+            mask &= (start <= p) & (p < stop) & ((p - start) % step == 0)
+        else:
+            mask &= (stop < p) & (p <= start) & ((p - start) % step == 0)
+    return mask
+
+
+def _read_zip_member(file, name):
+    """Content of a columnar member of an exported record as a uint8 array.
+
+    Only the header is read to tell the format, None is returned for
+    members written by old versions as a dill stream.  Members stored
+    without compression are memory mapped in place, compressed members
+    (deflated, or `<key>.buf.<codec>` for one of `CODECS`) are extracted
+    once into an anonymous temporary file that is memory mapped.
+    """
+    with zipfile.ZipFile(file, 'r') as z:
+        info = z.getinfo(name)
+        codec = name.rsplit('.', 1)[-1]
+        if codec not in CODECS and info.compress_type == zipfile.ZIP_STORED:
+            if info.file_size < len(_MAGIC):
+                return None
+            with open(file, 'rb') as f:
+                f.seek(info.header_offset + 26)
+                n, m = struct.unpack('<HH', f.read(4))
+            buf = np.memmap(file,
+                            dtype=np.uint8,
+                            mode='r',
+                            offset=info.header_offset + 30 + n + m,
+                            shape=(info.file_size, ))
+            return buf if bytes(buf[:len(_MAGIC)]) == _MAGIC else None
+        with z.open(info, 'r') as f, tempfile.TemporaryFile() as tmp:
+            if codec in CODECS:
+                decompress = CODECS[codec][1]
+                head = f.read(len(_CHUNKED_MAGIC))
+                if head == _CHUNKED_MAGIC:
+                    while size := f.read(_CHUNK_HEAD.size):
+                        tmp.write(
+                            decompress(f.read(_CHUNK_HEAD.unpack(size)[0])))
+                else:
+                    # a single stream, as written by earlier versions
+                    tmp.write(decompress(head + f.read()))
+                tmp.seek(0)
+                if tmp.read(len(_MAGIC)) != _MAGIC:
+                    return None
+                tmp.seek(0, os.SEEK_END)
+            else:
+                head = f.read(len(_MAGIC))
+                if head != _MAGIC:
+                    return None
+                tmp.write(head)
+                shutil.copyfileobj(f, tmp)
+            tmp.flush()
+            # the mapping outlives the file
+            return np.memmap(tmp, dtype=np.uint8, mode='r', shape=(tmp.tell(), ))
+
+
+def _recv_array(socket):
+    """Receive an array sent by the record server.
+
+    Numeric arrays arrive as a pickled header with dtype and shape followed by
+    the raw contiguous buffer, anything else is pickled in the header.
+    """
+    frames = socket.recv_multipart(copy=False)
+    header = pickle.loads(frames[0].bytes)
+    if not isinstance(header, dict):
+        raise RuntimeError(f'record server failed: {header!r}')
+    if 'value' in header:
+        return header['value']
+    # copy once so the result is writable like a local `toarray`
+    return np.frombuffer(frames[1].buffer,
+                         dtype=header['dtype']).reshape(header['shape']).copy()
+
+
 class BufferList():
 
     def __init__(self, file=None, slice=None):
@@ -57,6 +344,7 @@ class BufferList():
         self._lock = Lock()
         self._data_id = None
         self._sock = None
+        self._member = None
 
     def __repr__(self):
         return f"<BufferList: shape={self.shape}, lu={self.lu}, rd={self.rd}, slice={self._slice}>"
@@ -84,6 +372,20 @@ class BufferList():
         self._lock = Lock()
         self._data_id = None
         self._sock = None
+        self._member = None
+
+    def view(self, slice=None):
+        """Return a view of the items in `slice`.
+
+        The view shares the file and the pending items with this list and
+        only has its own slice, so concurrent readers of the same cached
+        list never see each other's slice.
+        """
+        # not copy.copy, __getstate__ is meant for pickling
+        view = BufferList.__new__(BufferList)
+        view.__dict__.update(self.__dict__)
+        view._slice = slice
+        return view
 
     @property
     def shape(self):
@@ -95,14 +397,78 @@ class BufferList():
             return
         if isinstance(self.file, Path):
             with self._lock:
-                with open(self.file, 'ab') as f:
-                    for item in self._list:
-                        dill.dump(item, f)
+                self._write(self._list, _pack_items(self._list))
                 self._list.clear()
 
+    def _write(self, items, blocks):
+        """Append `blocks` of (pos, block) and their index entries.
+
+        Files written by old versions get the (pos, value) `items` dill
+        dumped instead.
+        """
+        with open(self.file, 'ab') as f:
+            if f.tell() == 0:
+                f.write(_MAGIC)
+                self._index_file().unlink(missing_ok=True)
+            elif not self._is_columnar_file():
+                # keep appending to files written by old versions
+                for item in items:
+                    dill.dump(item, f)
+                return
+            with open(self._index_file(), 'ab') as idx:
+                for pos, block in blocks:
+                    if idx.tell() == 0:
+                        idx.write(_INDEX_MAGIC + bytes([pos.shape[1]]))
+                    idx.write(_index_entry(f.tell(), len(block), pos).tobytes())
+                    f.write(block)
+
+    def _size(self):
+        """Bytes written to the file, what `truncate` takes."""
+        if isinstance(self.file, Path) and self.file.exists():
+            return self.file.stat().st_size
+        return 0
+
+    def truncate(self, size):
+        """Drop the items pending and written after the first `size` bytes.
+
+        Index entries of the dropped blocks are removed too, so that the
+        index still matches the file.
+        """
+        with self._lock:
+            self._list.clear()
+            if not isinstance(self.file, Path) or not self.file.exists():
+                return
+            if size == 0:
+                self.file.unlink()
+                self._index_file().unlink(missing_ok=True)
+                return
+            os.truncate(self.file, size)
+            idx = self._index_file()
+            if not idx.exists():
+                return
+            head = np.fromfile(idx, dtype=np.uint8)
+            start = len(_INDEX_MAGIC) + 1
+            if len(head) < start or bytes(
+                    head[:len(_INDEX_MAGIC)]) != _INDEX_MAGIC:
+                idx.unlink()
+                return
+            dtype = _index_dtype(int(head[len(_INDEX_MAGIC)]))
+            body = head[start:]
+            index = body[:len(body) - len(body) % dtype.itemsize].view(dtype)
+            kept = np.count_nonzero(index['offset'] + index['size'] <= size)
+            os.truncate(idx, start + kept * dtype.itemsize)
+
+    def _is_columnar_file(self):
+        with open(self.file, 'rb') as f:
+            return f.read(len(_MAGIC)) == _MAGIC
+
+    def _index_file(self):
+        return self.file.with_name(self.file.name + '.idx')
+
     def delete(self):
         if isinstance(self.file, Path):
             self.file.unlink()
+            self._index_file().unlink(missing_ok=True)
             self.file = None
 
     def append(self, pos, value, dims=None):
@@ -122,28 +488,221 @@ class BufferList():
         if len(self._list) > 1000:
             self.flush()
 
+    def append_block(self, pos, values, dims=None, python=False):
+        """Append many items at once, `pos` is an (n, ndim) integer array.
+
+        Numeric `values` given as an array are written to the file as
+        columnar blocks directly, anything else goes through the pending
+        items like `append`.  With `python` true, the items of the array
+        stand for Python scalars.
+        """
+        pos = np.asarray(pos, dtype='<i8')
+        if dims is not None:
+            mask = np.all(pos[:, [i for i in range(pos.shape[1])
+                                  if i not in dims]] == 0,
+                          axis=1)
+            pos = pos[mask][:, list(dims)]
+            values = values[mask] if isinstance(
+                values, np.ndarray) else [v for v, m in zip(values, mask) if m]
+        if not len(pos):
+            return
+        lu, rd = tuple(pos.min(axis=0).tolist()), tuple(
+            (pos.max(axis=0) + 1).tolist())
+        self.lu = tuple([min(i, j) for i, j in zip(lu, self.lu)]) or lu
+        self.rd = tuple([max(i, j) for i, j in zip(rd, self.rd)]) or rd
+        if isinstance(values, np.ndarray):
+            if self.inner_shape is None:
+                self.inner_shape = values.shape[1:]
+            elif self.inner_shape != values.shape[1:]:
+                self.inner_shape = ()
+        if not (isinstance(self.file, Path) and isinstance(values, np.ndarray)
+                and values.dtype.kind in 'biufc'):
+            if python:
+                values = values.tolist()
+            with self._lock:
+                self._list.extend(zip(map(tuple, pos.tolist()), values))
+            if len(self._list) > 1000:
+                self.flush()
+            return
+        self.flush()
+        sig = values.dtype.str, values.shape[1:], python
+        blocks = ((pos[i:i + _STREAM_BLOCK_SIZE],
+                   _pack_block(sig, pos[i:i + _STREAM_BLOCK_SIZE],
+                               values[i:i + _STREAM_BLOCK_SIZE]))
+                  for i in range(0, len(pos), _STREAM_BLOCK_SIZE))
+        with self._lock:
+            self._write(zip(map(tuple, pos.tolist()), values), blocks)
+
+    def _columnar_chunks(self, size=None):
+        """Yield all items in the columnar format, as written by `flush`,
+        in pieces of about `size` bytes (`_EXPORT_CHUNK_SIZE` by default)."""
+        if size is None:
+            size = _EXPORT_CHUNK_SIZE
+        self.flush()
+        with self._lock:
+            buf = self._read_buffer()
+        if buf is not None and not self._list:
+            for i in range(0, len(buf), size):
+                yield bytes(buf[i:i + size])
+            return
+        pieces, n = [_MAGIC], len(_MAGIC)
+        for _, block in _pack_items(self.iter()):
+            pieces.append(block)
+            n += len(block)
+            if n >= size:
+                yield b''.join(pieces)
+                pieces, n = [], 0
+        if pieces:
+            yield b''.join(pieces)
+
+    def _read_buffer(self):
+        """Return the file content as a uint8 array, or None for dill streams.
+
+        Local files are memory mapped, so only the pages that are actually
+        touched will be read from disk.
+        """
+        if isinstance(self.file, tuple):
+            # members of exported records never change, read them once
+            if self._member is None:
+                self._member = (_read_zip_member(*self.file), )
+            return self._member[0]
+        if not isinstance(self.file, Path) or not self.file.exists():
+            return None
+        if self.file.stat().st_size < len(_MAGIC):
+            return None
+        buf = np.memmap(self.file, dtype=np.uint8, mode='r')
+        if bytes(buf[:len(_MAGIC)]) != _MAGIC:
+            return None
+        return buf
+
+    def _iter_dill_stream(self, f):
+        while True:
+            try:
+                pos, value = dill.load(f)
+                yield pos, value
+            except EOFError:
+                break
+
     def _iter_file(self):
-        if isinstance(self.file, Path) and self.file.exists():
+        with self._lock:
+            buf = self._read_buffer()
+        if buf is not None:
+            for kind, pos, values, python in _parse_blocks(buf):
+                if python:
+                    values = values.tolist()
+                elif kind == _NUMERIC:
+                    values = np.array(values)
+                for p, value in zip(pos.tolist(), values):
+                    yield tuple(p), value
+        elif isinstance(self.file, Path) and self.file.exists():
             with self._lock:
                 with open(self.file, 'rb') as f:
-                    while True:
-                        try:
-                            pos, value = dill.load(f)
-                            yield pos, value
-                        except EOFError:
-                            break
-        elif isinstance(
-                self.file, tuple) and len(self.file) == 2 and isinstance(
-                    self.file[0], str) and self.file[0].endswith('.zip'):
+                    yield from self._iter_dill_stream(f)
+        elif isinstance(self.file, tuple):
             f, name = self.file
             with zipfile.ZipFile(f, 'r') as z:
                 with z.open(name, 'r') as f:
-                    while True:
-                        try:
-                            pos, value = dill.load(f)
-                            yield pos, value
-                        except EOFError:
-                            break
+                    yield from self._iter_dill_stream(f)
+
+    def _load_index(self, buf):
+        """Return the block index matching `buf`, rebuilding it if stale."""
+        index = None
+        if isinstance(self.file, Path) and self._index_file().exists():
+            head = np.fromfile(self._index_file(), dtype=np.uint8)
+            if bytes(head[:len(_INDEX_MAGIC)]) == _INDEX_MAGIC:
+                dtype = _index_dtype(int(head[len(_INDEX_MAGIC)]))
+                body = head[len(_INDEX_MAGIC) + 1:]
+                body = body[:len(body) - len(body) % dtype.itemsize]
+                index = body.view(dtype)
+        if index is not None and len(index) and index['offset'][0] == len(
+                _MAGIC) and np.all(index['offset'][1:] == index['offset'][:-1] +
+                                   index['size'][:-1]) and index['offset'][
+                                       -1] + index['size'][-1] == len(buf):
+            return index
+
+        entries, offset = [], len(_MAGIC)
+        while offset + _BLOCK_HEAD.size <= len(buf):
+            size, _, _, pos, _, _ = _block_positions(buf, offset)
+            entries.append(_index_entry(offset, size, pos))
+            offset += size
+        if not entries:
+            return None
+        if len({e.dtype for e in entries}) != 1:
+            return None
+        index = np.concatenate(entries)
+        if isinstance(self.file, Path):
+            try:
+                with open(self._index_file(), 'wb') as f:
+                    f.write(_INDEX_MAGIC + bytes([index['lu'].shape[1]]))
+                    f.write(index.tobytes())
+            except OSError:
+                pass
+        return index
+
+    def _select_blocks(self, buf):
+        """Return the offsets of the blocks that may match `self._slice`."""
+        index = self._load_index(buf)
+        if index is None:
+            return None if len(buf) > len(_MAGIC) else []
+        mask = np.ones(len(index), dtype=bool)
+        if self._slice:
+            for k, s in enumerate(self._slice[:index['lu'].shape[1]]):
+                lo, hi = _slice_range(s)
+                mask &= (index['lu'][:, k] < hi) & (index['rd'][:, k] > lo)
+        return index['offset'][mask].tolist()
+
+    def _numeric_blocks(self):
+        """Return [(pos, values, python), ...] of the blocks that may match
+        the slice.
+
+        Only the blocks whose bounding box intersects `self._slice` are
+        read, the items still have to be filtered by the caller.  None is
+        returned if any item is not numeric or the inner shapes differ, in
+        which case the caller has to fall back to `iter`.
+        """
+        if self._data_id is not None:
+            return None
+        with self._lock:
+            buf = self._read_buffer()
+            items = list(self._list)
+            offsets = [] if buf is None else self._select_blocks(buf)
+        if offsets is None:
+            return None
+        if buf is None and isinstance(self.file, (Path, tuple)):
+            if isinstance(self.file, tuple) or self.file.exists():
+                return None
+        blocks = []
+        for offset in offsets:
+            _, kind, pos, values, python = _parse_block(buf, offset)
+            if kind != _NUMERIC:
+                return None
+            blocks.append((pos, values, python))
+        for sig, run in _split_runs(items):
+            if sig is None:
+                return None
+            blocks.append((np.asarray([p for p, _ in run], dtype=int),
+                           np.asarray([v for _, v in run],
+                                      dtype=sig[0]), sig[2]))
+        if len({values.shape[1:] for _, values, _ in blocks}) != 1:
+            return None
+        return blocks
+
+    def _items_array(self):
+        blocks = self._numeric_blocks()
+        if blocks is None:
+            pos, data = self.items()
+            return np.asarray(pos), np.asarray(data)
+        if len(blocks) == 1:
+            pos, data, _ = blocks[0]
+        else:
+            pos = np.concatenate([p for p, _, _ in blocks])
+            data = np.concatenate([v for _, v, _ in blocks])
+        if self._slice:
+            mask = _slice_mask(self._slice, pos)
+            pos, data = pos[mask], data[mask]
+        if self._slice and self.inner_shape:
+            data = data[(slice(None), ) + tuple(self._slice[pos.shape[1]:])]
+        return pos, data
 
     def iter(self):
         if self._data_id is None:
@@ -157,33 +716,115 @@ class BufferList():
                     else:
                         yield pos, value
         else:
-            server, record_id, key = self._data_id
-            with ZMQContextManager(zmq.DEALER,
-                                   connect=server,
-                                   socket=self._sock) as socket:
-                iter_id = b''
-                start = 0
-                try:
-                    while True:
-                        socket.send_pyobj({
-                            'method': 'bufferlist_iter',
-                            'record_id': record_id,
-                            'iter_id': iter_id,
-                            'key': key,
-                            'slice': self._slice,
-                            'start': start
-                        })
-                        iter_id, lst, finished = socket.recv_pyobj()
-                        start += len(lst)
-                        yield from lst
-                        if finished:
-                            break
-                finally:
-                    if iter_id:
+            for pos, values, python in self._stream():
+                if python:
+                    values = values.tolist()
+                for p, value in zip(pos.tolist(), values):
+                    yield tuple(p), value
+
+    def _iter_arrays(self):
+        """Yield (pos, values) blocks of the items matching `self._slice`.
+
+        `pos` is an (n, ndim) int array, `values` an ndarray for numeric
+        blocks and a list otherwise.
+        """
+        for pos, values, _ in self._iter_blocks():
+            yield pos, values
+
+    def _iter_blocks(self):
+        """Yield the blocks of `_iter_arrays` as (pos, values, python).
+
+        `python` tells that numeric `values` were appended as Python
+        scalars.  This is what the record server streams to remote
+        clients.
+        """
+        if self._data_id is not None:
+            yield from self._stream()
+            return
+        slice_tuple = self._slice
+        blocks = self._numeric_blocks()
+        if blocks is None:
+            it = self.iter()
+            while chunk := list(itertools.islice(it, _STREAM_BLOCK_SIZE)):
+                pos = np.asarray([p for p, _ in chunk], dtype=int)
+                yield pos.reshape(len(chunk), len(chunk[0][0])), [
+                    v for _, v in chunk
+                ], False
+            return
+        for pos, values, python in blocks:
+            if slice_tuple:
+                mask = _slice_mask(slice_tuple, pos)
+                pos, values = pos[mask], values[mask]
+                if self.inner_shape:
+                    values = values[(slice(None), ) +
+                                    tuple(slice_tuple[pos.shape[1]:])]
+            if len(pos):
+                yield pos, values, python
+
+    def _stream(self):
+        """Receive the blocks of a remote BufferList pushed by the server.
+
+        The server sends one multipart message per block (a pickled header,
+        then the raw position and value buffers) as long as it has credit.
+        The numpy arrays are built directly on the received frames.
+        """
+        server, record_id, key = self._data_id
+        stream_id = uuid.uuid4().bytes
+        with ZMQContextManager(zmq.DEALER, connect=server) as socket:
+            socket.send_pyobj({
+                'method': 'bufferlist_stream',
+                'record_id': record_id,
+                'stream_id': stream_id,
+                'key': key,
+                'slice': self._slice,
+                'credit': _STREAM_WINDOW
+            })
+            finished, received = False, 0
+            try:
+                while True:
+                    frames = socket.recv_multipart(copy=False)
+                    header = pickle.loads(frames[0].bytes)
+                    if not isinstance(header, dict):
+                        raise RuntimeError(
+                            f'bufferlist_stream failed: {header!r}')
+                    if header.get('end'):
+                        finished = True
+                        break
+                    pos = np.frombuffer(frames[1].buffer,
+                                        dtype='<i8').reshape(header['pos'])
+                    if 'dtype' in header:
+                        values = np.frombuffer(
+                            frames[2].buffer,
+                            dtype=header['dtype']).reshape(header['shape'])
+                    else:
+                        values = header['values']
+                    yield pos, values, header.get('python', False)
+                    received += 1
+                    if received >= _STREAM_WINDOW // 2:
                         socket.send_pyobj({
-                            'method': 'bufferlist_iter_exit',
-                            'iter_id': iter_id
+                            'method': 'bufferlist_stream_credit',
+                            'stream_id': stream_id,
+                            'credit': received
                         })
+                        received = 0
+            finally:
+                if not finished:
+                    socket.send_pyobj({
+                        'method': 'bufferlist_stream_exit',
+                        'stream_id': stream_id
+                    })
+
+    def _fetch(self, method, **kwds):
+        """Let the record server reduce a remote BufferList to an array."""
+        server, record_id, key = self._data_id
+        with ZMQContextManager(zmq.DEALER, connect=server) as socket:
+            socket.send_pyobj({
+                'method': method,
+                'record_id': record_id,
+                'key': key,
+                **kwds
+            })
+            return _recv_array(socket)
 
     def value(self):
         d = []
@@ -205,7 +846,9 @@ class BufferList():
         return p, d
 
     def toarray(self):
-        pos, data = self.items()
+        if self._data_id is not None:
+            return self._fetch('record_toarray', slice=self._slice)
+        pos, data = self._items_array()
         if self._slice:
             pos = np.asarray(pos)
             lu = tuple(np.min(pos, axis=0))
@@ -222,9 +865,8 @@ class BufferList():
         else:
             shape = tuple([i - j for i, j in zip(self.rd, self.lu)])
             pos = np.asarray(pos) - np.asarray(self.lu)
-        data = np.asarray(data)
         inner_shape = data.shape[1:]
-        x = np.full(shape + inner_shape, np.nan, dtype=data[0].dtype)
+        x = np.full(shape + inner_shape, np.nan, dtype=data.dtype)
         x.__setitem__(tuple(pos.T), data)
         return x
 
@@ -297,10 +939,12 @@ class BufferList():
 
     def __getitem__(self, slice_tuple: slice | EllipsisType
                     | tuple[slice | int | EllipsisType, ...]):
-        self._slice, contract, reversed = self._full_slice(slice_tuple)
-        ret = self.toarray()
+        if self._data_id is not None:
+            return self._fetch('record_slice', slice=slice_tuple)
+        full, contract, reversed = self._full_slice(slice_tuple)
+        ret = self.view(full).toarray()
         slices = []
-        for i, s in enumerate(self._slice):
+        for i, s in enumerate(full):
             if i in contract:
                 slices.append(0)
             elif isinstance(s, slice):
@@ -308,9 +952,19 @@ class BufferList():
                     slices.append(slice(None, None, -1))
                 else:
                     slices.append(slice(None, None, 1))
-        ret = ret.__getitem__(tuple(slices))
-        self._slice = None
-        return ret
+        return ret.__getitem__(tuple(slices))
+
+
+def _merge_checkpoint(last: dict | None, state: dict) -> dict:
+    """The checkpoint `state` with the optimizer histories of `last`."""
+    if 'told' not in state:
+        return state
+    history = {} if last is None else last.get('optimizers', {})
+    for name, points in state['told'].items():
+        history.setdefault(name, []).extend(points)
+    return {k: v for k, v in state.items() if k != 'told'} | {
+        'optimizers': history
+    }
 
 
 class Record():
@@ -322,6 +976,11 @@ class Record():
         self._items = {}
         self._pos = []
         self._last_vars = set()
+        self._plans = {}
+        self._dirty = True
+        self._extents = {}
+        self.last_checkpoint = None
+        self._checkpoint_extents = None
         self._file = None
         self._sock = None
 
@@ -343,14 +1002,22 @@ class Record():
             'id': self.id,
             'description': self.description,
             '_items': self._items,
+            '_pos': self._pos,
+            'last_checkpoint': self.last_checkpoint,
+            '_checkpoint_extents': self._checkpoint_extents,
         }
 
     def __setstate__(self, state: dict):
         self.id = state['id']
         self.description = state['description']
         self._items = state['_items']
-        self._pos = []
+        self._pos = state.get('_pos', [])
         self._last_vars = set()
+        self._plans = {}
+        self._dirty = False
+        self._extents = self._buffer_extents()
+        self.last_checkpoint = state.get('last_checkpoint', None)
+        self._checkpoint_extents = state.get('_checkpoint_extents', None)
         self.database = None
         self._file = None
         self._sock = None
@@ -424,7 +1091,18 @@ class Record():
         return self.get(key, buffer_to_array=True)
 
     def get(self, key, default=_not_given, buffer_to_array=False):
-        if self.is_remote_record():
+        if self.is_remote_record() and buffer_to_array:
+            with ZMQContextManager(zmq.DEALER,
+                                   connect=self.database,
+                                   socket=self._sock) as socket:
+                socket.send_pyobj({
+                    'method': 'record_toarray',
+                    'record_id': self.id,
+                    'key': key,
+                    'slice': None
+                })
+                return _recv_array(socket)
+        elif self.is_remote_record():
             with ZMQContextManager(zmq.DEALER,
                                    connect=self.database,
                                    socket=self._sock) as socket:
@@ -437,14 +1115,7 @@ class Record():
                 if isinstance(ret, BufferList):
                     ret._data_id = self.database, self.id, key
                     ret._sock = socket
-                    if buffer_to_array:
-                        return ret.toarray()
-                    else:
-                        return ret
-                elif isinstance(ret, Space) and buffer_to_array:
-                    return ret.toarray()
-                else:
-                    return ret
+                return ret
         else:
             if default is _not_given:
                 d = self._items.get(key)
@@ -482,15 +1153,12 @@ class Record():
 
     def append(self, level, step, position, variables):
         if level < 0:
+            # values sent with the end of the scan, e.g. `__limits__`
+            self._items.update(variables)
+            self._dirty = True
             self.flush()
             return
 
-        for key in set(variables.keys()) - self._last_vars:
-            if key not in self.axis:
-                self.axis[key] = tuple(range(level + 1))
-
-        self._last_vars = set(variables.keys())
-
         if level >= len(self._pos):
             l = level + 1 - len(self._pos)
             self._pos.extend(([0] * (l - 1)) + [position])
@@ -504,6 +1172,67 @@ class Record():
             pos = tuple(self._pos)
             self._pos[-1] += 1
 
+        key = (level, tuple(variables))
+        try:
+            getter, buffers = self._plans[key]
+        except KeyError:
+            self._append_items(level, pos, variables)
+            self._plans[key] = self._compile_append(level, key[1])
+            return
+        for (buffer, dims), value in zip(buffers, getter(variables)):
+            buffer.append(pos, value, dims)
+
+    def append_level(self, level, n, arrays, variables):
+        """Append the `n` steps of the innermost `level` at once.
+
+        Same as appending `variables` updated with row `i` of `arrays` for
+        every step `i`, but the buffers of `level` get the steps after the
+        first as columnar blocks.
+        """
+        if not n:
+            return
+        self.append(level, 0, 0,
+                    variables | {key: a[0]
+                                 for key, a in arrays.items()})
+        if n == 1:
+            return
+        pos = np.empty((n - 1, len(self._pos)), dtype='<i8')
+        pos[:, :-1] = self._pos[:-1]
+        pos[:, -1] = np.arange(1, n)
+        for key in self._level_buffers(level, {**variables, **arrays}):
+            python = False
+            if key in arrays:
+                values = np.asarray(arrays[key][1:n])
+            elif (sig := _numeric_signature(variables[key])) is not None:
+                values = np.repeat(np.asarray(variables[key])[None], n - 1, 0)
+                python = sig[2]
+            else:
+                values = [variables[key]] * (n - 1)
+            self._items[key].append_block(pos, values, self.axis[key], python)
+        self._pos[-1] = n - 1
+
+    def _level_buffers(self, level, keys):
+        """Names in `keys` of the buffers whose last axis is `level`."""
+        return [
+            key for key in keys
+            if isinstance(self._items.get(key), BufferList)
+            and self.axis[key] and self.axis[key][-1] == level
+        ]
+
+    def _compile_append(self, level, keys):
+        """Buffers to append to for the variables `keys` at `level`."""
+        names = self._level_buffers(level, keys)
+        return tuple_getter(names), [(self._items[key], self.axis[key])
+                                     for key in names]
+
+    def _append_items(self, level, pos, variables):
+        self._dirty = True
+        for key in set(variables.keys()) - self._last_vars:
+            if key not in self.axis:
+                self.axis[key] = tuple(range(level + 1))
+
+        self._last_vars = set(variables.keys())
+
         for key, value in variables.items():
             if self.axis[key] == ():
                 if key not in self._items:
@@ -525,6 +1254,12 @@ class Record():
                     self._items[key].append(pos, value, self.axis[key])
 
     def flush(self):
+        """Write the buffers and the changes since the last flush.
+
+        The record itself is only dumped again when its keys changed,
+        otherwise the new extents of the buffers are appended to the
+        journal next to the record file.
+        """
         if self.is_remote_record() or self.is_cache_record():
             return
 
@@ -532,8 +1267,128 @@ class Record():
             if isinstance(value, BufferList):
                 value.flush()
 
-        with open(self._file, 'wb') as f:
-            dill.dump(self, f)
+        if self._dirty or not self._file.exists():
+            tmp = self._file.with_name(self._file.name + '.tmp')
+            with open(tmp, 'wb') as f:
+                dill.dump(self, f)
+            os.replace(tmp, self._file)
+            self._journal_file().unlink(missing_ok=True)
+            self._dirty = False
+            self._extents = self._buffer_extents()
+            return
+
+        extents = self._buffer_extents()
+        changed = {
+            key: extent
+            for key, extent in extents.items()
+            if self._extents.get(key) != extent
+        }
+        if changed:
+            self._write_journal({'extents': changed, 'pos': self._pos})
+            self._extents = extents
+
+    def checkpoint(self, state: dict):
+        """Flush and journal the state a scan can be resumed from.
+
+        The optimizer points under `told` in `state` are those told since
+        the previous checkpoint, they are added to the histories kept in
+        `last_checkpoint['optimizers']`.
+        """
+        if self.is_remote_record() or self.is_cache_record():
+            self.last_checkpoint = _merge_checkpoint(self.last_checkpoint,
+                                                     state)
+            return
+        self.flush()
+        extents = {
+            'pos': list(self._pos),
+            'buffers': {
+                key: (value._size(), value.lu, value.rd, value.inner_shape)
+                for key, value in self._items.items()
+                if isinstance(value, BufferList)
+            }
+        }
+        self._write_journal({
+            'pos': self._pos,
+            'checkpoint': state,
+            'extents_at_checkpoint': extents
+        })
+        self.last_checkpoint = _merge_checkpoint(self.last_checkpoint, state)
+        self._checkpoint_extents = extents
+
+    def rollback(self):
+        """Cut the buffers back to what they held at the last checkpoint.
+
+        The steps after it are run again by a resumed scan, keeping them
+        would give their positions twice. Buffers created after the
+        checkpoint are removed.
+        """
+        extents = self._checkpoint_extents
+        if extents is None or not self.is_local_record():
+            return
+        for key, value in list(self._items.items()):
+            if not isinstance(value, BufferList):
+                continue
+            try:
+                size, value.lu, value.rd, value.inner_shape = extents[
+                    'buffers'][key]
+            except KeyError:
+                value.truncate(0)
+                del self._items[key]
+                continue
+            value.truncate(size)
+        self._pos = list(extents['pos'])
+        self._plans.clear()
+        self._last_vars = set()
+        self._dirty = True
+        self.flush()
+
+    def _buffer_extents(self):
+        return {
+            key: (value.lu, value.rd, value.inner_shape)
+            for key, value in self._items.items()
+            if isinstance(value, BufferList)
+        }
+
+    def _journal_file(self):
+        return self._file.with_name(self._file.name + '.journal')
+
+    def _write_journal(self, entry):
+        with open(self._journal_file(), 'ab') as f:
+            f.write(dill.dumps(entry))
+
+    def reopen(self, file: Path, database: Path):
+        """Attach a record loaded from `file` to be appended to again.
+
+        The journal written since the file was dumped is applied; an entry
+        cut short by a crash ends the replay.
+        """
+        self._file = file
+        self.database = database
+        for value in self._items.values():
+            if isinstance(value, BufferList) and isinstance(value.file, str):
+                value.file = file.parent.parent.parent.parent / value.file
+        try:
+            f = open(self._journal_file(), 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            while True:
+                try:
+                    entry = dill.load(f)
+                except Exception:
+                    break
+                for key, (lu, rd, inner_shape) in entry.get('extents',
+                                                            {}).items():
+                    buffer = self._items[key]
+                    buffer.lu, buffer.rd = lu, rd
+                    buffer.inner_shape = inner_shape
+                self._pos = list(entry.get('pos', self._pos))
+                if 'checkpoint' in entry:
+                    self.last_checkpoint = _merge_checkpoint(
+                        self.last_checkpoint, entry['checkpoint'])
+                    self._checkpoint_extents = entry.get(
+                        'extents_at_checkpoint')
+        self._extents = self._buffer_extents()
 
     def delete(self):
         if self.is_remote_record():
@@ -549,26 +1404,64 @@ class Record():
                 if isinstance(value, BufferList):
                     value.delete()
             self._file.unlink()
+            self._journal_file().unlink(missing_ok=True)
+
+    def export(self,
+               file,
+               codec: str | None = 'zlib',
+               max_workers: int | None = None):
+        """Export the record to a zip file.
+
+        Every BufferList becomes a member in the columnar format, stored
+        as it is if `codec` is None, or compressed with one of `CODECS`.
+        Members are written in pieces, never held in memory as a whole.
+        The chunks of a member are compressed in parallel by a pool of
+        `max_workers` threads.
+        """
+        if codec is not None and codec not in CODECS:
+            raise ValueError(f'unknown codec {codec!r}, '
+                             f'choose one of {sorted(CODECS)} or None.')
+        if max_workers is None:
+            max_workers = min(8, os.cpu_count() or 1)
+
+        def compress(chunk):
+            chunk = CODECS[codec][0](chunk)
+            return _CHUNK_HEAD.pack(len(chunk)) + chunk
 
-    def export(self, file):
         with zipfile.ZipFile(file,
                              'w',
                              compression=zipfile.ZIP_DEFLATED,
-                             compresslevel=9) as z:
+                             compresslevel=6) as z, ThreadPoolExecutor(
+                                 max_workers=max_workers) as pool:
             items = {}
             for key in self.keys():
                 value = self.get(key)
-                if isinstance(value, BufferList):
-                    v = BufferList()
-                    v.lu = value.lu
-                    v.rd = value.rd
-                    v.inner_shape = value.inner_shape
-                    items[key] = v
-                    with z.open(f'{key}.buf', 'w') as f:
-                        for pos, data in value.iter():
-                            dill.dump((pos, data), f)
-                else:
+                if not isinstance(value, BufferList):
                     items[key] = value
+                    continue
+                name = f'{key}.buf'
+                if codec is not None:
+                    name = f'{name}.{codec}'
+                v = BufferList(name)
+                v.lu = value.lu
+                v.rd = value.rd
+                v.inner_shape = value.inner_shape
+                items[key] = v
+                with z.open(zipfile.ZipInfo(name), 'w',
+                            force_zip64=True) as f:
+                    if codec is None:
+                        for chunk in value._columnar_chunks():
+                            f.write(chunk)
+                        continue
+                    f.write(_CHUNKED_MAGIC)
+                    pending = deque()
+                    for chunk in value._columnar_chunks():
+                        pending.append(pool.submit(compress, chunk))
+                        # bound the chunks held in memory
+                        while len(pending) > 2 * max_workers:
+                            f.write(pending.popleft().result())
+                    while pending:
+                        f.write(pending.popleft().result())
             with z.open('record.pkl', 'w') as f:
                 self.description['entry']['scripts'] = self.scripts()
                 dill.dump((self.description, items), f)
@@ -577,6 +1470,12 @@ class Record():
 
     @classmethod
     def load(cls, file: str):
+        """Load an exported record.
+
+        Only the description is read here, each BufferList reads its member
+        when it is accessed.
+        """
+        file = str(file)
         with zipfile.ZipFile(file, 'r') as z:
             with z.open('record.pkl', 'r') as f:
                 description, items = dill.load(f)
@@ -586,7 +1485,9 @@ class Record():
             record = cls(None, None, description)
             for key, value in items.items():
                 if isinstance(value, BufferList):
-                    value.file = file, f'{key}.buf'
+                    name = value.file if isinstance(value.file,
+                                                    str) else f'{key}.buf'
+                    value.file = file, name
                 record._items[key] = value
         return record
 
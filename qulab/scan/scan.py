@@ -1,15 +1,17 @@
 import asyncio
 import contextlib
 import copy
+import hashlib
 import inspect
 import itertools
 import lzma
 import os
 import pickle
+import random
 import re
 import sys
+import time
 import uuid
-from concurrent.futures import ProcessPoolExecutor
 from graphlib import TopologicalSorter
 from pathlib import Path
 from typing import Any, Awaitable, Callable, Iterable
@@ -20,12 +22,15 @@ import zmq
 from qlispreg.expression import Env, Expression, Symbol
 
 from ..sys.rpc.zmq_socket import ZMQContextManager
+from .limit import AdaptiveLimit
 from .optimize import NgOptimizer
+from .process import FunctionPool
 from .record import Record
 from .server import default_record_port
 from .space import Optimizer, OptimizeSpace, Space
-from .utils import (async_zip, call_function, dump_dict, dump_globals,
-                    get_system_info, yapf_reformat)
+from .utils import (FunctionCall, async_zip, call_function, dump_dict,
+                    dump_globals, get_system_info, tuple_getter,
+                    yapf_reformat)
 
 try:
     from tqdm.notebook import tqdm
@@ -47,6 +52,16 @@ __process_uuid = uuid.uuid1()
 __task_counter = itertools.count()
 __notebook_id = None
 
+DRAIN_TIMEOUT = 10.0
+PLAN_CACHE_SIZE = 256
+PLAN_CACHE_FILES = 1024
+# compiled plans are also kept on disk only if QULAB_PLAN_CACHE is set
+if os.getenv('QULAB_PLAN_CACHE'):
+    plan_cache_path: Path | None = Path(os.getenv('QULAB_PLAN_CACHE'))
+else:
+    plan_cache_path = None
+_compiled_plans = {}
+
 if os.getenv('QULAB_SERVER'):
     default_server = os.getenv('QULAB_SERVER')
 else:
@@ -146,11 +161,6 @@ def _get_depends(func: Callable):
     return args
 
 
-def _run_function_in_process(buf):
-    func, args, kwds = dill.loads(buf)
-    return func(*args, **kwds)
-
-
 async def update_variables(variables: dict[str, Any], updates: dict[str, Any],
                            setters: dict[str, Callable]):
     coros = []
@@ -164,6 +174,48 @@ async def update_variables(variables: dict[str, Any], updates: dict[str, Any],
         await asyncio.gather(*coros)
 
 
+def _ask(opt, n: int) -> list:
+    if n == 1:
+        return [opt.ask()]
+    return list(opt.ask(n))
+
+
+async def _tell(opt, opt_cfg: Optimizer, told: list, history: list):
+    """Tell the points evaluated since the last ask, awaiting them together."""
+    if not told:
+        return
+    args = [x for x, _ in told]
+    funs = await asyncio.gather(*[_resolve(fun) for _, fun in told])
+    told.clear()
+    if not opt_cfg.minimize:
+        funs = [-fun for fun in funs]
+    if len(args) == 1:
+        opt.tell(args[0], funs[0])
+    else:
+        opt.tell(args, funs)
+    history.extend(zip(args, funs))
+
+
+async def _resolve(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+async def _askip(aiter, n):
+    async for i, x in async_zip(itertools.count(), aiter):
+        if i >= n:
+            yield x
+
+
+def _skip(iterable, n):
+    if n == 0:
+        return iterable
+    if hasattr(iterable, '__aiter__'):
+        return _askip(iterable, n)
+    return itertools.islice(iterable, n, None)
+
+
 async def _iter_level(variables,
                       iters: list[tuple[str, Iterable | Expression | Callable
                                         | OptimizeSpace]],
@@ -171,7 +223,22 @@ async def _iter_level(variables,
                       functions: dict[str, Callable | Expression],
                       optimizers: dict[str, Optimizer],
                       setters: dict[str, Callable] = {},
-                      getters: dict[str, Callable] = {}):
+                      getters: dict[str, Callable] = {},
+                      plan: tuple[list, list] | None = None,
+                      state: dict | None = None):
+    """Iterate over the points of a level.
+
+    `state` carries the position to start from and the points told to the
+    optimizers so far, which are told again to the new optimizers. It is
+    updated as the optimizers are told.
+    """
+    if state is None:
+        state = {}
+    start = state.get('position', 0)
+    history = state.setdefault('optimizers', {})
+    if plan is None:
+        plan = (_compile_plan(order, functions),
+                _compile_plan(order, getters))
     iters_d = {}
     env = Env()
     env.variables = variables
@@ -191,28 +258,41 @@ async def _iter_level(variables,
             iters_d[name] = iter
 
     maxiter = 0xffffffff
+    batch_size = 0xffffffff
     for name, opt in opts.items():
         opt_cfg = optimizers[name]
         maxiter = min(maxiter, opt_cfg.maxiter)
+        batch_size = min(batch_size, getattr(opt_cfg, 'batch_size', 1))
 
-    async for args in async_zip(*iters_d.values(), range(maxiter)):
+    asked = {name: [] for name in opts}
+    told = {name: [] for name in opts}
+    for name, opt in opts.items():
+        if history.get(name):
+            opt.tell([x for x, _ in history[name]],
+                     [y for _, y in history[name]])
+
+    async for args in async_zip(*[_skip(v, start) for v in iters_d.values()],
+                                range(start, maxiter)):
         await update_variables(variables, dict(zip(iters_d.keys(), args[:-1])),
                                setters)
         for name, opt in opts.items():
-            args = opt.ask()
+            if not asked[name]:
+                asked[name] = _ask(opt, min(batch_size, maxiter - args[-1]))
             opt_cfg = optimizers[name]
-            await update_variables(variables, {
-                n: v
-                for n, v in zip(opt_cfg.dimensions.keys(), args)
-            }, setters)
+            await update_variables(
+                variables, {
+                    n: v
+                    for n, v in zip(opt_cfg.dimensions.keys(),
+                                    asked[name].pop(0))
+                }, setters)
 
-        await update_variables(
-            variables, await call_many_functions(order, functions, variables),
-            setters)
+        await update_variables(variables, await
+                               _run_plan(plan[0], variables, functions),
+                               setters)
 
         yield variables
 
-        variables.update(await call_many_functions(order, getters, variables))
+        variables.update(await _run_plan(plan[1], variables, getters))
 
         if opts:
             for key in list(variables.keys()):
@@ -221,17 +301,17 @@ async def _iter_level(variables,
 
         for name, opt in opts.items():
             opt_cfg = optimizers[name]
-            args = [variables[n] for n in opt_cfg.dimensions.keys()]
-
             if name not in variables:
                 raise ValueError(f'{name} not in variables.')
-            fun = variables[name]
-            if inspect.isawaitable(fun):
-                fun = await fun
-            if opt_cfg.minimize:
-                opt.tell(args, fun)
-            else:
-                opt.tell(args, -fun)
+            told[name].append(([variables[n] for n in opt_cfg.dimensions],
+                               variables[name]))
+            if not asked[name]:
+                await _tell(opt, opt_cfg, told[name],
+                            history.setdefault(name, []))
+
+    for name, opt in opts.items():
+        await _tell(opt, optimizers[name], told[name],
+                    history.setdefault(name, []))
 
     if opts:
         for name, opt in opts.items():
@@ -245,13 +325,124 @@ async def _iter_level(variables,
 
         yield variables
 
-        variables.update(await call_many_functions(order, getters, variables))
+        variables.update(await _run_plan(plan[1], variables, getters))
 
         for key in list(variables.keys()):
             if key.startswith('*') or ',' in key:
                 await _unpack(key, variables)
 
 
+def _vectorize_level(variables,
+                     iters: list[tuple[str, Iterable | Expression | Callable
+                                       | OptimizeSpace]],
+                     order: list[list[str]],
+                     functions: dict[str, Callable | Expression],
+                     setters: dict[str, Callable] = {},
+                     getters: dict[str, Callable] = {},
+                     late: Iterable[str] = ()):
+    """Evaluate a whole level as arrays in one shot.
+
+    Only possible if the level iterates over 1-D numeric arrays and all its
+    dependents are Expressions of them and of scalar variables, with no
+    setters or getters involved.  Names in `late` are left to the caller
+    to resolve once for the last step, and no Expression may depend on
+    them.  Returns (n, {name: array}) or None.
+    """
+    names = [name for name, _ in iters] + [n for group in order for n in group]
+    if any(name in setters or name in getters for name in names):
+        return None
+    env = Env()
+    env.variables = variables
+    arrays = {}
+    try:
+        for name, iter in iters:
+            if isinstance(iter, Expression):
+                iter = iter.eval(env)
+            elif isinstance(iter, Space):
+                iter = iter.toarray()
+            elif not isinstance(iter, (np.ndarray, list, tuple, range)):
+                return None
+            iter = np.asarray(iter)
+            if iter.ndim != 1 or iter.dtype.kind not in 'biufc':
+                return None
+            arrays[name] = iter
+        if not arrays:
+            return None
+        n = min(len(a) for a in arrays.values())
+        arrays = {name: a[:n] for name, a in arrays.items()}
+        for group in order:
+            for name in group:
+                # like `_compile_plan`, names without a function are skipped
+                if name in arrays or name in late or name not in functions:
+                    continue
+                func = functions[name]
+                if not isinstance(func, Expression):
+                    return None
+                env = Env()
+                for symbol in func.symbols():
+                    if symbol in late:
+                        return None
+                    elif symbol in arrays:
+                        env.variables[symbol] = arrays[symbol]
+                    elif symbol in variables and np.ndim(
+                            variables[symbol]) == 0 and not inspect.isawaitable(
+                                variables[symbol]):
+                        env.variables[symbol] = variables[symbol]
+                    else:
+                        return None
+                value = np.asarray(func.eval(env))
+                if value.shape == ():
+                    value = np.full(n, value)
+                elif value.shape != (n, ):
+                    return None
+                arrays[name] = value
+    except Exception:
+        return None
+    return n, arrays
+
+
+def _compile_plan(order: list[list[str]],
+                  functions: dict[str, Callable | Expression],
+                  late: Iterable[str] = ()) -> list[list[tuple]]:
+    """Compile the functions of `order` into groups of `FunctionCall`.
+
+    Names in `late` are resolved when the plan runs.
+    """
+    plan = []
+    for group in order:
+        calls = [(name, FunctionCall(functions[name])) for name in group
+                 if name in functions]
+        calls.extend((name, None) for name in group
+                     if name in late and name not in functions)
+        if calls:
+            plan.append(calls)
+    return plan
+
+
+async def _run_plan(plan: list[list[tuple]],
+                    variables: dict[str, Any],
+                    late: dict[str, Callable] = {}) -> dict[str, Any]:
+    """Run a plan made by `_compile_plan`, same as `call_many_functions`."""
+    ret = {}
+    for group in plan:
+        waited, coros = [], []
+        for name, call in group:
+            if call is not None:
+                value = call(variables, ret)
+            elif name in late:
+                value = call_function(late[name], variables | ret)
+            else:
+                continue
+            if inspect.isawaitable(value):
+                waited.append(name)
+                coros.append(value)
+            else:
+                ret[name] = value
+        if coros:
+            ret.update(zip(waited, await asyncio.gather(*coros)))
+    return ret
+
+
 async def call_many_functions(order: list[list[str]],
                               functions: dict[str, Callable],
                               variables: dict[str, Any]) -> dict[str, Any]:
@@ -349,6 +540,12 @@ class Scan():
                  max_workers: int = 4,
                  max_promise: int = 100,
                  max_message: int = 1000,
+                 batch_size: int = 1,
+                 batch_interval: float = 0.05,
+                 adaptive: bool = True,
+                 checkpoint: bool = False,
+                 checkpoint_steps: int = 100,
+                 checkpoint_interval: float = 10.0,
                  config: dict | None = None,
                  mixin=None):
         self.id = task_uuid()
@@ -389,16 +586,28 @@ class Scan():
         self._main_task = None
         self._background_tasks = ()
         self._sock = None
-        self._sem = asyncio.Semaphore(max_promise + 1)
         self._bar: dict[int, tqdm] = {}
         self._hide_pattern_re = re.compile('|'.join(self.description['hiden']))
-        self._msg_queue = asyncio.Queue(max_message)
+        self._emit_plans = {}
+        self._msg_queue = asyncio.Queue()
         self._prm_queue = asyncio.Queue()
         self._single_step = True
         self._max_workers = max_workers
         self._max_promise = max_promise
         self._max_message = max_message
-        self._executors = ProcessPoolExecutor(max_workers=max_workers)
+        self._adaptive = adaptive
+        self._make_limits()
+        self._batch_size = batch_size
+        self._batch_interval = batch_interval
+        self._appends = []
+        self._appends_time = 0
+        self._checkpoint_enabled = checkpoint
+        self._checkpoint_steps = checkpoint_steps
+        self._checkpoint_interval = checkpoint_interval
+        self._checkpoint_state = None
+        self._resume_id = None
+        self._resume_state = None
+        self._executors = FunctionPool(max_workers=max_workers)
 
     def __del__(self):
         try:
@@ -415,8 +624,12 @@ class Scan():
         del state['_bar']
         del state['_msg_queue']
         del state['_prm_queue']
-        del state['_sem']
+        del state['_promise_limit']
+        del state['_message_limit']
         del state['_executors']
+        del state['_appends']
+        del state['_checkpoint_state']
+        del state['_emit_plans']
         return state
 
     def __setstate__(self, state: dict) -> None:
@@ -427,9 +640,12 @@ class Scan():
         self._background_tasks = ()
         self._bar = {}
         self._prm_queue = asyncio.Queue()
-        self._msg_queue = asyncio.Queue(self._max_message)
-        self._sem = asyncio.Semaphore(self._max_promise + 1)
-        self._executors = ProcessPoolExecutor(max_workers=self._max_workers)
+        self._msg_queue = asyncio.Queue()
+        self._make_limits()
+        self._emit_plans = {}
+        self._executors = FunctionPool(max_workers=self._max_workers)
+        self._appends = []
+        self._appends_time = 0
         for opt in self.description['optimizers'].values():
             opt.scanner = self
 
@@ -443,6 +659,25 @@ class Scan():
         except:
             pass
 
+    def _make_limits(self):
+        # start from the configured sizes, adapt within [1/10, 4] of them
+        self._promise_limit = AdaptiveLimit(self._max_promise + 1,
+                                            max(1, self._max_promise // 10),
+                                            4 * self._max_promise,
+                                            adaptive=self._adaptive)
+        self._message_limit = AdaptiveLimit(self._max_message,
+                                            max(1, self._max_message // 10),
+                                            4 * self._max_message,
+                                            adaptive=self._adaptive)
+
+    @property
+    def limits(self) -> dict[str, dict[str, np.ndarray]]:
+        """Time series of the promise and message limits."""
+        return {
+            'promise': self._promise_limit.timeseries(),
+            'message': self._message_limit.timeseries()
+        }
+
     @property
     def current_level(self):
         return self._current_level
@@ -451,8 +686,99 @@ class Scan():
     def variables(self) -> dict[str, Any]:
         return self._variables
 
+    def _emit_plan(self, keys: tuple[str, ...]):
+        """Names to unpack and to emit, and a getter of the emitted values."""
+        try:
+            return self._emit_plans[keys]
+        except KeyError:
+            pass
+        unpack = [k for k in keys if k.startswith('*') or ',' in k]
+        names = tuple(k for k in keys if not self.hiden(k))
+        plan = self._emit_plans[keys] = unpack, names, tuple_getter(names)
+        return plan
+
     async def _emit(self, current_level, step, position, variables: dict[str,
                                                                          Any]):
+        unpack, names, getter = self._emit_plan(tuple(variables))
+        if unpack:
+            for key in unpack:
+                await _unpack(key, variables)
+            _, names, getter = self._emit_plan(tuple(variables))
+        values = getter(variables)
+        for value in values:
+            if inspect.isawaitable(value):
+                values = [(await v) if inspect.isawaitable(v) else v
+                          for v in values]
+                break
+
+        if self.record is None:
+            self.record = await self.create_record()
+        variables = dict(zip(names, values))
+        if current_level < 0 and self._adaptive:
+            variables['__limits__'] = self.limits
+        if self._sock is not None and self._batch_size > 1:
+            if not self._appends:
+                self._appends_time = time.monotonic()
+            self._appends.append((current_level, step, position, variables))
+            if (current_level < 0 or len(self._appends) >= self._batch_size
+                    or time.monotonic() - self._appends_time
+                    >= self._batch_interval):
+                await self._flush_appends()
+        elif self._sock is not None:
+            await self._sock.send_pyobj({
+                'task': self.id,
+                'method': 'record_append',
+                'record_id': self.record.id,
+                'level': current_level,
+                'step': step,
+                'position': position,
+                'variables': variables
+            })
+        else:
+            self.record.append(current_level, step, position, variables)
+
+    def _checkpointing(self) -> bool:
+        """Whether the steps of the outermost level are checkpointed."""
+        return self._checkpoint_enabled or self._resume_id is not None
+
+    async def _checkpoint(self, state: dict):
+        if self.record is None:
+            return
+        if self._sock is not None and self._batch_size > 1:
+            # sent with the next batch of appends
+            told = {} if self._checkpoint_state is None else {
+                name: list(points)
+                for name, points in self._checkpoint_state['told'].items()
+            }
+            for name, points in state['told'].items():
+                told.setdefault(name, []).extend(points)
+            self._checkpoint_state = state | {'told': told}
+        elif self._sock is not None:
+            await self._sock.send_pyobj({
+                'task': self.id,
+                'method': 'record_checkpoint',
+                'record_id': self.record.id,
+                'state': state
+            })
+        else:
+            self.record.checkpoint(state)
+
+    async def _flush_appends(self):
+        if not self._appends and self._checkpoint_state is None:
+            return
+        appends, self._appends = self._appends, []
+        msg = {
+            'task': self.id,
+            'method': 'record_append_many',
+            'record_id': self.record.id,
+            'appends': appends
+        }
+        if self._checkpoint_state is not None:
+            msg['checkpoint'], self._checkpoint_state = (
+                self._checkpoint_state, None)
+        await self._sock.send_pyobj(msg)
+
+    async def _emit_level(self, current_level, n, arrays, variables):
         for key, value in list(variables.items()):
             if key.startswith('*') or ',' in key:
                 await _unpack(key, variables)
@@ -461,33 +787,45 @@ class Scan():
 
         if self.record is None:
             self.record = await self.create_record()
+        base = {
+            k: v
+            for k, v in variables.items()
+            if not self.hiden(k) and k not in arrays
+        }
+        arrays = {k: a for k, a in arrays.items() if not self.hiden(k)}
         if self._sock is not None:
+            await self._flush_appends()
             await self._sock.send_pyobj({
                 'task': self.id,
-                'method': 'record_append',
+                'method': 'record_append_level',
                 'record_id': self.record.id,
                 'level': current_level,
-                'step': step,
-                'position': position,
-                'variables': {
-                    k: v
-                    for k, v in variables.items() if not self.hiden(k)
-                }
+                'n': n,
+                'arrays': arrays,
+                'variables': base
             })
         else:
-            self.record.append(current_level, step, position, {
-                k: v
-                for k, v in variables.items() if not self.hiden(k)
-            })
+            self.record.append_level(current_level, n, arrays, base)
+
+    async def emit_level(self, current_level, n, arrays,
+                         variables: dict[str, Any]):
+        """Emit a whole level evaluated by `_vectorize_level`."""
+        await self._put_msg(
+            self._emit_level(current_level, n, arrays, variables.copy()))
 
     async def emit(self, current_level, step, position, variables: dict[str,
                                                                         Any]):
-        await self._msg_queue.put(
+        await self._put_msg(
             self._emit(current_level, step, position, variables.copy()))
 
+    async def _put_msg(self, coro):
+        await self._message_limit.acquire()
+        self._msg_queue.put_nowait((time.monotonic(), coro))
+
     def hide(self, name: str):
         self.description['hiden'].append(name)
         self._hide_pattern_re = re.compile('|'.join(self.description['hiden']))
+        self._emit_plans = {}
 
     def hiden(self, name: str) -> bool:
         return bool(self._hide_pattern_re.match(name)) or name.startswith(
@@ -662,14 +1000,18 @@ class Scan():
                  method=NgOptimizer,
                  maxiter=100,
                  getter: Callable | None = None,
+                 batch_size: int = 1,
                  **kwds) -> Optimizer:
         assert level >= 0, 'level must be greater than or equal to 0.'
+        if method is NgOptimizer and batch_size > 1:
+            kwds.setdefault('num_workers', batch_size)
         opt = Optimizer(self,
                         name,
                         level,
                         method,
                         maxiter,
                         minimize=True,
+                        batch_size=batch_size,
                         **kwds)
         self.description['optimizers'][name] = opt
         if getter:
@@ -682,14 +1024,18 @@ class Scan():
                  method=NgOptimizer,
                  maxiter=100,
                  getter: Callable | None = None,
+                 batch_size: int = 1,
                  **kwds) -> Optimizer:
         assert level >= 0, 'level must be greater than or equal to 0.'
+        if method is NgOptimizer and batch_size > 1:
+            kwds.setdefault('num_workers', batch_size)
         opt = Optimizer(self,
                         name,
                         level,
                         method,
                         maxiter,
                         minimize=False,
+                        batch_size=batch_size,
                         **kwds)
         self.description['optimizers'][name] = opt
         if getter:
@@ -726,9 +1072,22 @@ class Scan():
 
     async def _send_msg(self):
         while True:
-            task = await self._msg_queue.get()
-            await task
-            self._msg_queue.task_done()
+            if self._appends and self._msg_queue.empty():
+                timeout = self._batch_interval - (time.monotonic() -
+                                                  self._appends_time)
+                try:
+                    start, task = await asyncio.wait_for(
+                        self._msg_queue.get(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    await self._flush_appends()
+                    continue
+            else:
+                start, task = await self._msg_queue.get()
+            try:
+                await task
+            finally:
+                self._message_limit.release(time.monotonic() - start)
+                self._msg_queue.task_done()
 
     @contextlib.asynccontextmanager
     async def _send_msg_and_update_bar(self):
@@ -736,6 +1095,17 @@ class Scan():
         update_progress_task = asyncio.create_task(self._update_progress())
         try:
             yield (send_msg_task, update_progress_task)
+        except Exception:
+            # keep the steps measured before the error, up to the last
+            # checkpoint, so that the scan can be resumed
+            join = asyncio.create_task(self._msg_queue.join())
+            await asyncio.wait([join, send_msg_task],
+                               timeout=DRAIN_TIMEOUT,
+                               return_when=asyncio.FIRST_COMPLETED)
+            join.cancel()
+            if self._sock is not None and not send_msg_task.done():
+                await self._flush_appends()
+            raise
         finally:
             update_progress_task.cancel()
             send_msg_task.cancel()
@@ -765,12 +1135,16 @@ class Scan():
                                          connect=self.description['database'],
                                          socket=self._sock) as socket:
                 self._sock = socket
+                if self._resume_id is not None:
+                    await self._reopen_record()
                 async with self._send_msg_and_update_bar() as background_tasks:
                     self._background_tasks = background_tasks
                     await self._run()
         else:
             if self.config:
                 self.description['config'] = self._raw_config_copy
+            if self._resume_id is not None:
+                await self._reopen_record()
             async with self._send_msg_and_update_bar() as background_tasks:
                 self._background_tasks = background_tasks
                 await self._run()
@@ -814,6 +1188,44 @@ class Scan():
         await self._msg_queue.join()
         return self.variables
 
+    async def resume(self, record_id: int | str | Path):
+        """Run the scan again, continuing record `record_id`.
+
+        The outermost loop restarts after the last step checkpointed in the
+        record, with the random states and the optimizer histories of that
+        step. `record_id` is the id of a record on the record server, or the
+        file of a local record.
+        """
+        self._resume_id = record_id
+        try:
+            return await self.run()
+        finally:
+            self._resume_id = None
+
+    async def _reopen_record(self):
+        if self._sock is not None:
+            await self._sock.send_pyobj({
+                'method': 'record_get_checkpoint',
+                'record_id': self._resume_id
+            })
+            state = await self._sock.recv_pyobj()
+            record = Record(self._resume_id, self.description['database'],
+                            self.description)
+        else:
+            file = Path(self._resume_id)
+            with open(file, 'rb') as f:
+                record = dill.load(f)
+            record.reopen(file, Path(self.description['database']))
+            record.rollback()
+            state = record.last_checkpoint
+        if state is None:
+            raise ValueError(f'record {self._resume_id} has no checkpoint.')
+        self.record = record
+        # the optimizer histories are extended while resuming, and only the
+        # points told since are sent with the next checkpoint
+        self._resume_state = copy.deepcopy(state)
+        self._single_step = False
+
     async def done(self):
         if self._main_task is not None:
             try:
@@ -858,6 +1270,20 @@ class Scan():
         if level in self._bar:
             self._bar[level].update(n)
 
+    def _vectorizable_level(self):
+        """Whether the steps of the current level are never observed.
+
+        That is the innermost level run by the default `work`, without
+        actions or filters, so it can be evaluated by `_vectorize_level`.
+        """
+        level = self.current_level
+        return (level == len(self.description['loops']) - 1
+                and type(self).work is Scan.work
+                and type(self).do_something is Scan.do_something
+                and all(l < level for l in self.description['actions'])
+                and not self.description['filters'].get(level)
+                and not self.description['filters'].get(-1))
+
     async def iter(self, **kwds):
         if self.current_level >= len(self.description['loops']):
             return
@@ -865,27 +1291,91 @@ class Scan():
         position = 0
         self._prm_queue.put_nowait(self._reset_progress_bar(
             self.current_level))
-        async for variables in _iter_level(
+        block = None
+        if self._vectorizable_level() and not (self.current_level == 0
+                                               and self._resume_state):
+            block = _vectorize_level(
                 self.variables,
                 self.description['loops'].get(self.current_level, []),
                 self.description['order'].get(self.current_level, []),
-                self.description['functions']
-                | {'config': self._synchronize_config},
-                self.description['optimizers'], self.description['setters'],
-                self.description['getters']):
-            await self._check_background_tasks()
-            self._current_level += 1
-            if await self._filter(variables, self.current_level - 1):
-                yield variables
+                self.description['functions'], self.description['setters'],
+                self.description['getters'], late=['config'])
+        if block is not None:
+            n, arrays = block
+            if n:
                 self._single_step = False
-                await self.emit(self.current_level - 1, step, position,
-                                variables)
-                step += 1
-            position += 1
-            self._current_level -= 1
+                self.variables.update(
+                    {name: a[n - 1]
+                     for name, a in arrays.items()})
+                if any('config' in group for group in self.description[
+                        'order'].get(self.current_level, [])):
+                    self._synchronize_config()
+                await self.emit_level(self.current_level, n, arrays,
+                                      self.variables)
             self._prm_queue.put_nowait(
-                self._update_progress_bar(self.current_level, 1))
+                self._update_progress_bar(self.current_level, n))
             await self._check_background_tasks()
+        else:
+            state = None
+            if self.current_level == 0:
+                state, self._resume_state = self._resume_state or {}, None
+                step = state.get('step', 0)
+                position = state.get('position', 0)
+                if 'random' in state:
+                    random.setstate(state['random'])
+                    np.random.set_state(state['numpy'])
+                # points told before the last checkpoint, already journaled
+                told = {
+                    name: len(points)
+                    for name, points in state.get('optimizers', {}).items()
+                }
+                last_steps, last_time = 0, time.monotonic()
+            async for variables in _iter_level(
+                    self.variables,
+                    self.description['loops'].get(self.current_level, []),
+                    self.description['order'].get(self.current_level, []),
+                    self.description['functions']
+                    | {'config': self._synchronize_config},
+                    self.description['optimizers'],
+                    self.description['setters'],
+                    self.description['getters'],
+                    self.description['plan'].get(self.current_level),
+                    state):
+                await self._check_background_tasks()
+                self._current_level += 1
+                if await self._filter(variables, self.current_level - 1):
+                    yield variables
+                    self._single_step = False
+                    await self.emit(self.current_level - 1, step, position,
+                                    variables)
+                    step += 1
+                position += 1
+                self._current_level -= 1
+                if state is not None and self._checkpointing():
+                    last_steps += 1
+                    if (last_steps >= self._checkpoint_steps
+                            or time.monotonic() - last_time
+                            >= self._checkpoint_interval):
+                        await self._put_msg(
+                            self._checkpoint({
+                                'step': step,
+                                'position': position,
+                                'random': random.getstate(),
+                                'numpy': np.random.get_state(),
+                                'told': {
+                                    name: points[told.get(name, 0):]
+                                    for name, points in
+                                    state['optimizers'].items()
+                                }
+                            }))
+                        told = {
+                            name: len(points)
+                            for name, points in state['optimizers'].items()
+                        }
+                        last_steps, last_time = 0, time.monotonic()
+                self._prm_queue.put_nowait(
+                    self._update_progress_bar(self.current_level, 1))
+                await self._check_background_tasks()
         if self.current_level == 0:
             await self.emit(self.current_level - 1, 0, 0, {})
             for name, value in self.variables.items():
@@ -929,27 +1419,35 @@ class Scan():
             Promise: A promise object.
         """
         if inspect.isawaitable(awaitable):
-            async with self._sem:
-                task = asyncio.create_task(self._await(awaitable))
-                self._prm_queue.put_nowait(task)
-                return Promise(task)
+            await self._promise_limit.wait()
+            task = asyncio.create_task(self._await(awaitable))
+            self._prm_queue.put_nowait(task)
+            return Promise(task)
         elif inspect.iscoroutinefunction(awaitable):
             return await self.promise(awaitable(*args, **kwds))
         elif callable(awaitable):
+            await self._promise_limit.wait()
             try:
-                buf = dill.dumps((awaitable, args, kwds))
-                task = asyncio.get_running_loop().run_in_executor(
-                    self._executors, _run_function_in_process, buf)
+                call = self._executors.pack(awaitable, args, kwds)
             except:
                 return awaitable(*args, **kwds)
+            coro = self._executors.run(*call)
+            task = asyncio.create_task(self._await(coro))
+            # a task cancelled before it starts never runs `run`
+            task.add_done_callback(
+                lambda _: (coro.close(), self._executors.release(call)))
             self._prm_queue.put_nowait(task)
             return Promise(task)
         else:
             return awaitable
 
     async def _await(self, awaitable: Awaitable):
-        async with self._sem:
+        await self._promise_limit.acquire()
+        start = time.monotonic()
+        try:
             return await awaitable
+        finally:
+            self._promise_limit.release(time.monotonic() - start)
 
 
 def _get_environment(description):
@@ -1151,16 +1649,120 @@ def _make_axis(description):
     }
 
 
+def _build_plan(description):
+    description['plan'] = {
+        level: (_compile_plan(order,
+                              description['functions'],
+                              late=['config']),
+                _compile_plan(order, description['getters']))
+        for level, order in description['order'].items()
+    }
+
+
+def _plan_key(description):
+    """Hash of the parts of a description the analysis depends on."""
+
+    def kind(iterable):
+        if isinstance(iterable, OptimizeSpace):
+            return 'optimize'
+        if isinstance(iterable, (np.ndarray, list, tuple, range, Space)):
+            return 'array'
+        return 'other'
+
+    normalized = (
+        sorted(description['intrinsic_loops']),
+        sorted(description['consts']),
+        sorted((name, sorted(deps))
+               for name, deps in description['dependents'].items()),
+        [(level, [(name, kind(iterable)) for name, iterable in loops])
+         for level, loops in description['loops'].items()],
+    )
+    return hashlib.sha1(pickle.dumps(normalized, protocol=4)).hexdigest()
+
+
+def load_compiled_plan(key: str) -> dict | None:
+    """Look up a compiled plan in memory, then in `plan_cache_path`."""
+    plan = _compiled_plans.get(key)
+    if plan is None and plan_cache_path is not None:
+        file = plan_cache_path / f'{key}.pkl'
+        try:
+            with open(file, 'rb') as f:
+                plan = pickle.load(f)
+            # the least recently used files are evicted first
+            os.utime(file)
+        except Exception:
+            return None
+        _remember_plan(plan)
+    return copy.deepcopy(plan)
+
+
+def save_compiled_plan(plan: dict):
+    """Keep a plan compiled by `assymbly` in memory and on disk.
+
+    At most `PLAN_CACHE_FILES` plans are kept in `plan_cache_path`, the
+    least recently used ones are removed.
+    """
+    _remember_plan(plan)
+    if plan_cache_path is None:
+        return
+    file = plan_cache_path / f"{plan['key']}.pkl"
+    if file.exists():
+        return
+    try:
+        plan_cache_path.mkdir(parents=True, exist_ok=True)
+        tmp = file.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump(plan, f)
+        os.replace(tmp, file)
+        _evict_plan_files()
+    except OSError:
+        pass
+
+
+def _evict_plan_files():
+    files = []
+    for file in plan_cache_path.glob('*.pkl'):
+        try:
+            files.append((file.stat().st_mtime, file))
+        except OSError:
+            pass
+    files.sort()
+    for _, file in files[:max(len(files) - PLAN_CACHE_FILES, 0)]:
+        file.unlink(missing_ok=True)
+
+
+def _remember_plan(plan):
+    if len(_compiled_plans) >= PLAN_CACHE_SIZE:
+        _compiled_plans.clear()
+    _compiled_plans[plan['key']] = copy.deepcopy(plan)
+
+
 def assymbly(description):
     _get_environment(description)
     levels = _mapping_levels(description)
-    independent_variables = _get_independent_variables(description)
-    description['independent_variables'] = independent_variables
 
-    dependents, full_depends, after_yield = _build_dependents(
-        description, levels, independent_variables)
-
-    _build_order(description, levels, dependents, full_depends)
-    _make_axis(description)
+    key = _plan_key(description)
+    plan = load_compiled_plan(key)
+    if plan is None:
+        independent_variables = _get_independent_variables(description)
+        description['independent_variables'] = independent_variables
+
+        dependents, full_depends, after_yield = _build_dependents(
+            description, levels, independent_variables)
+
+        _build_order(description, levels, dependents, full_depends)
+        _make_axis(description)
+        save_compiled_plan({
+            'key': key,
+            'independent_variables': independent_variables,
+            'order': description['order'],
+            'axis': description['axis'],
+        })
+    else:
+        description['independent_variables'] = plan['independent_variables']
+        description['order'] = plan['order']
+        description['axis'] = plan['axis']
+    description['plan_key'] = key
+    _build_plan(description)
 
     return description
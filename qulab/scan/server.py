@@ -1,13 +1,18 @@
 import asyncio
 import pickle
+import threading
 import time
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import click
 import dill
+import numpy as np
 import zmq
 from loguru import logger
+from sqlalchemy import update
 
 from qulab.sys.rpc.zmq_socket import ZMQContextManager
 
@@ -17,7 +22,7 @@ from .curd import (create_cell, create_config, create_notebook, get_config,
 from .models import Cell, Notebook
 from .models import Record as RecordInDB
 from .models import Session, create_engine, create_tables, sessionmaker, utcnow
-from .record import Record, random_path
+from .record import BufferList, Record, random_path
 from .utils import load_dict
 
 default_record_port = get_config_value('port',
@@ -33,11 +38,182 @@ datapath = get_config_value('data',
 datapath.mkdir(parents=True, exist_ok=True)
 
 namespace = uuid.uuid4()
-record_cache = {}
-buffer_list_cache = {}
 CACHE_SIZE = 1024
+RECORD_OVERHEAD = 4096
+ITEM_OVERHEAD = 128
+
+
+class LRUCache():
+    """Least recently used cache bounded by item count and estimated bytes.
+
+    `sizeof(value)` estimates the memory held by a value, it is evaluated
+    again each time the value is put back, so growing values are accounted.
+    `on_evict(key, value)` is called for every evicted item.
+    """
+
+    def __init__(self,
+                 max_items=CACHE_SIZE,
+                 max_bytes=None,
+                 sizeof=None,
+                 on_evict=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.sizeof else 0
+        evicted = []
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data[key][1]
+            self._data[key] = value, size
+            self._data.move_to_end(key)
+            self.nbytes += size
+            while len(self._data) > 1 and (
+                (self.max_items is not None
+                 and len(self._data) > self.max_items) or
+                (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+                k, (v, size) = self._data.popitem(last=False)
+                self.nbytes -= size
+                self.evictions += 1
+                evicted.append((k, v))
+        if self.on_evict is not None:
+            for k, v in evicted:
+                self.on_evict(k, v)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._data.pop(key)
+            except KeyError:
+                return default
+            self.nbytes -= size
+            return value
+
+    def values(self):
+        with self._lock:
+            return [value for value, _ in self._data.values()]
+
+    def stats(self):
+        return {
+            'items': len(self._data),
+            'bytes': self.nbytes,
+            'max_items': self.max_items,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+def record_nbytes(record: Record) -> int:
+    """Estimate the memory held by a cached record.
+
+    Flushed data lives on disk, so only the items still buffered in the
+    BufferLists are counted, sized after the last one.
+    """
+    n = RECORD_OVERHEAD
+    for item in record._items.values():
+        if isinstance(item, BufferList) and item._list:
+            _, value = item._list[-1]
+            n += len(item._list) * (getattr(value, 'nbytes', 8) +
+                                    ITEM_OVERHEAD)
+        elif isinstance(item, np.ndarray):
+            n += item.nbytes
+    return n
+
+
+def _evict_record(id, record):
+    logger.debug(f"evict record from cache: {id=}")
+    record.flush()
+
+
+record_cache = LRUCache(max_bytes=1024 * 1024 * 1024,
+                        sizeof=record_nbytes,
+                        on_evict=_evict_record)
+buffer_list_cache = LRUCache()
+
+# methods that only touch one record (or config), they are handled by the
+# worker owning it when the server runs with workers.
+WORKER_METHODS = {
+    'record_append', 'record_append_many', 'record_append_level',
+    'record_description', 'record_getitem', 'record_keys', 'record_toarray',
+    'record_slice',
+    'record_checkpoint', 'record_get_checkpoint', 'config_get',
+    'bufferlist_iter'
+}
+
+
+class Worker():
+    """A thread owning a shard of the records.
+
+    Requests on the records of a shard run in order on its thread, with its
+    own database session and record cache, so appends to a record are never
+    reordered and records are evicted and flushed by the thread using them.
+
+    The workers keep the event loop free to receive requests and answer
+    pings. Pickling and slicing hold the GIL though, so they do not run
+    in parallel across workers and more workers do not use more cores.
+    """
+
+    def __init__(self, Session, max_bytes):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.session = Session()
+        self.cache = LRUCache(max_bytes=max_bytes,
+                              sizeof=record_nbytes,
+                              on_evict=_evict_record)
+
+    def submit(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(
+            self.executor, func, self.session, *args)
+
+    def close(self):
+        self.executor.shutdown()
+        self.session.close()
+
+
+workers: list[Worker] = []
+
+
+def worker_of(id) -> Worker:
+    return workers[hash(id) % len(workers)]
+
+
+def cache_of(id) -> LRUCache:
+    return worker_of(id).cache if workers else record_cache
 
 pool = {}
+streams = {}
+STREAM_TIMEOUT = 60.0
+
+# write-behind record timestamps: {record_id: (mtime | None, atime)}
+record_times = {}
+record_times_lock = threading.Lock()
+RECORD_TIMES_INTERVAL = 1.0
 
 
 class Request():
@@ -67,29 +243,150 @@ async def reply(req, resp):
     await req.sock.send_multipart([req.identity, pickle.dumps(resp)])
 
 
-def clear_cache():
-    if len(record_cache) < CACHE_SIZE:
+class Stream():
+    """Server side state of a `bufferlist_stream`.
+
+    Each block sent consumes one credit, the client grants more credit with
+    `bufferlist_stream_credit` as it consumes the blocks.
+    """
+    __slots__ = ['credit', 'closed']
+
+    def __init__(self, credit):
+        self.credit = asyncio.Semaphore(credit)
+        self.closed = False
+
+    def grant(self, n=1):
+        for _ in range(n):
+            self.credit.release()
+
+    def close(self):
+        self.closed = True
+        self.credit.release()
+
+
+def pack_block(pos, values, python=False):
+    if isinstance(values, np.ndarray):
+        values = np.ascontiguousarray(values)
+        header = {'pos': pos.shape, 'dtype': values.dtype.str,
+                  'shape': values.shape, 'python': python}
+        return [pickle.dumps(header), np.ascontiguousarray(pos, dtype='<i8'),
+                values]
+    header = {'pos': pos.shape, 'values': values}
+    return [pickle.dumps(header), np.ascontiguousarray(pos, dtype='<i8')]
+
+
+def pack_array(x):
+    if isinstance(x, np.ndarray) and x.dtype.kind in 'biufc':
+        x = np.ascontiguousarray(x)
+        return [pickle.dumps({'dtype': x.dtype.str, 'shape': x.shape}), x]
+    return [pickle.dumps({'value': x})]
+
+
+def read_block(session: Session, blocks) -> list | None:
+    """Frames of the next block of a stream, None at its end."""
+    block = next(blocks, None)
+    return None if block is None else pack_block(*block)
+
+
+async def bufferlist_stream(session: Session, request: Request,
+                            datapath: Path):
+    msg = request.msg
+    stream = streams[msg['stream_id']] = Stream(msg.get('credit', 1))
+    blocks = None
+    try:
+        record = await get_record_async(session, msg['record_id'], datapath)
+        bufferlist = record.get(msg['key'], buffer_to_array=False)
+        blocks = bufferlist.view(msg['slice'])._iter_blocks()
+        while True:
+            # blocks are read on the worker owning the record
+            if workers:
+                frames = await worker_of(msg['record_id']).submit(
+                    read_block, blocks)
+            else:
+                frames = read_block(session, blocks)
+            if frames is None:
+                break
+            await asyncio.wait_for(stream.credit.acquire(),
+                                   timeout=STREAM_TIMEOUT)
+            if stream.closed:
+                logger.debug(f"bufferlist_stream closed by client.")
+                return
+            await request.sock.send_multipart([request.identity, *frames],
+                                              copy=False)
+        await reply(request, {'end': True})
+    except asyncio.TimeoutError:
+        logger.warning(f"bufferlist_stream: client stopped granting credit.")
+    finally:
+        streams.pop(msg['stream_id'], None)
+        if blocks is not None and not blocks.gi_running:
+            blocks.close()
+
+
+def touch_record(id: int, modified: bool = False):
+    now = utcnow()
+    with record_times_lock:
+        mtime = now if modified else record_times.get(id, (None, None))[0]
+        record_times[id] = mtime, now
+
+
+def flush_record_times(session: Session):
+    """Write the accumulated timestamps with a few bulk UPDATEs.
+
+    Records are grouped by the column they need and get the latest time of
+    their group, so the timestamps are precise to one flush interval.
+    """
+    if not record_times:
         return
+    with record_times_lock:
+        times = record_times.copy()
+        record_times.clear()
+    modified = [id for id, (mtime, _) in times.items() if mtime is not None]
+    accessed = [id for id, (mtime, _) in times.items() if mtime is None]
+    try:
+        if modified:
+            t = max(times[id][1] for id in modified)
+            session.execute(
+                update(RecordInDB).where(RecordInDB.id.in_(modified)).values(
+                    mtime=t, atime=t))
+        if accessed:
+            t = max(times[id][1] for id in accessed)
+            session.execute(
+                update(RecordInDB).where(RecordInDB.id.in_(accessed)).values(
+                    atime=t))
+        session.commit()
+        logger.debug(f"flush_record_times: {len(times)} records.")
+    except:
+        logger.exception(f"flush_record_times rollback.")
+        session.rollback()
+        with record_times_lock:
+            for id, (mtime, atime) in times.items():
+                if id not in record_times:
+                    record_times[id] = mtime, atime
 
-    logger.debug(f"clear_cache record_cache: {len(record_cache)}")
-    for ((k, (_, _)),
-         _) in zip(sorted(record_cache.items(), key=lambda x: x[1][0]),
-                   range(len(record_cache) - CACHE_SIZE)):
-        del record_cache[k]
 
-    logger.debug(f"clear_cache buffer_list_cache: {len(buffer_list_cache)}")
-    for ((k, (_, _)),
-         _) in zip(sorted(buffer_list_cache.items(), key=lambda x: x[1][0]),
-                   range(len(buffer_list_cache) - CACHE_SIZE)):
-        del buffer_list_cache[k]
-    logger.debug(f"clear_cache done.")
+async def flush_record_times_periodically(session: Session,
+                                          interval: float):
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            flush_record_times(session)
+    finally:
+        flush_record_times(session)
 
 
-def flush_cache():
-    logger.debug(f"flush_cache: {len(record_cache)}")
-    for _, (_, r) in record_cache.items():
+def flush_records(cache: LRUCache):
+    logger.debug(f"flush_records: {len(cache)}")
+    for r in cache.values():
         r.flush()
-    logger.debug(f"flush_cache done.")
+    logger.debug(f"flush_records done.")
+
+
+def flush_cache():
+    if workers:
+        for worker in workers:
+            worker.executor.submit(flush_records, worker.cache)
+    else:
+        flush_records(record_cache)
 
 
 def get_local_record(session: Session, id: int, datapath: Path) -> Record:
@@ -98,7 +395,7 @@ def get_local_record(session: Session, id: int, datapath: Path) -> Record:
     if record_in_db is None:
         logger.debug(f"record not found: {id=}")
         return None
-    record_in_db.atime = utcnow()
+    touch_record(id)
 
     if record_in_db.file.endswith('.zip'):
         logger.debug(f"load record from zip: {record_in_db.file}")
@@ -111,24 +408,27 @@ def get_local_record(session: Session, id: int, datapath: Path) -> Record:
         logger.debug(f"load record from file: {path}")
         record = dill.load(f)
         logger.debug(f"load record from file done.")
-        record.database = datapath
-        record._file = path
+        record.reopen(path, datapath)
     return record
 
 
 def get_record(session: Session, id: int, datapath: Path) -> Record:
-    if id not in record_cache:
+    cache = cache_of(id)
+    record = cache.get(id)
+    if record is None:
         record = get_local_record(session, id, datapath)
-    else:
-        logger.debug(f"get_record from cache: {id=}")
-        record = record_cache[id][1]
-    clear_cache()
-    logger.debug(f"update lru time for record cache: {id=}")
     if record:
-        record_cache[id] = time.time(), record
+        cache.put(id, record)
     return record
 
 
+async def get_record_async(session: Session, id: int,
+                           datapath: Path) -> Record:
+    if workers:
+        return await worker_of(id).submit(get_record, id, datapath)
+    return get_record(session, id, datapath)
+
+
 def record_create(session: Session, description: dict, datapath: Path) -> int:
     logger.debug(f"record_create: {description['app']}")
     record = Record(None, datapath, description)
@@ -146,8 +446,11 @@ def record_create(session: Session, description: dict, datapath: Path) -> int:
         session.commit()
         logger.debug(f"record_create commited: record.id={record_in_db.id}")
         record.id = record_in_db.id
-        clear_cache()
-        record_cache[record.id] = time.time(), record
+        if workers:
+            # the worker owning the record will load it from the file
+            record.flush()
+        else:
+            record_cache.put(record.id, record)
         return record.id
     except:
         logger.debug(f"record_create rollback")
@@ -161,23 +464,69 @@ def record_append(session: Session, record_id: int, level: int, step: int,
     record = get_record(session, record_id, datapath)
     logger.debug(f"record_append: {record_id}, {level}, {step}, {position}")
     record.append(level, step, position, variables)
+    touch_record(record_id, modified=True)
     logger.debug(f"record_append done.")
-    try:
-        logger.debug(f"record_append update SQL database.")
-        record_in_db = session.get(RecordInDB, record_id)
-        logger.debug(f"record_append get RecordInDB: {record_in_db}")
-        record_in_db.mtime = utcnow()
-        record_in_db.atime = utcnow()
-        logger.debug(f"record_append update RecordInDB: {record_in_db}")
-        session.commit()
-        logger.debug(f"record_append commited.")
-    except:
-        logger.debug(f"record_append rollback.")
-        session.rollback()
-        raise
+
+
+def record_append_many(session: Session,
+                       record_id: int,
+                       appends: list,
+                       datapath: Path,
+                       checkpoint: dict | None = None):
+    logger.debug(f"record_append_many: {record_id}, {len(appends)} steps")
+    record = get_record(session, record_id, datapath)
+    for level, step, position, variables in appends:
+        record.append(level, step, position, variables)
+    if checkpoint is not None:
+        record.checkpoint(checkpoint)
+    touch_record(record_id, modified=True)
+
+
+def record_append_level(session: Session, record_id: int, level: int, n: int,
+                        arrays: dict, variables: dict, datapath: Path):
+    logger.debug(f"record_append_level: {record_id}, {n} steps")
+    record = get_record(session, record_id, datapath)
+    record.append_level(level, n, arrays, variables)
+    touch_record(record_id, modified=True)
+
+
+def record_checkpoint(session: Session, record_id: int, state: dict,
+                      datapath: Path):
+    logger.debug(f"record_checkpoint: {record_id}")
+    record = get_record(session, record_id, datapath)
+    record.checkpoint(state)
+    touch_record(record_id, modified=True)
+
+
+def record_toarray(session: Session, record_id: int, key: str, slice,
+                   datapath: Path):
+    record = get_record(session, record_id, datapath)
+    item = record.get(key, buffer_to_array=False)
+    if not isinstance(item, BufferList):
+        return record.get(key, buffer_to_array=True)
+    return item.view(slice).toarray()
+
+
+def record_slice(session: Session, record_id: int, key: str, slice_tuple,
+                 datapath: Path):
+    record = get_record(session, record_id, datapath)
+    item = record.get(key, buffer_to_array=False)
+    if not isinstance(item, BufferList):
+        return record.get(key, buffer_to_array=True)[slice_tuple]
+    return item[slice_tuple]
+
+
+def cache_stats():
+    stats = [w.cache.stats() for w in workers] or [record_cache.stats()]
+    return {
+        'record': {k: sum(s[k] for s in stats)
+                   for k in stats[0]},
+        'bufferlist_iter': buffer_list_cache.stats()
+    }
 
 
 def record_delete(session: Session, record_id: int, datapath: Path):
+    cache_of(record_id).pop(record_id)
     record = get_local_record(session, record_id, datapath)
     record.delete()
     record_in_db = session.get(RecordInDB, record_id)
@@ -185,6 +534,87 @@ def record_delete(session: Session, record_id: int, datapath: Path):
     session.commit()
 
 
+def bufferlist_iter(session: Session, msg: dict, datapath: Path):
+    logger.debug(f"bufferlist_iter: {msg}")
+    if msg['iter_id'] and msg['iter_id'] in buffer_list_cache:
+        it = buffer_list_cache.get(msg['iter_id'])
+        iter_id = msg['iter_id']
+    else:
+        iter_id = uuid.uuid3(namespace, str(time.time_ns())).bytes
+        record = get_record(session, msg['record_id'], datapath)
+        bufferlist = record.get(msg['key'], buffer_to_array=False)
+        it = bufferlist.view(msg['slice']).iter()
+        for _, _ in zip(range(msg['start']), it):
+            pass
+    current_time = time.time()
+    ret, end = [], False
+    while time.time() - current_time < 0.02:
+        try:
+            ret.append(next(it))
+        except StopIteration:
+            end = True
+            break
+    logger.debug(f"bufferlist_iter: {iter_id}, {end}")
+    buffer_list_cache.put(iter_id, it)
+    return iter_id, ret, end
+
+
+def handle_record(session: Session, msg: dict, datapath: Path):
+    """Handle a method of `WORKER_METHODS`.
+
+    Returns the frames of the reply, or None if the method has no reply.
+    Everything that is expensive, including pickling the reply, happens
+    here so that it can run off the event loop.
+    """
+    match msg['method']:
+        case 'record_append':
+            record_append(session, msg['record_id'], msg['level'], msg['step'],
+                          msg['position'], msg['variables'], datapath)
+        case 'record_append_many':
+            record_append_many(session, msg['record_id'], msg['appends'],
+                               datapath, msg.get('checkpoint'))
+        case 'record_append_level':
+            record_append_level(session, msg['record_id'], msg['level'],
+                                msg['n'], msg['arrays'], msg['variables'],
+                                datapath)
+        case 'record_description':
+            record = get_record(session, msg['record_id'], datapath)
+            return [pickle.dumps(dill.dumps(record))]
+        case 'record_checkpoint':
+            record_checkpoint(session, msg['record_id'], msg['state'],
+                              datapath)
+        case 'record_get_checkpoint':
+            # asked by a scan resuming the record
+            record = get_record(session, msg['record_id'], datapath)
+            if record:
+                record.rollback()
+            return [pickle.dumps(record and record.last_checkpoint)]
+        case 'record_getitem':
+            record = get_record(session, msg['record_id'], datapath)
+            return [
+                pickle.dumps(record.get(msg['key'], buffer_to_array=False))
+            ]
+        case 'record_keys':
+            record = get_record(session, msg['record_id'], datapath)
+            return [pickle.dumps(record.keys())]
+        case 'record_toarray':
+            return pack_array(
+                record_toarray(session, msg['record_id'], msg['key'],
+                               msg.get('slice'), datapath))
+        case 'record_slice':
+            return pack_array(
+                record_slice(session, msg['record_id'], msg['key'],
+                             msg['slice'], datapath))
+        case 'config_get':
+            config = get_config(session,
+                                msg['config_id'],
+                                base=datapath / 'objects')
+            session.commit()
+            return [pickle.dumps(config)]
+        case 'bufferlist_iter':
+            return [pickle.dumps(bufferlist_iter(session, msg, datapath))]
+
+
 @logger.catch(reraise=True)
 async def handle(session: Session, request: Request, datapath: Path):
 
@@ -196,61 +626,34 @@ async def handle(session: Session, request: Request, datapath: Path):
     match request.method:
         case 'ping':
             await reply(request, 'pong')
-        case 'bufferlist_iter':
-            logger.debug(f"bufferlist_iter: {msg}")
-            if msg['iter_id'] and msg['iter_id'] in buffer_list_cache:
-                it = buffer_list_cache[msg['iter_id']][1]
-                iter_id = msg['iter_id']
-            else:
-                iter_id = uuid.uuid3(namespace, str(time.time_ns())).bytes
-                record = get_record(session, msg['record_id'], datapath)
-                bufferlist = record.get(msg['key'], buffer_to_array=False)
-                if msg['slice']:
-                    bufferlist._slice = msg['slice']
-                it = bufferlist.iter()
-                for _, _ in zip(range(msg['start']), it):
-                    pass
-            current_time = time.time()
-            ret, end = [], False
-            while time.time() - current_time < 0.02:
-                try:
-                    ret.append(next(it))
-                except StopIteration:
-                    end = True
-                    break
-            logger.debug(f"bufferlist_iter: {iter_id}, {end}")
-            await reply(request, (iter_id, ret, end))
-            logger.debug(f"reply bufferlist_iter: {iter_id}, {end}")
-            buffer_list_cache[iter_id] = time.time(), it
-            clear_cache()
+        case method if method in WORKER_METHODS:
+            frames = handle_record(session, msg, datapath)
+            if frames is not None:
+                await request.sock.send_multipart([request.identity, *frames],
+                                                  copy=False)
+        case 'bufferlist_stream':
+            await bufferlist_stream(session, request, datapath)
+        case 'bufferlist_stream_credit':
+            if msg['stream_id'] in streams:
+                streams[msg['stream_id']].grant(msg.get('credit', 1))
+        case 'bufferlist_stream_exit':
+            if msg['stream_id'] in streams:
+                streams[msg['stream_id']].close()
         case 'bufferlist_iter_exit':
             logger.debug(f"bufferlist_iter_exit: {msg}")
             try:
-                it = buffer_list_cache.pop(msg['iter_id'])[1]
+                it = buffer_list_cache.pop(msg['iter_id'])
                 it.throw(Exception)
             except:
                 pass
-            clear_cache()
             logger.debug(f"end bufferlist_iter_exit: {msg}")
         case 'record_create':
             logger.debug(f"record_create")
             description = load_dict(msg['description'])
             await reply(request, record_create(session, description, datapath))
             logger.debug(f"reply record_create")
-        case 'record_append':
-            logger.debug(f"record_append")
-            record_append(session, msg['record_id'], msg['level'], msg['step'],
-                          msg['position'], msg['variables'], datapath)
-            logger.debug(f"reply record_append")
-        case 'record_description':
-            record = get_record(session, msg['record_id'], datapath)
-            await reply(request, dill.dumps(record))
-        case 'record_getitem':
-            record = get_record(session, msg['record_id'], datapath)
-            await reply(request, record.get(msg['key'], buffer_to_array=False))
-        case 'record_keys':
-            record = get_record(session, msg['record_id'], datapath)
-            await reply(request, record.keys())
+        case 'cache_stats':
+            await reply(request, cache_stats())
         case 'record_query':
             total, apps, table = query_record(session,
                                               offset=msg.get('offset', 0),
@@ -296,12 +699,6 @@ async def handle(session: Session, request: Request, datapath: Path):
                 ])
             else:
                 await reply(request, None)
-        case 'config_get':
-            config = get_config(session,
-                                msg['config_id'],
-                                base=datapath / 'objects')
-            session.commit()
-            await reply(request, config)
         case 'config_update':
             config = create_config(session,
                                    msg['update'],
@@ -320,6 +717,8 @@ async def handle(session: Session, request: Request, datapath: Path):
                     pool[id] = [pool[id].record.id, False]
                 else:
                     pool.pop(id)
+            # the plan is compiled, or found in the cache, by the server
+            # from the description it received, never taken from the client
             description = dill.loads(msg['description'])
             task = Scan()
             task.description = description
@@ -369,12 +768,25 @@ async def handle_with_timeout(session: Session, request: Request,
     logger.debug(f"Task handling request {request} finished.")
 
 
+async def reply_from_worker(request: Request, future: asyncio.Future):
+    try:
+        frames = await future
+    except Exception as e:
+        logger.error(f"Worker handling request {request} failed: {e!r}")
+        frames = [pickle.dumps(ErrorResponse(f'{e!r}'))]
+    if frames is not None:
+        await request.sock.send_multipart([request.identity, *frames],
+                                          copy=False)
+
+
 async def serv(port,
                datapath,
                url='',
                buffer_size=1024 * 1024 * 1024,
-               interval=60):
+               interval=60,
+               num_workers=4):
     datapath.mkdir(parents=True, exist_ok=True)
+    record_cache.max_bytes = buffer_size
     logger.debug('Creating socket...')
     async with ZMQContextManager(zmq.ROUTER, bind=f"tcp://*:{port}") as sock:
         logger.info(f'Server started at port {port}.')
@@ -386,34 +798,55 @@ async def serv(port,
         Session = sessionmaker(engine)
         with Session() as session:
             logger.info(f'Database connected: {url}.')
+            workers.extend(
+                Worker(Session, buffer_size // max(num_workers, 1))
+                for _ in range(num_workers))
+            logger.info(f'Started {num_workers} workers.')
             received = 0
             last_flush_time = time.time()
-            while True:
-                logger.debug('Waiting for request...')
-                identity, msg = await sock.recv_multipart()
-                logger.debug('Received request.')
-                received += len(msg)
-                try:
-                    req = Request(sock, identity, msg)
-                except Exception as e:
-                    logger.exception('bad request')
-                    await sock.send_multipart(
-                        [identity,
-                         pickle.dumps(ErrorResponse(f'{e!r}'))])
-                    continue
-                asyncio.create_task(
-                    handle_with_timeout(session, req, datapath,
-                                        timeout=3600.0))
-                if received > buffer_size or time.time(
-                ) - last_flush_time > interval:
-                    flush_cache()
-                    received = 0
-                    last_flush_time = time.time()
-
-
-async def main(port, datapath, url, buffer=1024, interval=60):
+            flush_task = asyncio.create_task(
+                flush_record_times_periodically(session,
+                                                RECORD_TIMES_INTERVAL))
+            try:
+                while True:
+                    logger.debug('Waiting for request...')
+                    identity, msg = await sock.recv_multipart()
+                    logger.debug('Received request.')
+                    received += len(msg)
+                    try:
+                        req = Request(sock, identity, msg)
+                    except Exception as e:
+                        logger.exception('bad request')
+                        await sock.send_multipart(
+                            [identity,
+                             pickle.dumps(ErrorResponse(f'{e!r}'))])
+                        continue
+                    if workers and req.method in WORKER_METHODS:
+                        # submitted right away to keep the arrival order
+                        id = req.msg.get('record_id', req.msg.get('config_id'))
+                        future = worker_of(id).submit(handle_record, req.msg,
+                                                      datapath)
+                        asyncio.create_task(reply_from_worker(req, future))
+                    else:
+                        asyncio.create_task(
+                            handle_with_timeout(session, req, datapath,
+                                                timeout=3600.0))
+                    if received > buffer_size or time.time(
+                    ) - last_flush_time > interval:
+                        flush_cache()
+                        received = 0
+                        last_flush_time = time.time()
+            finally:
+                flush_task.cancel()
+                for worker in workers:
+                    worker.executor.submit(flush_records, worker.cache)
+                    worker.close()
+                workers.clear()
+
+
+async def main(port, datapath, url, buffer=1024, interval=60, workers=4):
     logger.info('Server starting...')
-    await serv(port, datapath, url, buffer * 1024 * 1024, interval)
+    await serv(port, datapath, url, buffer * 1024 * 1024, interval, workers)
 
 
 @click.command()
@@ -430,17 +863,24 @@ async def main(port, datapath, url, buffer=1024, interval=60):
                                        default=Path.home() / 'qulab' / 'data'),
               help='Path of the data.')
 @click.option('--url', default='sqlite', help='URL of the database.')
-@click.option('--buffer', default=1024, help='Buffer size (MB).')
+@click.option('--buffer',
+              default=1024,
+              help='Buffer size (MB), also the memory budget of record cache.')
 @click.option('--interval',
               default=60,
               help='Interval of flush cache, in unit of second.')
+@click.option('--workers',
+              default=4,
+              help='Number of worker threads, 0 to handle all requests in '
+              'the event loop. They keep the server responsive, but share '
+              'one core.')
 @log_options(command_name='server')
-def server(port, datapath, url, buffer, interval):
+def server(port, datapath, url, buffer, interval, workers):
     try:
         import uvloop
-        uvloop.run(main(port, Path(datapath), url, buffer, interval))
+        uvloop.run(main(port, Path(datapath), url, buffer, interval, workers))
     except ImportError:
-        asyncio.run(main(port, Path(datapath), url, buffer, interval))
+        asyncio.run(main(port, Path(datapath), url, buffer, interval, workers))
 
 
 if __name__ == "__main__":
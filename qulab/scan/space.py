@@ -140,6 +140,7 @@ class Optimizer():
                  method: str | Type = skopt.Optimizer,
                  maxiter: int = 1000,
                  minimize: bool = True,
+                 batch_size: int = 1,
                  **kwds):
         self.scanner = scanner
         self.method = method
@@ -149,6 +150,7 @@ class Optimizer():
         self.level = level
         self.kwds = kwds
         self.minimize = minimize
+        self.batch_size = batch_size
         self.suggestion = {}
 
     def create(self):
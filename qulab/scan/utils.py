@@ -1,6 +1,7 @@
 import ast
 import asyncio
 import inspect
+import operator
 import platform
 import re
 import subprocess
@@ -134,6 +135,92 @@ async def async_zip(*aiters):
         return
 
 
+def tuple_getter(keys):
+    """Like `operator.itemgetter(*keys)` but always returns a tuple."""
+    if len(keys) == 0:
+        return lambda d: ()
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda d: (d[key], )
+    return operator.itemgetter(*keys)
+
+
+class FunctionCall():
+    """`call_function` with the signature of `func` inspected only once.
+
+    Calling it with `(variables, ret)` looks the arguments up in `ret` first,
+    then in `variables`.  It returns the result, or an awaitable if the
+    function is asynchronous or some argument is still awaitable.
+    """
+    __slots__ = ['func', 'kind', 'args']
+
+    def __init__(self, func: Callable | Expression):
+        self.func = func
+        self.args = ()
+        if isinstance(func, Expression):
+            self.kind = 'expression'
+            self.args = tuple(func.symbols())
+            return
+        try:
+            sig = inspect.signature(func)
+        except:
+            self.kind = 'bare'
+            return
+        self.kind = 'positional'
+        args = []
+        for name, param in sig.parameters.items():
+            if param.kind == param.POSITIONAL_OR_KEYWORD:
+                args.append((name, param.default))
+            elif param.kind == param.VAR_POSITIONAL:
+                self.kind = 'var_positional'
+                break
+            elif param.kind == param.VAR_KEYWORD:
+                self.kind = 'keywords'
+                break
+        self.args = tuple(args)
+
+    def __call__(self, variables: dict[str, Any], ret: dict[str, Any] = {}):
+        if self.kind == 'positional':
+            args = []
+            for name, default in self.args:
+                if name in ret:
+                    args.append(ret[name])
+                elif name in variables:
+                    args.append(variables[name])
+                elif default is not inspect.Parameter.empty:
+                    args.append(default)
+                else:
+                    raise ValueError(f'parameter {name} is not provided.')
+            if any(inspect.isawaitable(arg) for arg in args):
+                return self._call_later(args)
+            return self.func(*args)
+        elif self.kind == 'expression':
+            env = Env()
+            for name in self.args:
+                if name in ret:
+                    env.variables[name] = ret[name]
+                elif name in variables:
+                    env.variables[name] = variables[name]
+                else:
+                    raise ValueError(f'{name} is not provided.')
+                if inspect.isawaitable(env.variables[name]):
+                    return call_function(self.func, variables | ret)
+            return self.func.eval(env)
+        elif self.kind == 'keywords':
+            return call_function(self.func, variables | ret)
+        elif self.kind == 'bare':
+            return self.func()
+        else:
+            raise ValueError('not support VAR_POSITIONAL')
+
+    async def _call_later(self, args):
+        args = [await arg if inspect.isawaitable(arg) else arg for arg in args]
+        ret = self.func(*args)
+        if inspect.isawaitable(ret):
+            ret = await ret
+        return ret
+
+
 async def call_function(func: Callable | Expression, variables: dict[str,
                                                                      Any]):
     if isinstance(func, Expression):
@@ -1,5 +1,8 @@
 """Array class - multidimensional array storage for scan data."""
 
+import json
+import os
+import pickle
 import sys
 import uuid
 from pathlib import Path
@@ -10,6 +13,8 @@ from typing import TYPE_CHECKING, Any, Iterator, List, Optional, Tuple, Union
 import dill
 import numpy as np
 
+from .chunk import CHUNKSIZE
+
 if TYPE_CHECKING:
     from .local import LocalStorage
 
@@ -23,9 +28,16 @@ class Array:
     Also supports pattern-based storage for independent arrays (set_array)
     where arrays can be represented by simple generation functions
     (linspace, logspace, arange, full) rather than storing full data.
+
+    Appended numeric data can use the 'chunks' storage type instead of
+    'data': items are stored as typed records (int64 position, value)
+    in an append-only tail file, which is sealed into a content-addressed
+    chunk of about CHUNKSIZE bytes once it is full. The data file then
+    only holds the manifest of the chunks.
     """
 
     BUFFER_SIZE = 1000  # Memory buffer size before flush
+    CHUNKSIZE = CHUNKSIZE  # Size of sealed chunks for 'chunks' storage
 
     def __init__(
         self,
@@ -53,8 +65,9 @@ class Array:
 
         # Pattern-based storage for independent arrays (set_array)
         self._pattern: Optional[dict] = None  # Generation pattern
-        self._storage_type: str = "data"  # 'pattern' or 'data'
+        self._storage_type: str = "data"  # 'pattern', 'data' or 'chunks'
         self._cached_array: Optional[np.ndarray] = None  # Lazy loaded array
+        self._manifest: Optional[dict] = None  # Chunk manifest (chunks)
 
     def __repr__(self) -> str:
         return f"Array(name={self.name!r}, shape={self.shape}, lu={self.lu}, rd={self.rd})"
@@ -87,6 +100,7 @@ class Array:
         self._pattern = state.get("pattern")
         self._storage_type = state.get("storage_type", "data")
         self._cached_array = None
+        self._manifest = None
 
     @property
     def file(self) -> Optional[Path]:
@@ -117,6 +131,7 @@ class Array:
         dataset_id: int,
         name: str,
         inner_shape: tuple = (),
+        storage_type: str = "data",
     ) -> "Array":
         """Create a new array in storage.
 
@@ -125,6 +140,7 @@ class Array:
             dataset_id: Parent dataset ID
             name: Array name
             inner_shape: Inner shape for nested arrays
+            storage_type: 'data' or 'chunks' for appended arrays
 
         Returns:
             New Array instance
@@ -137,8 +153,10 @@ class Array:
 
         instance = cls(name, storage, dataset_id, file=full_path)
         instance.inner_shape = inner_shape
-        instance.lu = tuple([0] * len(inner_shape)) if inner_shape else ()
-        instance.rd = tuple([1] * len(inner_shape)) if inner_shape else ()
+        instance._storage_type = storage_type
+        if storage_type != "chunks":
+            instance.lu = tuple([0] * len(inner_shape)) if inner_shape else ()
+            instance.rd = tuple([1] * len(inner_shape)) if inner_shape else ()
 
         return instance
 
@@ -166,7 +184,7 @@ class Array:
             rd: Upper bounds
             inner_shape: Inner shape
             pattern: Optional generation pattern for pattern-based storage
-            storage_type: 'pattern' or 'data'
+            storage_type: 'pattern', 'data' or 'chunks'
 
         Returns:
             Array instance
@@ -180,24 +198,236 @@ class Array:
         instance._storage_type = storage_type
         return instance
 
+    @property
+    def index_file(self) -> Optional[Path]:
+        """Sidecar block index of the data file."""
+        if self._file is None:
+            return None
+        return self._file.with_name(self._file.name + ".idx")
+
     def flush(self):
-        """Flush memory buffer to disk."""
+        """Flush memory buffer to disk.
+
+        Every flush appends one block of items to the data file and one
+        entry (offset, size, count and the bounding box of the positions)
+        to the sidecar index, which lets slicing skip unrelated blocks.
+        """
         if not self._list:
             return
 
         with self._lock:
             buffer, self._list = self._list, []
 
-        if self._file:
+        if self._file and self._storage_type == "chunks":
+            with self._lock:
+                self._flush_chunks(buffer)
+        elif self._file:
             with self._lock:
                 with open(self._file, "ab") as f:
+                    offset = f.tell()
                     for item in buffer:
                         dill.dump(item, f)
+                    self._write_index_entry(offset, f.tell() - offset,
+                                            [pos for pos, _ in buffer])
+
+    @property
+    def tail_file(self) -> Optional[Path]:
+        """Records not sealed into a chunk yet ('chunks' storage)."""
+        if self._file is None:
+            return None
+        return self._file.with_name(self._file.name + ".tail")
+
+    def _load_manifest(self) -> Optional[dict]:
+        """Load the chunk manifest, None before the first flush."""
+        if self._manifest is None and self._file and self._file.exists():
+            with open(self._file, "r") as f:
+                self._manifest = json.load(f)
+        return self._manifest
+
+    def _save_manifest(self):
+        tmp = self._file.with_name(self._file.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._manifest, f)
+        os.replace(tmp, self._file)
+
+    def _row_dtype(self) -> Optional[np.dtype]:
+        """Record dtype of the stored items, None before the first flush."""
+        manifest = self._load_manifest()
+        if manifest is None:
+            return None
+        return np.dtype([
+            ("pos", "<i8", (manifest["ndim"], )),
+            ("value", manifest["dtype"], tuple(manifest["inner_shape"])),
+        ])
+
+    def _to_rows(self, buffer: List[Tuple[Tuple, Any]]) -> np.ndarray:
+        """Convert buffered items to records of the row dtype.
+
+        The dtype, position dimension and inner shape are fixed by the
+        first flush.
+
+        Raises:
+            TypeError: If values are not numeric or can not be cast safely
+            ValueError: If positions or value shapes do not match
+        """
+        pos = [p for p, _ in buffer]
+        values = np.asarray([v for _, v in buffer])
+        if values.dtype.kind not in "biufc":
+            raise TypeError(f"Array {self.name!r} with 'chunks' storage "
+                            f"only holds numeric values, got {values.dtype}")
+        if self._load_manifest() is None:
+            self._manifest = {
+                "dtype": values.dtype.newbyteorder("<").str,
+                "ndim": len(pos[0]),
+                "inner_shape": list(values.shape[1:]),
+                "chunks": [],
+            }
+            self._save_manifest()
+        dtype = self._row_dtype()
+        if values.shape[1:] != dtype["value"].shape:
+            raise ValueError(f"Value shape {values.shape[1:]} does not match "
+                             f"{dtype['value'].shape} of array {self.name!r}")
+        if not np.can_cast(values.dtype, dtype["value"].base, "same_kind"):
+            raise TypeError(f"Can not store {values.dtype} values in array "
+                            f"{self.name!r} of {dtype['value'].base}")
+        rows = np.empty(len(buffer), dtype=dtype)
+        try:
+            rows["pos"] = np.asarray(pos, dtype=np.int64).reshape(
+                len(buffer), -1)
+        except ValueError:
+            raise ValueError(f"Positions of array {self.name!r} must have "
+                             f"{self._manifest['ndim']} dimensions")
+        rows["value"] = values
+        return rows
+
+    def _flush_chunks(self, buffer: List[Tuple[Tuple, Any]]):
+        """Append items to the tail and seal full chunks."""
+        rows = self._to_rows(buffer)
+        with open(self.tail_file, "ab") as f:
+            f.write(rows.tobytes())
+
+        per_chunk = max(1, self.CHUNKSIZE // rows.dtype.itemsize)
+        if self.tail_file.stat().st_size < per_chunk * rows.dtype.itemsize:
+            return
+
+        from .chunk import save_chunk
+
+        rows = np.fromfile(self.tail_file, dtype=rows.dtype)
+        full = len(rows) - len(rows) % per_chunk
+        for start in range(0, full, per_chunk):
+            block = rows[start:start + per_chunk]
+            chunk_path, _ = save_chunk(block.tobytes(),
+                                       base_path=self.storage.base_path)
+            self._manifest["chunks"].append([
+                chunk_path.name,
+                len(block),
+                block["pos"].min(axis=0).tolist(),
+                (block["pos"].max(axis=0) + 1).tolist(),
+            ])
+        self._save_manifest()
+        tmp = self.tail_file.with_name(self.tail_file.name + ".tmp")
+        rows[full:].tofile(tmp)
+        os.replace(tmp, self.tail_file)
+
+    def _read_rows(self, chunks: Optional[List] = None) -> np.ndarray:
+        """Read the stored records of the given manifest entries and the tail.
+
+        Args:
+            chunks: Manifest entries to read, all chunks if None
+        """
+        dtype = self._row_dtype()
+        if dtype is None:
+            return np.empty(0, dtype=[("pos", "<i8", (len(self.lu), )),
+                                      ("value", "<f8")])
+        from .chunk import load_chunk
+
+        if chunks is None:
+            chunks = self._manifest["chunks"]
+        parts = [
+            np.frombuffer(load_chunk(ref, base_path=self.storage.base_path),
+                          dtype=dtype) for ref, *_ in chunks
+        ]
+        if self.tail_file.exists():
+            parts.append(np.fromfile(self.tail_file, dtype=dtype))
+        if not parts:
+            return np.empty(0, dtype=dtype)
+        return np.concatenate(parts)
+
+    def _scatter_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Scatter records into a dense array of full shape."""
+        if rows.size == 0:
+            return np.array([])
+        dtype = rows.dtype["value"].base
+        fill_value = np.nan if np.issubdtype(dtype, np.inexact) else 0
+        shape = tuple(r - l for l, r in zip(self.lu, self.rd))
+        x = np.full(shape + rows.dtype["value"].shape, fill_value, dtype=dtype)
+        x[tuple((rows["pos"] - np.asarray(self.lu, dtype=np.int64)).T)] = (
+            rows["value"])
+        return x
+
+    def _write_index_entry(self, offset: int, size: int, positions: List[Tuple]):
+        """Append one block entry to the sidecar index."""
+        ndims = {len(pos) for pos in positions}
+        if offset == 0 or len(ndims) != 1:
+            self.index_file.unlink(missing_ok=True)
+        if len(ndims) != 1:
+            # Index entries have a fixed width, blocks with mixed position
+            # dimensions are left unindexed and slicing falls back to a scan.
+            return
+        ndim = ndims.pop()
+        pos = np.asarray(positions, dtype=np.int64).reshape(len(positions), ndim)
+        entry = np.concatenate([
+            [offset, size, len(positions)],
+            pos.min(axis=0), pos.max(axis=0) + 1,
+        ]).astype("<i8")
+        with open(self.index_file, "ab") as f:
+            if f.tell() == 0:
+                f.write(np.array([ndim], dtype="<i8").tobytes())
+            f.write(entry.tobytes())
+
+    def _load_index(self) -> Optional[np.ndarray]:
+        """Load the sidecar index.
+
+        Returns:
+            Array of shape (blocks, 3 + 2 * ndim) with columns
+            (offset, size, count, lu..., rd...), or None if the index is
+            missing or does not describe the whole data file.
+        """
+        if not (self._file and self.index_file
+                and self.index_file.exists() and self._file.exists()):
+            return None
+        raw = np.fromfile(self.index_file, dtype="<i8")
+        if raw.size == 0:
+            return None
+        width = 3 + 2 * int(raw[0])
+        body = raw[1:]
+        if body.size == 0 or body.size % width:
+            return None
+        index = body.reshape(-1, width)
+        offsets, sizes = index[:, 0], index[:, 1]
+        if (offsets[0] != 0
+                or np.any(offsets[1:] != offsets[:-1] + sizes[:-1])
+                or offsets[-1] + sizes[-1] != self._file.stat().st_size):
+            return None
+        return index
+
+    def _iter_blocks(self, blocks: List[Tuple[int, int]]
+                     ) -> Iterator[Tuple[Tuple, Any]]:
+        """Iterate over the items of the given (offset, count) blocks."""
+        with self._lock:
+            with open(self._file, "rb") as f:
+                for offset, count in blocks:
+                    f.seek(offset)
+                    for _ in range(count):
+                        yield dill.load(f)
 
     def delete(self):
         """Delete the array file."""
         self.flush()
         if self._file and self._file.exists():
+            # Sealed chunks are shared by content, they are left to GC
+            self.index_file.unlink(missing_ok=True)
+            self.tail_file.unlink(missing_ok=True)
             self._file.unlink()
             self._file = None
 
@@ -237,7 +467,10 @@ class Array:
 
     def _iter_file(self) -> Iterator[Tuple[Tuple, Any]]:
         """Iterate over file-stored items."""
-        if self._file and self._file.exists():
+        if self._storage_type == "chunks":
+            for row in self._read_rows():
+                yield tuple(row["pos"].tolist()), row["value"]
+        elif self._file and self._file.exists():
             with self._lock:
                 with open(self._file, "rb") as f:
                     while True:
@@ -247,6 +480,70 @@ class Array:
                         except EOFError:
                             break
 
+    def read_items(self, position: Tuple[int, int] = (0, 0), count: int = 100
+                   ) -> Tuple[List[Tuple[Tuple, Any]], Tuple[int, int]]:
+        """Read items in iteration order from a resume position.
+
+        The slice of the array is not applied.
+
+        Args:
+            position: (offset, index) where offset is the byte offset in the
+                data file (the number of stored records for 'chunks'
+                storage) and index the index in the memory buffer
+            count: Maximum number of items to read
+
+        Returns:
+            Items read and the position after them
+        """
+        offset, index = position
+        items = []
+        if self._storage_type == "chunks":
+            # Chunks may have been sealed by another writer since
+            self._manifest = None
+            items = self._read_records(offset, count)
+            offset += len(items)
+        elif self._file and self._file.exists():
+            with self._lock:
+                with open(self._file, "rb") as f:
+                    f.seek(offset)
+                    while len(items) < count:
+                        try:
+                            items.append(dill.load(f))
+                        except (EOFError, pickle.UnpicklingError):
+                            # End of file, or an item still being written
+                            break
+                        offset = f.tell()
+        if len(items) < count:
+            buffer = self._list[index:index + count - len(items)]
+            items.extend(buffer)
+            index += len(buffer)
+        return items, (offset, index)
+
+    def _read_records(self, start: int, count: int) -> List[Tuple[Tuple, Any]]:
+        """Read count stored records from record number start ('chunks')."""
+        dtype = self._row_dtype()
+        if dtype is None:
+            return []
+        from .chunk import load_chunk
+
+        parts, stop, first = [], start + count, 0
+        for ref, n, *_ in self._manifest["chunks"]:
+            if first + n > start and first < stop:
+                rows = np.frombuffer(
+                    load_chunk(ref, base_path=self.storage.base_path),
+                    dtype=dtype)
+                parts.append(rows[max(start - first, 0):stop - first])
+            first += n
+        if stop > first and self.tail_file.exists():
+            skip = max(start - first, 0)
+            parts.append(
+                np.fromfile(self.tail_file,
+                            dtype=dtype,
+                            count=stop - first - skip,
+                            offset=skip * dtype.itemsize))
+        return [(tuple(row["pos"].tolist()), row["value"])
+                for part in parts for row in part]
+
     def iter(self) -> Iterator[Tuple[Tuple, Any]]:
         """Iterate over all items (file + memory buffer)."""
         self.flush()
@@ -355,9 +652,16 @@ class Array:
                 return data
             return np.array([])
 
+        # Handle binary chunked storage
+        if self._storage_type == "chunks":
+            self.flush()
+            return self._scatter_rows(self._read_rows())
+
         # Handle regular sparse storage (append-based)
-        pos, data = self.items()
+        return self._scatter(*self.items())
 
+    def _scatter(self, pos: List, data: List) -> np.ndarray:
+        """Scatter (positions, values) into a dense array of full shape."""
         # Always return full array, ignore self._slice
         shape = tuple(r - l for l, r in zip(self.lu, self.rd))
         pos = np.asarray(pos) - np.asarray(self.lu)
@@ -383,6 +687,45 @@ class Array:
             x[tuple(pos.T)] = data
         return x
 
+    def _toarray_region(self, region: List[Tuple[int, int]]) -> np.ndarray:
+        """Dense array in which at least the given region is filled in.
+
+        Only the blocks whose bounding box intersects the region are read
+        from disk, the rest of the result is left at the fill value.
+
+        Args:
+            region: Half-open (start, stop) range for each outer dimension,
+                relative to ``lu``
+        """
+        self.flush()
+        if self._storage_type == "chunks" and self._load_manifest():
+            return self._scatter_rows(
+                self._read_rows([
+                    chunk for chunk in self._manifest["chunks"]
+                    if all(l < stop + o and r > start + o for l, r, (
+                        start, stop), o in zip(chunk[2], chunk[3], region,
+                                               self.lu))
+                ]))
+
+        index = self._load_index()
+        if index is None or index.shape[1] != 3 + 2 * len(self.lu):
+            return self.toarray()
+
+        ndim = len(self.lu)
+        lu, rd = index[:, 3:3 + ndim], index[:, 3 + ndim:]
+        mask = np.ones(len(index), dtype=bool)
+        for k, (start, stop) in enumerate(region):
+            start, stop = start + self.lu[k], stop + self.lu[k]
+            mask &= (lu[:, k] < stop) & (rd[:, k] > start)
+        if not mask.any():
+            return self.toarray()
+
+        pos, data = [], []
+        for p, value in self._iter_blocks(index[mask][:, [0, 2]].tolist()):
+            pos.append(p)
+            data.append(value)
+        return self._scatter(pos, data)
+
     def _index_in_slice(self, slice_obj: slice | int, index: int) -> bool:
         """Check if index is within a slice."""
         if isinstance(slice_obj, int):
@@ -469,6 +812,28 @@ class Array:
 
         return tuple(slice_list), contract, reversed_dims
 
+    def _slice_region(self, full_slice: tuple, contract: list
+                      ) -> Optional[List[Tuple[int, int]]]:
+        """Outer region selected by a normalized slice, or None for all."""
+        if self._storage_type not in ("data", "chunks") or not self.lu:
+            return None
+        region = []
+        for i, n in enumerate(r - l for l, r in zip(self.lu, self.rd)):
+            s = full_slice[i] if i < len(full_slice) else slice(None)
+            if i in contract:
+                start = s.start if isinstance(s, slice) else s
+                if start is None or not 0 <= start < n:
+                    return None
+                region.append((start, start + 1))
+            else:
+                start = 0 if s.start is None else max(0, min(s.start, n))
+                stop = n if s.stop is None else max(0, min(s.stop, n))
+                region.append((start, stop))
+        if all(r == (0, n) for r, n in zip(
+                region, (r - l for l, r in zip(self.lu, self.rd)))):
+            return None
+        return region
+
     def __getitem__(self, slice_tuple):
         """Support numpy-style indexing."""
         # Convert single index to tuple
@@ -488,8 +853,12 @@ class Array:
 
         full_slice, contract, reversed_dims = self._full_slice(slice_tuple)
 
-        # Get full array
-        ret = self.toarray()
+        # Only read the blocks touching the requested outer region
+        region = self._slice_region(full_slice, contract)
+        if region is not None:
+            ret = self._toarray_region(region)
+        else:
+            ret = self.toarray()
 
         if ret.size == 0:
             return ret
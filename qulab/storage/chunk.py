@@ -1,9 +1,25 @@
 import hashlib
+import mmap
+import os
+import time
+import uuid
 import zlib
 from pathlib import Path
+from typing import Iterator
+
+import numpy as np
 
 DATAPATH = Path.home() / 'data'
 CHUNKSIZE = 1024 * 1024 * 4  # 4 MB
+PACKSIZE = 1024 * 1024 * 256  # 256 MB
+GRACE = 3600.0  # seconds before repack may touch a loose chunk
+
+# Entries of a pack index file, sorted by hash
+INDEX_DTYPE = np.dtype([('hash', 'S40'), ('offset', '<u8'), ('size', '<u8')])
+
+# Per-process caches: merged pack indexes by base path, maps of pack files
+_pack_indexes: dict[Path, tuple] = {}
+_pack_maps: dict[Path, mmap.mmap] = {}
 
 
 def set_data_path(base_path: str) -> None:
@@ -54,36 +70,316 @@ def load_chunk(file: str | Path, compressed: bool = False, base_path: Path | Non
     base = base_path if base_path is not None else get_data_path()
 
     if isinstance(file, Path):
-        filepath = base / file
+        hashstr = file.name
     elif isinstance(file, str):
         # Normalize path separators for cross-platform compatibility
         # Windows uses backslashes, but we need forward slashes for checks
         normalized = file.replace('\\', '/')
-        if normalized.startswith('chunks/'):
-            filepath = base / file
-        elif normalized.startswith('packs/'):
+        if normalized.startswith('packs/'):
             *filepath_parts, start, size = normalized.split('/')
             filepath = base / '/'.join(filepath_parts)
-            with open(filepath, 'rb') as f:
-                f.seek(int(start))
-                data = f.read(int(size))
-                if compressed:
-                    data = zlib.decompress(data)
-                return data
-        else:
-            # Assume it's a relative path or hash
-            # Use full hash for filename to match save_chunk behavior
-            filepath = base / 'chunks' / file[:2] / file[2:4] / file
+            data = _read_mapped(filepath, int(start), int(size))
+            if compressed:
+                data = zlib.decompress(data)
+            return data
+        hashstr = normalized.rsplit('/', 1)[-1]
     else:
         raise ValueError('Invalid file path: ' + str(file))
 
-    with open(filepath, 'rb') as f:
-        data = f.read()
+    # Repacked chunks are only found through the pack indexes. The cached
+    # index may predate the last repack, then the loose file is missing.
+    data = _load_packed(hashstr, base)
+    if data is None:
+        try:
+            with open(_loose_path(file, base), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = _load_packed(hashstr, base, reload=True)
+            if data is None:
+                raise
     if compressed:
         data = zlib.decompress(data)
     return data
 
 
+def _loose_path(file: str | Path, base: Path) -> Path:
+    if isinstance(file, Path) or file.replace('\\', '/').startswith('chunks/'):
+        return base / file
+    # Assume it's a hash
+    # Use full hash for filename to match save_chunk behavior
+    return base / 'chunks' / file[:2] / file[2:4] / file
+
+
+def _map_pack(path: Path) -> mmap.mmap:
+    with open(path, 'rb') as f:
+        m = _pack_maps[path] = mmap.mmap(f.fileno(), 0,
+                                         access=mmap.ACCESS_READ)
+    return m
+
+
+def _read_mapped(path: Path, start: int, size: int) -> bytes:
+    if size == 0:
+        return b''
+    m = _pack_maps.get(path)
+    if m is None or m.closed or start + size > len(m):
+        # Packs written by pack_chunk may have grown since they were mapped
+        m = _map_pack(path)
+    try:
+        data = m[start:start + size]
+    except ValueError:
+        # Closed by a repack in another thread meanwhile
+        data = _map_pack(path)[start:start + size]
+    if len(data) != size:
+        raise IOError(f'{path} ends before the {size} bytes at offset '
+                      f'{start}')
+    return data
+
+
+def _close_map(path: Path):
+    # Closed right away, an open map keeps the file from being removed on
+    # Windows
+    m = _pack_maps.pop(path, None)
+    if m is not None:
+        m.close()
+
+
+def _load_packed(hashstr: str, base: Path, reload: bool = False) -> bytes | None:
+    index = _pack_indexes.get(base)
+    if index is None or reload:
+        index = _pack_indexes[base] = _merge_indexes(base, _read_packs(base))
+    paths, hashes, packs, offsets, sizes = index
+    key = hashstr.encode()
+    i = hashes.searchsorted(key)
+    if len(key) != 40 or i == len(hashes) or hashes[i] != key:
+        return None
+    try:
+        return _read_mapped(paths[packs[i]], int(offsets[i]), int(sizes[i]))
+    except FileNotFoundError:
+        # The pack was compacted away after the index was read
+        return None
+
+
+def _read_packs(base: Path) -> dict[str, np.ndarray]:
+    packs = {}
+    for idx in sorted((base / 'packs').glob('*.idx')):
+        try:
+            packs[idx.with_suffix('.pack').name] = np.load(idx)
+        except FileNotFoundError:
+            continue
+    return packs
+
+
+def _merge_indexes(base: Path, packs: dict[str, np.ndarray]) -> tuple:
+    """Merge pack indexes into one sorted by hash.
+
+    Returns:
+        Tuple of the pack paths and the hash, pack number, offset and size
+        columns
+    """
+    entries = np.concatenate([np.empty(0, INDEX_DTYPE), *packs.values()])
+    numbers = np.repeat(np.arange(len(packs), dtype=np.uint32),
+                        [len(e) for e in packs.values()])
+    order = entries['hash'].argsort(kind='stable')
+    entries = entries[order]
+    return ([base / 'packs' / pack for pack in packs], entries['hash'],
+            numbers[order], entries['offset'], entries['size'])
+
+
+def _entries(index: np.ndarray) -> list[tuple[str, int, int]]:
+    return [(h.decode(), offset, size) for h, offset, size in index.tolist()]
+
+
+def read_pack_index(base_path: Path | None = None) -> dict[str, tuple[str, int, int]]:
+    """Read the indexes of all pack files.
+
+    Each pack `packs/<name>.pack` is accompanied by `packs/<name>.idx`, an
+    npy file of INDEX_DTYPE records sorted by hash, written once the pack
+    is complete.
+
+    Args:
+        base_path: Optional base path (defaults to DATAPATH)
+
+    Returns:
+        Mapping of chunk hash to (pack file name, offset, size)
+    """
+    base = base_path if base_path is not None else get_data_path()
+    return {
+        hashstr: (pack, start, size)
+        for pack, index in _read_packs(base).items()
+        for hashstr, start, size in _entries(index)
+    }
+
+
+def iter_loose_chunks(base_path: Path | None = None) -> Iterator[Path]:
+    """Iterate over the chunk files under `chunks/`."""
+    base = base_path if base_path is not None else get_data_path()
+    for file in (base / 'chunks').glob('*/*/*'):
+        if len(file.name) == 40 and file.name.startswith(file.parent.parent.name):
+            yield file
+
+
+def _close_pack(f, entries: list[tuple[str, int, int]]):
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+    index = np.array(entries, dtype=INDEX_DTYPE)
+    index.sort(order='hash')
+    # Written as <name>.pack.tmp, so that a pack left by a crash is never
+    # taken for one written by pack_chunk
+    pack = Path(f.name).with_suffix('')
+    idx = pack.with_suffix('.idx')
+    tmp = idx.with_suffix('.tmp')
+    with open(tmp, 'wb') as out:
+        np.save(out, index)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(f.name, pack)
+    os.replace(tmp, idx)
+
+
+def _write_packs(base: Path, sources: list[tuple[str, Path, int, int]]) -> int:
+    count, f, entries = 0, None, []
+    for hashstr, path, start, size in sources:
+        if f is not None and f.tell() + size > PACKSIZE:
+            _close_pack(f, entries)
+            f, entries = None, []
+        if f is None:
+            (base / 'packs').mkdir(parents=True, exist_ok=True)
+            f = open(base / 'packs' / f'{uuid.uuid4().hex}.pack.tmp', 'wb')
+            count += 1
+        with open(path, 'rb') as src:
+            src.seek(start)
+            data = src.read(size)
+        entries.append((hashstr, f.tell(), len(data)))
+        f.write(data)
+    if f is not None:
+        _close_pack(f, entries)
+    return count
+
+
+def repack_chunks(base_path: Path | None = None,
+                  live: set[str] | None = None,
+                  grace: float = GRACE,
+                  dry_run: bool = False) -> dict:
+    """Move loose chunks into pack files and drop unreferenced chunks.
+
+    Loose chunks younger than `grace` seconds are left alone, they may
+    belong to a record that is not committed yet. With `live` given, older
+    loose chunks not in it are deleted and packs holding such chunks are
+    rewritten without them. New packs and their indexes are complete
+    before any file is removed, so concurrent readers always find a copy.
+
+    Args:
+        base_path: Optional base path (defaults to DATAPATH)
+        live: Hashes of the referenced chunks, None to keep every chunk
+        grace: Minimum age in seconds of a loose chunk to be touched
+        dry_run: Only count what would be done
+
+    Returns:
+        Dict with the numbers of loose chunks `packed` and of chunks
+        `removed`, the bytes `freed` and the number of `packs` written
+    """
+    base = base_path if base_path is not None else get_data_path()
+    stats = {'packed': 0, 'removed': 0, 'freed': 0, 'packs': 0}
+
+    packs = {pack: _entries(index) for pack, index in _read_packs(base).items()}
+    stale = set()
+    if live is not None:
+        stale = {
+            pack
+            for pack, entries in packs.items()
+            if any(hashstr not in live for hashstr, *_ in entries)
+        }
+    kept = {
+        hashstr
+        for pack, entries in packs.items() if pack not in stale
+        for hashstr, *_ in entries
+    }
+
+    # Chunks to copy into new packs, as (hash, file, offset, size)
+    sources = []
+    for pack in sorted(stale):
+        for hashstr, start, size in packs[pack]:
+            if hashstr in live and hashstr not in kept:
+                kept.add(hashstr)
+                sources.append((hashstr, base / 'packs' / pack, start, size))
+            else:
+                stats['removed'] += 1
+                stats['freed'] += size
+
+    obsolete, leftover = [], []
+    now = time.time()
+    # Packs this function failed to remove, e.g. when they were still
+    # mapped by another process on Windows, and packs left unfinished by a
+    # crash. Other index-less packs were written by pack_chunk and are
+    # still referenced by their paths.
+    for file in (base / 'packs').glob('*.gc'):
+        pack = file.with_suffix('.pack')
+        if pack.name in packs:
+            continue  # Interrupted before its index was removed
+        elif pack.exists():
+            leftover.append(pack)
+        elif not dry_run:
+            file.unlink(missing_ok=True)
+    leftover.extend((base / 'packs').glob('*.pack.tmp'))
+    for file in leftover:
+        try:
+            st = file.stat()
+        except FileNotFoundError:
+            continue
+        if now - st.st_mtime >= grace:
+            stats['freed'] += st.st_size
+            obsolete.append(file)
+    for file in sorted(iter_loose_chunks(base)):
+        try:
+            st = file.stat()
+        except FileNotFoundError:
+            continue
+        if now - st.st_mtime < grace:
+            continue
+        if file.name in kept:
+            stats['freed'] += st.st_size
+        elif live is not None and file.name not in live:
+            stats['removed'] += 1
+            stats['freed'] += st.st_size
+        else:
+            kept.add(file.name)
+            sources.append((file.name, file, 0, st.st_size))
+            stats['packed'] += 1
+        obsolete.append(file)
+
+    if dry_run:
+        return stats
+
+    stats['packs'] = _write_packs(base, sources)
+    for pack in stale:
+        _remove_pack(base / 'packs' / pack)
+    for file in obsolete:
+        if file.suffix == '.pack':
+            _remove_pack(file)
+            continue
+        try:
+            file.unlink(missing_ok=True)
+        except PermissionError:
+            pass  # Still mapped elsewhere, removed by the next run
+    _pack_indexes.pop(base, None)
+    return stats
+
+
+def _remove_pack(file: Path):
+    # The marker tells the next run the pack is garbage once its index
+    # is gone, unlike the index-less packs written by pack_chunk
+    marker = file.with_suffix('.gc')
+    marker.touch()
+    file.with_suffix('.idx').unlink(missing_ok=True)
+    _close_map(file)
+    try:
+        file.unlink(missing_ok=True)
+    except PermissionError:
+        return  # Still mapped elsewhere, removed by the next run
+    marker.unlink(missing_ok=True)
+
+
 def pack_chunk(pack: str, chunkfile: str) -> str:
     pack = get_data_path() / 'packs' / pack
     pack.parent.mkdir(parents=True, exist_ok=True)
@@ -263,6 +263,49 @@ def dataset_delete(id, data_path):
         click.echo(f"Dataset {id} not found")
 
 
+# Maintenance commands
+def _echo_chunk_stats(stats):
+    click.echo(f"Packed {stats['packed']} loose chunks, wrote {stats['packs']} packs")
+    click.echo(f"Removed {stats['removed']} chunks, "
+               f"freed {stats['freed'] / 2**20:.1f} MB")
+
+
+@storage.command("repack")
+@click.option("--grace", default=3600.0, help="Skip chunks younger than this (seconds)")
+@click.option(
+    "--data-path",
+    "-d",
+    default=lambda: str(get_config_value("data", Path, Path.home() / ".qulab" / "storage")),
+    help="Storage path",
+)
+def storage_repack(grace, data_path):
+    """Move loose chunk files into pack files."""
+    from .local import LocalStorage
+
+    storage = LocalStorage(data_path)
+    _echo_chunk_stats(storage.repack(grace=grace))
+
+
+@storage.command("gc")
+@click.option("--grace", default=3600.0, help="Skip chunks younger than this (seconds)")
+@click.option("--dry-run", "-n", is_flag=True, help="Only report what would be done")
+@click.option(
+    "--data-path",
+    "-d",
+    default=lambda: str(get_config_value("data", Path, Path.home() / ".qulab" / "storage")),
+    help="Storage path",
+)
+def storage_gc(grace, dry_run, data_path):
+    """Remove unreferenced chunks and pack the others."""
+    from .local import LocalStorage
+
+    storage = LocalStorage(data_path)
+    stats = storage.gc(grace=grace, dry_run=dry_run)
+    if dry_run:
+        click.echo("Dry run, nothing changed")
+    _echo_chunk_stats(stats)
+
+
 # Server commands
 @storage.group()
 def server():
@@ -279,7 +322,13 @@ def server():
     default=lambda: str(get_config_value("data", Path, default=Path.home() / ".qulab" / "storage")),
     help="Storage path",
 )
-def server_start(host, port, data_path):
+@click.option(
+    "--workers",
+    "-w",
+    default=4,
+    help="Number of worker threads, 0 to handle requests one at a time",
+)
+def server_start(host, port, data_path, workers):
     """Start storage server."""
     import asyncio
 
@@ -287,7 +336,7 @@ def server_start(host, port, data_path):
     from .server import StorageServer
 
     storage = LocalStorage(data_path)
-    srv = StorageServer(storage, host=host, port=port)
+    srv = StorageServer(storage, host=host, port=port, workers=workers)
     click.echo(f"Starting storage server on {host}:{port}")
     click.echo(f"Data path: {data_path}")
     click.echo("Press Ctrl+C to stop")
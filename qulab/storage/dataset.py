@@ -6,10 +6,13 @@ remains in dataset.py for backward compatibility.
 
 from __future__ import annotations
 
+import atexit
+import time
 from datetime import datetime
-from typing import TYPE_CHECKING, Any, Optional
+from typing import TYPE_CHECKING, Any, Optional, Sequence
 
 import numpy as np
+from loguru import logger
 
 if TYPE_CHECKING:
     from .array import Array
@@ -22,8 +25,19 @@ class Dataset:
 
     This class unifies the previous Record concept from scan.record
     with a more general dataset storage system.
+
+    Appended values are buffered by the arrays, and the bounds (lu/rd) of
+    the arrays are kept in memory and written to the database in one
+    transaction on flush(), or once FLUSH_SIZE points have been appended
+    or FLUSH_INTERVAL seconds have passed since the last write. Datasets
+    with unwritten appends are kept alive until flush() or close(), and
+    flushed at exit otherwise.
     """
 
+    FLUSH_SIZE = 1000  # Appended points before the bounds are written
+    FLUSH_INTERVAL = 1.0  # Seconds before the bounds are written
+    ARRAY_STORAGE_TYPE = "data"  # Storage type of arrays created by append
+
     def __init__(
         self,
         id: Optional[int],
@@ -50,6 +64,10 @@ class Dataset:
         self._atime: Optional[datetime] = None
         # Attributes cache for scalar metadata
         self._attrs: Optional[dict] = None
+        # Write-behind state for array bounds
+        self._dirty: set[str] = set()
+        self._pending = 0
+        self._last_flush = time.monotonic()
 
     @property
     def attrs(self) -> dict:
@@ -409,12 +427,17 @@ class Dataset:
 
         return self._arrays[key]
 
-    def create_array(self, key: str, inner_shape: tuple = ()) -> "Array":
+    def create_array(self,
+                     key: str,
+                     inner_shape: tuple = (),
+                     storage_type: str = "data") -> "Array":
         """Create a new array in this dataset.
 
         Args:
             key: Array name
             inner_shape: Inner shape for nested arrays
+            storage_type: 'data' for pickled items, or 'chunks' for numeric
+                items stored in binary content-addressed chunks
 
         Returns:
             Array instance
@@ -431,7 +454,10 @@ class Dataset:
                     f"Array {key} already exists in dataset {self.id}")
 
         # Create the array
-        arr = Array.create(self.storage, self.id, key, inner_shape)
+        if storage_type not in ("data", "chunks"):
+            raise ValueError(f"Unknown storage type {storage_type!r}")
+        arr = Array.create(self.storage, self.id, key, inner_shape,
+                           storage_type)
 
         # Save to database
         with self.storage._get_session() as session:
@@ -444,6 +470,7 @@ class Dataset:
                 inner_shape=list(inner_shape),
                 lu=[],
                 rd=[],
+                storage_type=storage_type,
             )
             session.add(arr_model)
             session.commit()
@@ -509,46 +536,106 @@ class Dataset:
 
         self._arrays[key] = arr
 
+    def _array_for_append(self, key: str, value: Any) -> "Array":
+        """Get the array for key, creating it on the first append."""
+        try:
+            return self._arrays[key]
+        except KeyError:
+            pass
+        inner_shape = np.asarray(value).shape if hasattr(value,
+                                                         "shape") else ()
+        try:
+            self._arrays[key] = self.create_array(key, inner_shape,
+                                                  self.ARRAY_STORAGE_TYPE)
+        except ValueError:
+            # Array already exists, load it
+            self._arrays[key] = self.get_array(key)
+        return self._arrays[key]
+
     def append(self, position: tuple, data: dict[str, Any]):
         """Append data at a position.
 
-        This is compatible with the original Record.append method.
+        This is compatible with the original Record.append method. The
+        bounds of the arrays are written to the database later, see
+        flush().
 
         Args:
             position: Position tuple (level, step, pos, ...) or similar
             data: Dictionary of key -> value pairs
         """
         for key, value in data.items():
-            if key not in self._arrays:
-                # Auto-create array if needed
-                import numpy as np
-
-                inner_shape = np.asarray(value).shape if hasattr(
-                    value, "shape") else ()
-                try:
-                    self._arrays[key] = self.create_array(key, inner_shape)
-                except ValueError:
-                    # Array already exists, load it
-                    self._arrays[key] = self.get_array(key)
-
-            arr = self._arrays[key]
-            arr.append(position, value)
-
-            # Update database bounds
-            from .models import Array as ArrayModel
+            self._array_for_append(key, value).append(position, value)
+            self._dirty.add(key)
+        self._pending += 1
+        _unflushed.add(self)
+        self._maybe_flush()
 
-            with self.storage._get_session() as session:
-                arr_model = (session.query(ArrayModel).filter_by(
-                    dataset_id=self.id, name=key).first())
-                if arr_model:
-                    arr_model.lu = list(arr.lu)
-                    arr_model.rd = list(arr.rd)
-                    session.commit()
+    def append_many(self, positions: Sequence[tuple],
+                    data: Sequence[dict[str, Any]]):
+        """Append data at many positions.
+
+        Equivalent to calling append() for each pair of position and
+        data, but the bounds are written at most once.
+
+        Args:
+            positions: Position tuples
+            data: Dictionaries of key -> value pairs, one per position
+
+        Raises:
+            ValueError: If positions and data differ in length
+        """
+        if len(positions) != len(data):
+            raise ValueError(f"Got {len(positions)} positions for "
+                             f"{len(data)} data points")
+        for position, values in zip(positions, data):
+            for key, value in values.items():
+                self._array_for_append(key, value).append(position, value)
+                self._dirty.add(key)
+        self._pending += len(positions)
+        _unflushed.add(self)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        """Write the bounds if the size or time threshold is reached."""
+        if (self._pending >= self.FLUSH_SIZE or time.monotonic() -
+                self._last_flush >= self.FLUSH_INTERVAL):
+            self._flush_bounds()
+
+    def _flush_bounds(self):
+        """Write the bounds of all changed arrays in one transaction."""
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        if not self._dirty:
+            return
+        from .models import Array as ArrayModel
+
+        dirty, self._dirty = self._dirty, set()
+        with self.storage._get_session() as session:
+            arr_models = (session.query(ArrayModel).filter(
+                ArrayModel.dataset_id == self.id,
+                ArrayModel.name.in_(dirty)).all())
+            for arr_model in arr_models:
+                arr = self._arrays[arr_model.name]
+                arr_model.lu = list(arr.lu)
+                arr_model.rd = list(arr.rd)
+            session.commit()
 
     def flush(self):
-        """Flush all arrays to disk."""
+        """Flush all arrays to disk and their bounds to the database."""
         for arr in self._arrays.values():
             arr.flush()
+        self._flush_bounds()
+        _unflushed.discard(self)
+
+    def close(self):
+        """Flush the dataset, see flush()."""
+        self.flush()
+
+    def __enter__(self) -> "Dataset":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def delete(self):
         """Delete this dataset and all its arrays."""
@@ -556,6 +643,8 @@ class Dataset:
         from .models.config import decrement_config_ref
         from .models.script import decrement_script_ref
 
+        _unflushed.discard(self)
+
         # Delete array files
         for key in self.keys():
             try:
@@ -750,3 +839,17 @@ class Dataset:
             "mtime": self.mtime.isoformat() if self.mtime else None,
             "atime": self.atime.isoformat() if self.atime else None,
         }
+
+
+# Datasets appended to since their last flush()
+_unflushed: set[Dataset] = set()
+
+
+@atexit.register
+def _flush_unflushed():
+    for dataset in list(_unflushed):
+        try:
+            dataset.flush()
+        except Exception:
+            _unflushed.discard(dataset)
+            logger.exception(f"Failed to flush dataset {dataset.id} at exit")
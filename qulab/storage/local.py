@@ -471,6 +471,85 @@ class LocalStorage(Storage):
                 session, name=name, mime_type=mime_type
             )
 
+    # Maintenance API
+    def referenced_chunks(self) -> set:
+        """Collect the hashes of all chunks referenced by the storage.
+
+        Covers document data and content, dataset content, configs,
+        scripts, attachments and the chunks of 'chunks' arrays.
+
+        Returns:
+            Set of chunk hashes
+        """
+        import json
+
+        from sqlalchemy import select
+
+        from .models import Array as ArrayModel
+        from .models import Attachment as AttachmentModel
+        from .models import Config as ConfigModel
+        from .models import Dataset as DatasetModel
+        from .models import Document as DocumentModel
+        from .models import Script as ScriptModel
+
+        columns = [
+            DocumentModel.chunk_hash,
+            DocumentModel.content_hash,
+            DatasetModel.content_hash,
+            ConfigModel.config_hash,
+            ScriptModel.script_hash,
+            AttachmentModel.chunk_hash,
+        ]
+        live = set()
+        with self._get_session() as session:
+            for column in columns:
+                live.update(session.scalars(select(column).where(column.is_not(None))))
+            manifests = session.execute(
+                select(ArrayModel.dataset_id, ArrayModel.file_path).where(
+                    ArrayModel.storage_type == "chunks")).all()
+
+        for dataset_id, file_path in manifests:
+            try:
+                with open(self.datasets_path / str(dataset_id) / file_path) as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                continue  # Nothing flushed yet
+            live.update(ref for ref, *_ in manifest["chunks"])
+        return live
+
+    def repack(self, grace: float = 3600.0) -> dict:
+        """Move loose chunks into pack files.
+
+        Args:
+            grace: Minimum age in seconds of a loose chunk to be packed
+
+        Returns:
+            Dict of statistics, see `chunk.repack_chunks`
+        """
+        from .chunk import repack_chunks
+
+        return repack_chunks(self.base_path, grace=grace)
+
+    def gc(self, grace: float = 3600.0, dry_run: bool = False) -> dict:
+        """Reclaim the space of unreferenced chunks and pack the others.
+
+        Unreferenced loose chunks younger than `grace` seconds are kept,
+        since they may belong to records that are being written.
+
+        Args:
+            grace: Minimum age in seconds of a loose chunk to be touched
+            dry_run: Only count what would be done
+
+        Returns:
+            Dict of statistics, see `chunk.repack_chunks`
+        """
+        from .chunk import repack_chunks
+
+        return repack_chunks(self.base_path,
+                             live=self.referenced_chunks(),
+                             grace=grace,
+                             dry_run=dry_run)
+
 
 class AttachmentRef:
     """Lightweight reference to an attachment in local storage."""
@@ -102,7 +102,7 @@ class Array(Base):
 
     # Pattern-based storage for independent arrays
     pattern = Column(JSON, nullable=True)  # Generation pattern (linspace, etc.)
-    storage_type = Column(String, default="data")  # 'pattern' or 'data'
+    storage_type = Column(String, default="data")  # 'pattern', 'data' or 'chunks'
 
     # Relationship
     dataset = relationship("Dataset", back_populates="arrays")
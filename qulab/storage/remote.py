@@ -1,7 +1,12 @@
 """RemoteStorage implementation - ZMQ client for remote storage access."""
 
+import itertools
+import pickle
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
 from typing import TYPE_CHECKING, Any, Iterator, List, Optional
 
+import numpy as np
 import zmq
 
 from .base import Storage
@@ -13,6 +18,66 @@ if TYPE_CHECKING:
     from .document import Document
 
 
+def unpack_response(frames: list) -> Any:
+    """Rebuild a response from the frames sent by the server.
+
+    An ndarray is built on top of the received buffer without copying it.
+
+    Args:
+        frames: Received ZMQ frames
+
+    Returns:
+        Response object
+    """
+    header = pickle.loads(frames[0].bytes)
+    if len(frames) == 1:
+        return header
+    buffer = np.frombuffer(frames[1].buffer, dtype=header["dtype"])
+    return np.ndarray(header["shape"],
+                      dtype=buffer.dtype,
+                      buffer=buffer,
+                      strides=header["strides"])
+
+
+BATCH_SIZE = 100  # Calls per multi envelope
+
+
+class Batch:
+    """Calls collected by RemoteStorage.batch() to be sent together."""
+
+    def __init__(self):
+        self.calls: list[dict] = []
+        self.futures: list[Future] = []
+
+    def call(self, method: str, **kwargs) -> Future:
+        """Queue a call.
+
+        Args:
+            method: Method name to call
+            **kwargs: Method arguments
+
+        Returns:
+            Future of the response, done when the batch is sent
+        """
+        future = Future()
+        self.calls.append({"method": method, **kwargs})
+        self.futures.append(future)
+        return future
+
+    def resolve(self, results: list):
+        for future, result in zip(self.futures, results):
+            future.set_result(result)
+
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
+
+    def fail(self, exc: BaseException):
+        for future in self.futures:
+            if not future.done():
+                future.set_exception(exc)
+
+
 class RemoteStorage(Storage):
     """Remote storage client (ZMQ).
 
@@ -33,6 +98,7 @@ class RemoteStorage(Storage):
         self.server_address = server_address
         self.timeout = timeout
         self._socket = None  # For connection reuse
+        self._request_ids = itertools.count()
 
     @property
     def is_remote(self) -> bool:
@@ -56,8 +122,123 @@ class RemoteStorage(Storage):
             socket=self._socket,
             timeout=self.timeout,
         ) as sock:
-            sock.send_pyobj({"method": method, **kwargs})
-            return sock.recv_pyobj()
+            sock.send_pyobj({"method": method, "frames": True, **kwargs})
+            return unpack_response(sock.recv_multipart(copy=False))
+
+    def _envelopes(self, calls: list[dict], size: int) -> dict[bytes, tuple]:
+        """Split calls into multi envelopes keyed by request id."""
+        envelopes = {}
+        for start in range(0, len(calls), size):
+            request_id = str(next(self._request_ids)).encode()
+            envelopes[request_id] = (start, {
+                "method": "multi",
+                "calls": calls[start:start + size],
+                "request_id": request_id,
+                "frames": True,
+            })
+        return envelopes
+
+    def _call_many(self, calls: list[dict], size: int = BATCH_SIZE) -> list:
+        """Send calls in multi envelopes back to back and gather the replies.
+
+        Replies are matched to the envelopes by request id, so envelopes
+        handled out of order by the workers of the server are fine.
+        """
+        from qulab.sys.rpc.zmq_socket import ZMQContextManager
+
+        results = [None] * len(calls)
+        envelopes = self._envelopes(calls, size)
+        with ZMQContextManager(
+            zmq.DEALER,
+            connect=self.server_address,
+            socket=self._socket,
+            timeout=self.timeout,
+        ) as sock:
+            for _, message in envelopes.values():
+                sock.send_pyobj(message)
+            for _ in envelopes:
+                request_id, *frames = sock.recv_multipart(copy=False)
+                self._place(results, *envelopes[request_id.bytes],
+                            unpack_response(frames))
+        return results
+
+    async def _acall_many(self,
+                          calls: list[dict],
+                          size: int = BATCH_SIZE) -> list:
+        """Async variant of _call_many."""
+        import asyncio
+
+        from qulab.sys.rpc.zmq_socket import ZMQContextManager
+
+        results = [None] * len(calls)
+        envelopes = self._envelopes(calls, size)
+        async with ZMQContextManager(
+            zmq.DEALER,
+            connect=self.server_address,
+        ) as sock:
+            for _, message in envelopes.values():
+                await sock.send_pyobj(message)
+            for _ in envelopes:
+                request_id, *frames = await asyncio.wait_for(
+                    sock.recv_multipart(copy=False), self.timeout)
+                self._place(results, *envelopes[request_id.bytes],
+                            unpack_response(frames))
+        return results
+
+    @staticmethod
+    def _place(results: list, start: int, message: dict, response: Any):
+        count = len(message["calls"])
+        if isinstance(response, dict) and "error" in response:
+            # The envelope itself failed
+            response = [response] * count
+        results[start:start + count] = response
+
+    @contextmanager
+    def batch(self, size: int = BATCH_SIZE) -> Iterator[Batch]:
+        """Collect calls and send them together on exit.
+
+        Example:
+            >>> with storage.batch() as batch:
+            ...     infos = [batch.call("dataset_get", id=i) for i in ids]
+            >>> keys = [info.result()["keys"] for info in infos]
+
+        If sending the calls fails, their futures get the exception.
+
+        Args:
+            size: Number of calls per multi envelope
+
+        Yields:
+            Batch to queue calls on
+        """
+        batch = Batch()
+        try:
+            yield batch
+        except BaseException:
+            batch.cancel()
+            raise
+        try:
+            results = self._call_many(batch.calls, size)
+        except BaseException as e:
+            # The calls may have been sent, so they fail rather than cancel
+            batch.fail(e)
+            raise
+        batch.resolve(results)
+
+    @asynccontextmanager
+    async def abatch(self, size: int = BATCH_SIZE):
+        """Async variant of batch()."""
+        batch = Batch()
+        try:
+            yield batch
+        except BaseException:
+            batch.cancel()
+            raise
+        try:
+            results = await self._acall_many(batch.calls, size)
+        except BaseException as e:
+            batch.fail(e)
+            raise
+        batch.resolve(results)
 
     # Document API
     def create_document(
@@ -355,8 +536,9 @@ class RemoteDataset:
 
     def keys(self) -> list[str]:
         """Get array keys."""
-        info = self.get_info()
-        return info.get("keys", [])
+        if self._info is not None:
+            return self._info.get("keys", [])
+        return self.storage._call("dataset_keys", id=self.id)
 
     def append(self, position: tuple, data: dict[str, Any]) -> bool:
         """Append data to the dataset."""
@@ -367,6 +549,15 @@ class RemoteDataset:
         self._info = None
         return result
 
+    def append_many(self, positions: list[tuple],
+                    data: list[dict[str, Any]]) -> bool:
+        """Append data at many positions in one request."""
+        result = self.storage._call(
+            "dataset_append_many", id=self.id, positions=positions, data=data
+        )
+        self._info = None
+        return result
+
     def get_array(self, key: str) -> "RemoteArray":
         """Get a remote array proxy."""
         return RemoteArray(self.id, key, self.storage)
@@ -464,10 +655,36 @@ class RemoteArray:
             count=count,
         )
 
+    def iter_cursor(self, count: int = 100, start: int = 0
+                    ) -> Iterator[tuple]:
+        """Iterate over all (position, value) items.
+
+        Pages of count items are fetched through a server-side cursor, so
+        that each page costs the same no matter how far the iteration is.
+        """
+        result = self.storage._call(
+            "array_cursor",
+            dataset_id=self.dataset_id,
+            key=self.key,
+            start=start,
+            count=count,
+        )
+        try:
+            while True:
+                if isinstance(result, dict) and "error" in result:
+                    raise RuntimeError(result["error"])
+                yield from result["items"]
+                if result["cursor"] is None:
+                    return
+                result = self.storage._call(
+                    "array_cursor", cursor=result["cursor"], count=count)
+        finally:
+            if isinstance(result, dict) and result.get("cursor"):
+                self.storage._call("array_cursor_close",
+                                   cursor=result["cursor"])
+
     def toarray(self) -> Any:
         """Convert to numpy array."""
-        import numpy as np
-
         # Call server-side toarray to get proper shape
         result = self.storage._call(
             "array_toarray",
@@ -475,10 +692,10 @@ class RemoteArray:
             key=self.key,
         )
 
-        # Handle serialized array format
+        # Handle serialized array format of older servers
         if isinstance(result, dict) and "shape" in result:
             return np.array(result["data"]).reshape(result["shape"])
-        return np.array(result)
+        return np.asarray(result)
 
     def __repr__(self) -> str:
         return f"RemoteArray(dataset_id={self.dataset_id}, key={self.key!r})"
@@ -2,8 +2,14 @@
 
 import asyncio
 import pickle
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import nullcontext
 from typing import Any, Optional
 
+import numpy as np
 import zmq
 from loguru import logger
 
@@ -12,10 +18,107 @@ from qulab.sys.rpc.zmq_socket import ZMQContextManager
 from .local import LocalStorage
 
 
+# Handlers that modify a dataset or document, by the kind of object they
+# modify. With workers they are serialized per object.
+WRITE_METHODS = {
+    "dataset_append": "dataset",
+    "dataset_append_many": "dataset",
+    "dataset_delete": "dataset",
+    "dataset_add_tags": "dataset",
+    "dataset_remove_tags": "dataset",
+    "dataset_set_tags": "dataset",
+    "document_delete": "document",
+    "document_add_tags": "document",
+    "document_remove_tags": "document",
+    "document_set_tags": "document",
+}
+
+# Handlers that read the array files of a dataset, by the argument holding
+# the dataset id. They take the lock of the dataset, so that they do not
+# read a file while it is appended to.
+READ_METHODS = {
+    "dataset_keys": "id",
+    "array_getitem": "dataset_id",
+    "array_getitem_slice": "dataset_id",
+    "array_iter": "dataset_id",
+    "array_cursor": "dataset_id",
+    "array_toarray": "dataset_id",
+}
+
+LOCK_STRIPES = 64  # Locks shared by all the datasets and documents
+
+
+WORKER_READY = b"\x01"  # Sent by a worker thread once it is idle
+CURSOR_TTL = 60.0  # Seconds an idle cursor is kept
+MAX_CURSORS = 1024
+
+
+class Cursor:
+    """Resume point of an iteration over an array.
+
+    Keeps the array open together with the position after the last item
+    sent, so that the next page is read without going over the items
+    before it.
+    """
+
+    def __init__(self,
+                 array,
+                 dataset_id: int,
+                 position: tuple = (0, 0),
+                 index: int = 0):
+        self.array = array
+        self.dataset_id = dataset_id
+        self.position = position
+        self.index = index  # Number of items read so far
+        self.expires = time.monotonic() + CURSOR_TTL
+
+    def read(self, count: int) -> list:
+        """Read the next page of up to count items."""
+        items, self.position = self.array.read_items(self.position, count)
+        self.index += len(items)
+        self.expires = time.monotonic() + CURSOR_TTL
+        return items
+
+
+def pack_response(response: Any, frames: bool = True) -> list:
+    """Split a response into frames.
+
+    Numeric ndarrays are sent as a pickled header with dtype, shape and
+    strides followed by the raw buffer of the array, which is handed to
+    ZMQ without a copy. Anything else is pickled into a single frame.
+
+    Args:
+        response: Handler result
+        frames: Whether the client reads multipart responses, clients that
+            did not ask for them get everything in a single pickled frame
+
+    Returns:
+        List of frames
+    """
+    if (frames and isinstance(response, np.ndarray)
+            and response.dtype.kind in "biufc"):
+        if not (response.flags.c_contiguous or response.flags.f_contiguous):
+            response = np.ascontiguousarray(response)
+        header = {
+            "dtype": response.dtype.str,
+            "shape": response.shape,
+            "strides": response.strides,
+        }
+        return [pickle.dumps(header), response]
+    return [pickle.dumps(response)]
+
+
 class StorageServer:
     """Storage server - ZMQ RPC implementation.
 
     Provides remote access to a LocalStorage instance via ZMQ.
+
+    With workers, the ROUTER socket facing the clients is proxied to a
+    DEALER socket that hands requests out to a pool of worker threads, so
+    a slow request does not hold up the others. Every handler opens its
+    own session through LocalStorage. Writes to a dataset or document,
+    and reads of the array files of a dataset, are serialized by a lock
+    taken from a fixed set of locks by the hash of the object.
     """
 
     def __init__(
@@ -23,6 +126,7 @@ class StorageServer:
         storage: LocalStorage,
         host: str = "127.0.0.1",
         port: int = 6789,
+        workers: int = 4,
     ):
         """Initialize storage server.
 
@@ -30,12 +134,19 @@ class StorageServer:
             storage: LocalStorage instance to serve
             host: Host address to bind to
             port: Port to listen on
+            workers: Number of worker threads, 0 handles all requests in
+                order on the event loop
         """
         self.storage = storage
         self.host = host
         self.port = port
+        self.workers = workers
         self._running = False
         self._socket = None
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # Cursors by opaque id, and by (dataset_id, key, start) for array_iter
+        self._cursors: dict[Any, Cursor] = {}
+        self._cursors_lock = threading.Lock()
 
     @property
     def address(self) -> str:
@@ -65,6 +176,66 @@ class StorageServer:
             logger.exception(f"Error handling {method}")
             return {"error": str(e)}
 
+    async def respond(self, msg: bytes) -> list:
+        """Handle a pickled request and return the frames of the reply.
+
+        A request carrying a request_id gets it back as the first frame,
+        so that clients can have many requests in flight on one socket
+        and match the replies. Arrays are sent as multipart responses only
+        to clients that set the frames flag in their requests.
+        """
+        message = pickle.loads(msg)
+        request_id, frames = None, False
+        if isinstance(message, dict):
+            request_id = message.pop("request_id", None)
+            frames = message.pop("frames", False)
+        with self._lock(message) or nullcontext():
+            response = await self.handle(message)
+        if request_id is None:
+            return pack_response(response, frames)
+        return [request_id, *pack_response(response, frames)]
+
+    def _lock(self, message: dict) -> Optional[threading.Lock]:
+        """Lock of the object a request modifies or reads the files of.
+
+        None for requests that need no lock.
+        """
+        if not isinstance(message, dict):
+            return None
+        method = message.get("method")
+        if method in WRITE_METHODS:
+            kind, id = WRITE_METHODS[method], message.get("id")
+        elif method in READ_METHODS:
+            kind, id = "dataset", message.get(READ_METHODS[method])
+            if id is None and message.get("cursor") is not None:
+                with self._cursors_lock:
+                    cursor = self._cursors.get(message["cursor"])
+                id = cursor and cursor.dataset_id
+        else:
+            return None
+        if id is None:
+            return None
+        return self._locks[hash((kind, id)) % LOCK_STRIPES]
+
+    async def handle_ping(self) -> bool:
+        """Check that the server is alive."""
+        return True
+
+    async def handle_multi(self, calls: list) -> list:
+        """Handle many requests sent in one envelope.
+
+        Args:
+            calls: Request messages, handled in order
+
+        Returns:
+            List of the responses
+        """
+        results = []
+        for message in calls:
+            with self._lock(message) or nullcontext():
+                results.append(await self.handle(message))
+        return results
+
     # Document handlers
     async def handle_document_create(
         self,
@@ -188,6 +359,12 @@ class StorageServer:
         ds = self.storage.get_dataset(id)
         return ds.to_dict()
 
+    async def handle_dataset_keys(self, id: int) -> list:
+        """Get the array keys of a dataset."""
+        from .dataset import Dataset
+
+        return Dataset(id, self.storage).keys()
+
     async def handle_dataset_query(
         self,
         name: Optional[str] = None,
@@ -244,6 +421,15 @@ class StorageServer:
         ds.flush()
         return True
 
+    async def handle_dataset_append_many(
+        self, id: int, positions: list, data: list
+    ) -> bool:
+        """Append data at many positions to a dataset."""
+        ds = self.storage.get_dataset(id)
+        ds.append_many(positions, data)
+        ds.flush()
+        return True
+
     async def handle_dataset_delete(self, id: int) -> bool:
         """Delete a dataset."""
         from .local import DatasetRef
@@ -289,8 +475,6 @@ class StorageServer:
         Returns:
             Sliced array data
         """
-        import numpy as np
-
         # Deserialize slice parameters
         slice_tuple = []
         for s in slices:
@@ -311,45 +495,108 @@ class StorageServer:
         # Apply slicing on server side - only transfer the sliced data
         result = arr[slice_tuple]
 
-        # Convert numpy arrays to lists for serialization
-        if isinstance(result, np.ndarray):
-            return result.tolist()
         return result
 
-    async def handle_array_iter(
-        self, dataset_id: int, key: str, start: int = 0, count: int = 100
-    ) -> list:
-        """Iterate over array items."""
+    def _open_cursor(self, dataset_id: int, key: str, start: int = 0) -> Cursor:
+        """Open a cursor on an array, positioned at item start."""
         ds = self.storage.get_dataset(dataset_id)
         arr = ds.get_array(key)
         arr.flush()
-
-        results = []
-        for i, item in enumerate(arr.iter()):
-            if i < start:
-                continue
-            if len(results) >= count:
+        cursor = Cursor(arr, dataset_id)
+        while cursor.index < start:
+            if not cursor.read(min(start - cursor.index, 1000)):
                 break
-            results.append(item)
+        return cursor
+
+    def _take_cursor(self, cursor_id: Any) -> Optional[Cursor]:
+        """Remove a cursor for use, None if it is unknown or expired."""
+        with self._cursors_lock:
+            cursor = self._cursors.pop(cursor_id, None)
+        if cursor is None or cursor.expires < time.monotonic():
+            return None
+        return cursor
+
+    def _put_cursor(self, cursor_id: Any, cursor: Cursor):
+        """Keep a cursor and evict idle ones.
+
+        Cursors are kept in order of last use, expired cursors and the
+        least recently used ones beyond MAX_CURSORS are dropped.
+        """
+        now = time.monotonic()
+        with self._cursors_lock:
+            self._cursors[cursor_id] = cursor
+            for k in list(self._cursors):
+                if (self._cursors[k].expires >= now
+                        and len(self._cursors) <= MAX_CURSORS):
+                    break
+                del self._cursors[k]
+
+    async def handle_array_iter(
+        self, dataset_id: int, key: str, start: int = 0, count: int = 100
+    ) -> list:
+        """Iterate over array items.
+
+        A page ending before the last item leaves a cursor behind, so
+        that the request for the next page resumes where this one ended.
+        """
+        cursor = self._take_cursor((dataset_id, key, start))
+        if cursor is None:
+            cursor = self._open_cursor(dataset_id, key, start)
+        results = cursor.read(count)
+        if len(results) == count:
+            self._put_cursor((dataset_id, key, cursor.index), cursor)
         return results
 
+    async def handle_array_cursor(
+        self,
+        cursor: Optional[str] = None,
+        dataset_id: Optional[int] = None,
+        key: Optional[str] = None,
+        start: int = 0,
+        count: int = 100,
+    ) -> dict:
+        """Read the next page of array items through a cursor.
+
+        Args:
+            cursor: Cursor id returned by the previous page, None to open a
+                new cursor on the array at item start
+            dataset_id: Dataset ID, for a new cursor
+            key: Array key, for a new cursor
+            start: Index of the first item, for a new cursor
+            count: Maximum number of items in the page
+
+        Returns:
+            Dictionary with the items of the page and the id of the cursor
+            for the next page, which is None once the array is exhausted
+        """
+        if cursor is None:
+            cursor_id = uuid.uuid4().hex
+            cur = self._open_cursor(dataset_id, key, start)
+        else:
+            cursor_id = cursor
+            cur = self._take_cursor(cursor)
+            if cur is None:
+                raise KeyError(f"Cursor {cursor} not found or expired")
+        items = cur.read(count)
+        if len(items) < count:
+            return {"cursor": None, "items": items}
+        self._put_cursor(cursor_id, cur)
+        return {"cursor": cursor_id, "items": items}
+
+    async def handle_array_cursor_close(self, cursor: str) -> bool:
+        """Drop a cursor before it expires."""
+        return self._take_cursor(cursor) is not None
+
     async def handle_array_toarray(
         self, dataset_id: int, key: str
     ) -> Any:
         """Convert array to numpy array."""
-        import numpy as np
-
         ds = self.storage.get_dataset(dataset_id)
         arr = ds.get_array(key)
         arr.flush()
 
         # Get the full array with proper shape
-        result = arr.toarray()
-
-        # Convert numpy array to list for serialization
-        if isinstance(result, np.ndarray):
-            return {"shape": result.shape, "dtype": str(result.dtype), "data": result.tolist()}
-        return result
+        return arr.toarray()
 
     async def run(self):
         """Run the server."""
@@ -357,6 +604,10 @@ class StorageServer:
         logger.info(f"Starting storage server on {self.address}")
         logger.info(f"Data path: {self.storage.base_path}")
 
+        if self.workers > 0:
+            await asyncio.to_thread(self._run_workers)
+            return
+
         async with ZMQContextManager(
             zmq.ROUTER, bind=self.address
         ) as sock:
@@ -366,16 +617,86 @@ class StorageServer:
                     identity, msg = await asyncio.wait_for(
                         sock.recv_multipart(), timeout=1.0
                     )
-                    message = pickle.loads(msg)
-                    response = await self.handle(message)
                     await sock.send_multipart(
-                        [identity, pickle.dumps(response)]
+                        [identity, *await self.respond(msg)], copy=False
                     )
                 except asyncio.TimeoutError:
                     continue
                 except Exception as e:
                     logger.exception("Error in server loop")
 
+    def _run_workers(self):
+        """Proxy requests between the clients and the worker threads.
+
+        Workers announce they are idle with WORKER_READY, then again with
+        every reply. A request is only handed to an idle worker, the others
+        wait in the queue of the proxy, so a short request never waits
+        behind a long one while a worker is free.
+        """
+        backend_address = f"inproc://storage-workers-{id(self)}"
+
+        with ZMQContextManager(zmq.ROUTER, bind=self.address) as frontend:
+            backend = frontend.context.socket(zmq.ROUTER)
+            backend.setsockopt(zmq.LINGER, 0)
+            backend.bind(backend_address)
+
+            threads = [
+                threading.Thread(target=self._serve_worker,
+                                 args=(frontend.context, backend_address),
+                                 name=f"storage-worker-{i}",
+                                 daemon=True) for i in range(self.workers)
+            ]
+            for thread in threads:
+                thread.start()
+
+            idle, requests = deque(), deque()
+            poller = zmq.Poller()
+            poller.register(frontend, zmq.POLLIN)
+            poller.register(backend, zmq.POLLIN)
+            try:
+                while self._running:
+                    events = dict(poller.poll(100))
+                    if backend in events:
+                        worker, *reply = backend.recv_multipart(copy=False)
+                        idle.append(worker)
+                        if len(reply) > 1 or reply[0].bytes != WORKER_READY:
+                            frontend.send_multipart(reply, copy=False)
+                    if frontend in events:
+                        requests.append(frontend.recv_multipart(copy=False))
+                    while idle and requests:
+                        backend.send_multipart(
+                            [idle.popleft(), *requests.popleft()],
+                            flags=zmq.NOBLOCK,
+                            copy=False)
+            finally:
+                self._running = False
+                for thread in threads:
+                    thread.join()
+                backend.close()
+
+    def _serve_worker(self, context: zmq.Context, address: str):
+        """Handle requests in a worker thread with its own event loop."""
+        loop = asyncio.new_event_loop()
+        sock = context.socket(zmq.DEALER)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(address)
+        sock.send(WORKER_READY)
+        try:
+            while self._running:
+                if not sock.poll(100):
+                    continue
+                identity, msg = sock.recv_multipart()
+                try:
+                    sock.send_multipart(
+                        [identity, *loop.run_until_complete(self.respond(msg))],
+                        copy=False)
+                except Exception:
+                    logger.exception("Error in storage worker")
+                    sock.send(WORKER_READY)
+        finally:
+            sock.close()
+            loop.close()
+
     def stop(self):
         """Stop the server."""
         self._running = False
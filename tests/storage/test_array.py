@@ -500,3 +500,188 @@ class TestArray:
         # Should be able to read all data
         items = list(array.iter())
         assert len(items) == 2
+
+    def test_flush_writes_block_index(self, local_storage: LocalStorage):
+        """Test that every flush appends one entry to the sidecar index."""
+        array = Array.create(local_storage, 1, "test", inner_shape=())
+
+        for i in range(3):
+            for j in range(4):
+                array.append((i, j), float(i * 4 + j))
+            array.flush()
+
+        index = array._load_index()
+        assert array.index_file.exists()
+        assert index.shape == (3, 3 + 2 * 2)
+        # (offset, size, count, lu..., rd...)
+        assert index[:, 2].tolist() == [4, 4, 4]
+        assert index[1, 3:].tolist() == [1, 0, 2, 4]
+        assert index[-1, 0] + index[-1, 1] == array.file.stat().st_size
+
+    def test_getitem_reads_matching_blocks_only(self, local_storage: LocalStorage):
+        """Test that slicing only reads the blocks intersecting the slice."""
+        array = Array.create(local_storage, 1, "test", inner_shape=())
+        expected = np.arange(20 * 5, dtype=float).reshape(20, 5)
+
+        for i in range(20):
+            for j in range(5):
+                array.append((i, j), expected[i, j])
+            array.flush()
+
+        read = []
+        iter_blocks = array._iter_blocks
+
+        def spy(blocks):
+            read.extend(blocks)
+            return iter_blocks(blocks)
+
+        array._iter_blocks = spy
+
+        np.testing.assert_array_equal(array[7, :], expected[7, :])
+        assert len(read) == 1
+
+        read.clear()
+        np.testing.assert_array_equal(array[2:5, 1:3], expected[2:5, 1:3])
+        assert len(read) == 3
+
+        np.testing.assert_array_equal(array[:, 2], expected[:, 2])
+
+    def test_getitem_without_index(self, local_storage: LocalStorage):
+        """Test slicing still works when the index is missing or stale."""
+        array = Array.create(local_storage, 1, "test", inner_shape=())
+        for i in range(4):
+            array.append((i,), float(i))
+        array.flush()
+
+        array.index_file.unlink()
+        assert array._load_index() is None
+        assert array[2] == 2.0
+
+        array.append((4,), 4.0)
+        array.flush()
+        # The new entry does not start at offset 0, so it is not trusted
+        assert array._load_index() is None
+        np.testing.assert_array_equal(array[1:4], [1.0, 2.0, 3.0])
+
+    def test_read_items(self, local_storage: LocalStorage):
+        """Test reading pages of items from a resume position."""
+        array = Array.create(local_storage, 1, "test", inner_shape=())
+        for i in range(10):
+            array.append((i,), float(i))
+            if i == 6:
+                array.flush()
+
+        items, position = [], (0, 0)
+        while True:
+            page, position = array.read_items(position, 4)
+            if not page:
+                break
+            items.extend(page)
+        # Items 7 to 9 are still in the memory buffer
+        assert position == (array.file.stat().st_size, 3)
+        assert items == list(array.iter())
+
+
+class TestChunkedArray:
+    """Test the binary chunked storage type."""
+
+    def test_roundtrip(self, local_storage: LocalStorage):
+        """Test that appended items come back from the tail and chunks."""
+        array = Array.create(local_storage, 1, "test", storage_type="chunks")
+        array.CHUNKSIZE = 10 * 24  # 10 records of (2 x int64, float64)
+        expected = np.arange(6 * 7, dtype=float).reshape(6, 7)
+
+        for i in range(6):
+            for j in range(7):
+                array.append((i, j), expected[i, j])
+            array.flush()
+
+        manifest = array._load_manifest()
+        assert len(manifest["chunks"]) == 4
+        assert [c[1] for c in manifest["chunks"]] == [10] * 4
+        assert array.tail_file.stat().st_size == 2 * 24
+
+        np.testing.assert_array_equal(array.toarray(), expected)
+        np.testing.assert_array_equal(array[4, 2:5], expected[4, 2:5])
+        assert array[5, 6] == expected[5, 6]
+        assert list(array.iter())[8] == ((1, 1), 8.0)
+
+        loaded = Array.load(local_storage, 1, "test",
+                            array.file.relative_to(
+                                local_storage.datasets_path / "1"),
+                            array.lu, array.rd, (), storage_type="chunks")
+        np.testing.assert_array_equal(loaded.toarray(), expected)
+
+    def test_chunks_are_content_addressed(self, local_storage: LocalStorage):
+        """Test that sealed chunks are saved through save_chunk."""
+        from qulab.storage.chunk import load_chunk
+
+        array = Array.create(local_storage, 1, "test", storage_type="chunks")
+        array.CHUNKSIZE = 4 * 24
+        for i in range(4):
+            array.append((i, ), np.complex128(i + 1j))
+        array.flush()
+
+        ref, count, lu, rd = array._load_manifest()["chunks"][0]
+        assert (count, lu, rd) == (4, [0], [4])
+        rows = np.frombuffer(load_chunk(ref, base_path=local_storage.base_path),
+                             dtype=array._row_dtype())
+        np.testing.assert_array_equal(rows["value"], np.arange(4) + 1j)
+
+    def test_inner_shape(self, local_storage: LocalStorage):
+        """Test items with an inner shape."""
+        array = Array.create(local_storage, 1, "test", inner_shape=(3, ),
+                             storage_type="chunks")
+        for i in range(5):
+            array.append((i, ), np.arange(3) * i)
+
+        result = array.toarray()
+        assert result.shape == (5, 3)
+        assert result.dtype == np.int64
+        np.testing.assert_array_equal(result[:, 1], np.arange(5))
+
+    def test_rejects_mismatched_items(self, local_storage: LocalStorage):
+        """Test that items not matching the first flush are rejected."""
+        array = Array.create(local_storage, 1, "test", storage_type="chunks")
+        array.append((0, ), 1)
+        array.flush()
+
+        array.append((1, ), 1.5)
+        with pytest.raises(TypeError):
+            array.flush()
+
+        array.append((1, ), "text")
+        with pytest.raises(TypeError):
+            array.flush()
+
+    def test_dataset_append(self, local_storage: LocalStorage):
+        """Test arrays created by Dataset.append with 'chunks' storage."""
+        from qulab.storage.dataset import Dataset
+
+        ref = Dataset.create(local_storage, "test_dataset", description={})
+        dataset = ref.get()
+        dataset.ARRAY_STORAGE_TYPE = "chunks"
+        for i in range(3):
+            for j in range(2):
+                dataset.append((i, j), {"x": float(i + j)})
+        dataset.flush()
+
+        x = ref.get().get_array("x")
+        assert x._storage_type == "chunks"
+        np.testing.assert_array_equal(x.toarray(), [[0, 1], [1, 2], [2, 3]])
+
+    def test_read_items(self, local_storage: LocalStorage):
+        """Test reading pages of records across chunks and the tail."""
+        array = Array.create(local_storage, 1, "test", storage_type="chunks")
+        array.CHUNKSIZE = 4 * 16
+        for i in range(11):
+            array.append((i, ), float(i))
+        array.flush()
+        assert len(array._load_manifest()["chunks"]) == 2
+
+        page, position = array.read_items((3, 0), 7)
+        assert [pos for pos, _ in page] == [(i, ) for i in range(3, 10)]
+        assert position == (10, 0)
+        page, position = array.read_items(position, 7)
+        assert page == [((10, ), 10.0)]
+        assert array.read_items(position, 7) == ([], (11, 0))
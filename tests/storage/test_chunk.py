@@ -6,10 +6,18 @@ from pathlib import Path
 
 import pytest
 
+import numpy as np
+
+from qulab.storage import chunk
 from qulab.storage.chunk import (
+    INDEX_DTYPE,
     delete_chunk,
     get_data_path,
+    iter_loose_chunks,
     load_chunk,
+    pack_chunk,
+    read_pack_index,
+    repack_chunks,
     save_chunk,
     set_data_path,
 )
@@ -182,3 +190,181 @@ class TestChunk:
         # Load using Path object
         loaded = load_chunk(rel_path, compressed=False, base_path=temp_storage_path)
         assert loaded == data
+
+
+class TestPack:
+    """Test pack files built by repack_chunks."""
+
+    def test_repack_moves_loose_chunks(self, temp_storage_path: Path):
+        """Test loose chunks are packed and still load by hash."""
+        blobs = [f"chunk {i}".encode() * (i + 1) for i in range(10)]
+        paths = [save_chunk(b, base_path=temp_storage_path)[0] for b in blobs]
+        load_chunk(paths[0].name, base_path=temp_storage_path)
+
+        stats = repack_chunks(temp_storage_path, grace=0)
+
+        assert stats["packed"] == 10
+        assert stats["packs"] == 1
+        assert list(iter_loose_chunks(temp_storage_path)) == []
+        index = read_pack_index(temp_storage_path)
+        assert set(index) == {p.name for p in paths}
+        for path, blob in zip(paths, blobs):
+            assert load_chunk(path.name, base_path=temp_storage_path) == blob
+            assert load_chunk(str(path), base_path=temp_storage_path) == blob
+
+    def test_repack_compressed(self, temp_storage_path: Path):
+        """Test compressed chunks load from packs."""
+        data = b"compress me " * 100
+        path, _ = save_chunk(data, compressed=True, base_path=temp_storage_path)
+        repack_chunks(temp_storage_path, grace=0)
+        assert load_chunk(path.name, compressed=True,
+                          base_path=temp_storage_path) == data
+
+    def test_repack_respects_grace(self, temp_storage_path: Path):
+        """Test young loose chunks are left alone."""
+        save_chunk(b"young", base_path=temp_storage_path)
+        stats = repack_chunks(temp_storage_path, live=set(), grace=3600)
+        assert stats == {"packed": 0, "removed": 0, "freed": 0, "packs": 0}
+        assert len(list(iter_loose_chunks(temp_storage_path))) == 1
+
+    def test_sweep_loose_and_packed(self, temp_storage_path: Path):
+        """Test unreferenced chunks are dropped from loose files and packs."""
+        keep, _ = save_chunk(b"keep", base_path=temp_storage_path)
+        drop, _ = save_chunk(b"drop", base_path=temp_storage_path)
+        repack_chunks(temp_storage_path, grace=0)
+        loose, _ = save_chunk(b"loose garbage", base_path=temp_storage_path)
+
+        stats = repack_chunks(temp_storage_path, live={keep.name}, grace=0)
+
+        assert stats["removed"] == 2
+        assert stats["freed"] == len(b"drop") + len(b"loose garbage")
+        assert set(read_pack_index(temp_storage_path)) == {keep.name}
+        assert len(list((temp_storage_path / "packs").glob("*.pack"))) == 1
+        assert load_chunk(keep.name, base_path=temp_storage_path) == b"keep"
+        for path in [drop, loose]:
+            with pytest.raises(FileNotFoundError):
+                load_chunk(path.name, base_path=temp_storage_path)
+
+    def test_dry_run(self, temp_storage_path: Path):
+        """Test a dry run counts but changes nothing."""
+        path, _ = save_chunk(b"garbage", base_path=temp_storage_path)
+        stats = repack_chunks(temp_storage_path, live=set(), grace=0,
+                              dry_run=True)
+        assert stats["removed"] == 1
+        assert (temp_storage_path / path).exists()
+
+    def test_duplicate_loose_chunk_removed(self, temp_storage_path: Path):
+        """Test a chunk saved again after packing is deduplicated."""
+        path, _ = save_chunk(b"again", base_path=temp_storage_path)
+        repack_chunks(temp_storage_path, grace=0)
+        save_chunk(b"again", base_path=temp_storage_path)
+
+        stats = repack_chunks(temp_storage_path, grace=0)
+
+        assert stats["packed"] == 0
+        assert stats["freed"] == len(b"again")
+        assert not (temp_storage_path / path).exists()
+        assert load_chunk(path.name, base_path=temp_storage_path) == b"again"
+
+    def test_pack_index_is_sorted(self, temp_storage_path: Path):
+        """Test pack indexes are sorted binary records."""
+        for i in range(50):
+            save_chunk(f"{i}".encode(), base_path=temp_storage_path)
+        repack_chunks(temp_storage_path, grace=0)
+
+        idx, = (temp_storage_path / "packs").glob("*.idx")
+        index = np.load(idx)
+        assert index.dtype == INDEX_DTYPE
+        assert len(index) == 50
+        assert np.all(index["hash"][:-1] < index["hash"][1:])
+
+    def test_stale_cache_after_compaction(self, temp_storage_path: Path):
+        """Test a reader with an outdated index finds compacted chunks."""
+        keep, _ = save_chunk(b"keep", base_path=temp_storage_path)
+        drop, _ = save_chunk(b"drop", base_path=temp_storage_path)
+        repack_chunks(temp_storage_path, grace=0)
+        assert load_chunk(keep.name, base_path=temp_storage_path) == b"keep"
+        stale = chunk._pack_indexes[temp_storage_path]
+
+        repack_chunks(temp_storage_path, live={keep.name}, grace=0)
+        # As seen by another process that has not mapped the new pack
+        chunk._pack_indexes[temp_storage_path] = stale
+        chunk._pack_maps.clear()
+
+        assert load_chunk(keep.name, base_path=temp_storage_path) == b"keep"
+        with pytest.raises(FileNotFoundError):
+            load_chunk(drop.name, base_path=temp_storage_path)
+
+    def test_repack_closes_maps(self, temp_storage_path: Path):
+        """Test maps of removed packs are closed, not just dropped."""
+        keep, _ = save_chunk(b"keep", base_path=temp_storage_path)
+        drop, _ = save_chunk(b"drop", base_path=temp_storage_path)
+        repack_chunks(temp_storage_path, grace=0)
+        assert load_chunk(keep.name, base_path=temp_storage_path) == b"keep"
+        old, = [m for p, m in chunk._pack_maps.items()
+                if p.parent == temp_storage_path / "packs"]
+
+        repack_chunks(temp_storage_path, live={keep.name}, grace=0)
+        assert old.closed
+        assert all(p.exists() for p in chunk._pack_maps)
+        assert load_chunk(keep.name, base_path=temp_storage_path) == b"keep"
+
+    def test_truncated_pack_raises(self, temp_storage_path: Path):
+        """Test an entry past the end of its pack is an error, not short
+        data."""
+        path, _ = save_chunk(b"some chunk data", base_path=temp_storage_path)
+        repack_chunks(temp_storage_path, grace=0)
+        pack, = (temp_storage_path / "packs").glob("*.pack")
+        pack.write_bytes(pack.read_bytes()[:-4])
+        chunk._pack_maps.clear()
+
+        with pytest.raises(IOError, match="offset"):
+            load_chunk(path.name, base_path=temp_storage_path)
+
+    def test_repack_keeps_pack_chunk_packs(self, temp_storage_path: Path):
+        """Test index-less packs written by pack_chunk are not garbage."""
+        set_data_path(str(temp_storage_path))
+        first, _ = save_chunk(b"first", base_path=temp_storage_path)
+        path = pack_chunk("legacy.pack", str(first))
+
+        repack_chunks(temp_storage_path, live=set(), grace=0)
+
+        assert (temp_storage_path / "packs" / "legacy.pack").exists()
+        assert load_chunk(path, base_path=temp_storage_path) == b"first"
+
+    def test_repack_removes_leftover_packs(self, temp_storage_path: Path,
+                                           monkeypatch):
+        """Test packs that could not be removed, or were left by a crash,
+        are removed by the next run."""
+        drop, _ = save_chunk(b"drop", base_path=temp_storage_path)
+        repack_chunks(temp_storage_path, grace=0)
+        pack, = (temp_storage_path / "packs").glob("*.pack")
+        crashed = temp_storage_path / "packs" / "crashed.pack.tmp"
+        crashed.write_bytes(b"partial")
+
+        unlink = Path.unlink
+
+        def mapped(self, missing_ok=False):
+            if self == pack:
+                raise PermissionError(self)
+            unlink(self, missing_ok=missing_ok)
+
+        monkeypatch.setattr(Path, "unlink", mapped)
+        repack_chunks(temp_storage_path, live=set(), grace=0)
+        monkeypatch.undo()
+        assert pack.exists() and pack.with_suffix(".gc").exists()
+        assert not pack.with_suffix(".idx").exists()
+
+        repack_chunks(temp_storage_path, live=set(), grace=0)
+        assert list((temp_storage_path / "packs").iterdir()) == []
+
+    def test_pack_chunk_path_after_append(self, temp_storage_path: Path):
+        """Test pack paths stay readable while pack_chunk appends."""
+        set_data_path(str(temp_storage_path))
+        first, _ = save_chunk(b"first", base_path=temp_storage_path)
+        second, _ = save_chunk(b"second", base_path=temp_storage_path)
+
+        path1 = pack_chunk("legacy", str(first))
+        assert load_chunk(path1, base_path=temp_storage_path) == b"first"
+        path2 = pack_chunk("legacy", str(second))
+        assert load_chunk(path2, base_path=temp_storage_path) == b"second"
@@ -345,6 +345,87 @@ class TestDataset:
         items = list(value_array.iter())
         assert len(items) == 9
 
+    def test_append_bounds_written_on_flush(self, local_storage: LocalStorage):
+        """Test that bounds reach the database on flush, not per append."""
+        ref = Dataset.create(local_storage, "test_dataset", description={})
+        dataset = ref.get()
+
+        dataset.append((0, 0), {"x": 1.0})
+        dataset.append((2, 3), {"x": 2.0})
+        assert dataset.get_array("x").rd == (3, 4)
+        assert ref.get().get_array("x").rd == ()
+
+        dataset.flush()
+        reloaded = ref.get().get_array("x")
+        assert reloaded.lu == (0, 0)
+        assert reloaded.rd == (3, 4)
+        assert reloaded[2, 3] == 2.0
+
+    def test_append_bounds_written_on_close(self,
+                                            local_storage: LocalStorage):
+        """Test that closing a dataset, or leaving its context, writes the
+        bounds."""
+        ref = Dataset.create(local_storage, "test_dataset", description={})
+        with ref.get() as dataset:
+            dataset.append((1, 2), {"x": 1.0})
+        assert ref.get().get_array("x").rd == (2, 3)
+
+        dataset = ref.get()
+        dataset.append((3, 0), {"x": 2.0})
+        dataset.close()
+        assert ref.get().get_array("x").rd == (4, 3)
+
+    def test_append_bounds_written_at_exit(self, local_storage: LocalStorage):
+        """Test that datasets dropped without flush() are flushed at exit."""
+        from qulab.storage import dataset as dataset_module
+
+        ref = Dataset.create(local_storage, "test_dataset", description={})
+        dataset = ref.get()
+        dataset.append((1, 2), {"x": 1.0})
+        dataset.append((4, 0), {"x": 2.0})
+        del dataset
+        assert ref.get().get_array("x").rd == ()
+
+        dataset_module._flush_unflushed()
+        reloaded = ref.get().get_array("x")
+        assert reloaded.lu == (1, 0)
+        assert reloaded.rd == (5, 3)
+        assert len(list(reloaded.iter())) == 2
+        assert not dataset_module._unflushed
+
+    def test_append_flush_size(self, local_storage: LocalStorage, monkeypatch):
+        """Test that bounds are written once FLUSH_SIZE points are appended."""
+        monkeypatch.setattr(Dataset, "FLUSH_SIZE", 4)
+        ref = Dataset.create(local_storage, "test_dataset", description={})
+        dataset = ref.get()
+
+        for i in range(3):
+            dataset.append((i, ), {"x": float(i)})
+        assert ref.get().get_array("x").rd == ()
+        dataset.append((3, ), {"x": 3.0})
+        assert ref.get().get_array("x").rd == (4, )
+
+    def test_append_many(self, local_storage: LocalStorage):
+        """Test bulk appends."""
+        ref = Dataset.create(local_storage, "test_dataset", description={})
+        dataset = ref.get()
+
+        positions = [(i, j) for i in range(3) for j in range(4)]
+        dataset.append_many(positions, [{
+            "x": float(i),
+            "y": np.full(2, i)
+        } for i, _ in enumerate(positions)])
+        dataset.flush()
+
+        x = ref.get().get_array("x")
+        assert x.shape == (3, 4)
+        np.testing.assert_array_equal(x.toarray(),
+                                      np.arange(12.0).reshape(3, 4))
+        assert len(ref.get().get_array("y").value()) == 12
+
+        with pytest.raises(ValueError):
+            dataset.append_many([(0, 0)], [])
+
     def test_create_dataset_without_description(self, local_storage: LocalStorage):
         """Test creating dataset without explicit description."""
         ref = Dataset.create(local_storage, "test_dataset", description={})
@@ -0,0 +1,112 @@
+"""Tests for the ndarray transport between StorageServer and RemoteStorage."""
+
+import numpy as np
+import pytest
+import zmq
+
+from qulab.storage.remote import unpack_response
+from qulab.storage.server import pack_response
+
+
+def transfer(response):
+    """Send a response through a ZMQ socket pair and rebuild it."""
+    ctx = zmq.Context.instance()
+    address = f"inproc://transport-{id(response)}"
+    with ctx.socket(zmq.PAIR) as server, ctx.socket(zmq.PAIR) as client:
+        server.bind(address)
+        client.connect(address)
+        server.send_multipart(pack_response(response), copy=False)
+        return unpack_response(client.recv_multipart(copy=False))
+
+
+class TestArrayTransport:
+    """Test sending ndarrays as a header and a raw buffer."""
+
+    @pytest.mark.parametrize("dtype", ["<f8", "<c16", ">i4", "<c8", "?"])
+    def test_dtypes(self, dtype):
+        """Test that numeric dtypes round-trip without loss."""
+        scale = 1 + 1j if np.dtype(dtype).kind == "c" else 1
+        x = (np.arange(24) * scale).astype(dtype)
+        x = x.reshape(2, 3, 4)
+
+        frames = pack_response(x)
+        assert len(frames) == 2
+        y = transfer(x)
+        assert y.dtype == x.dtype
+        np.testing.assert_array_equal(y, x)
+
+    def test_layouts(self):
+        """Test Fortran order, non-contiguous and empty arrays."""
+        x = np.asfortranarray(np.random.rand(5, 7) + 1j)
+        y = transfer(x)
+        assert y.flags.f_contiguous
+        np.testing.assert_array_equal(y, x)
+
+        np.testing.assert_array_equal(transfer(x[::2, 1::3]), x[::2, 1::3])
+        assert transfer(np.empty((0, 3))).shape == (0, 3)
+
+    def test_received_array_is_writable(self):
+        """Test that the rebuilt array can be modified in place."""
+        y = transfer(np.zeros(4))
+        y[0] = 1
+        assert y.tolist() == [1, 0, 0, 0]
+
+    def test_other_responses(self):
+        """Test that other responses are pickled in a single frame."""
+        for response in [None, {"error": "x"}, [1, 2], np.array(["a", "b"])]:
+            assert len(pack_response(response)) == 1
+            result = transfer(response)
+            if isinstance(response, np.ndarray):
+                np.testing.assert_array_equal(result, response)
+            else:
+                assert result == response
+
+
+class TestResponseFormat:
+    """Test that multipart responses are only sent to clients asking."""
+
+    @pytest.fixture
+    def array_id(self, local_storage):
+        ref = local_storage.create_dataset("transport", description={})
+        ds = ref.get()
+        for i in range(6):
+            ds.append((i, ), {"x": i + 0.5j})
+        ds.flush()
+        return ref.id
+
+    def respond(self, local_storage, message):
+        import asyncio
+        import pickle
+
+        from qulab.storage.server import StorageServer
+
+        srv = StorageServer(local_storage, workers=0)
+        return asyncio.run(srv.respond(pickle.dumps(message)))
+
+    def test_old_client(self, local_storage, array_id):
+        """Test that a request without the frames flag gets one frame."""
+        frames = self.respond(local_storage, {
+            "method": "array_toarray",
+            "dataset_id": array_id,
+            "key": "x"
+        })
+        ctx = zmq.Context.instance()
+        with ctx.socket(zmq.PAIR) as server, ctx.socket(zmq.PAIR) as client:
+            server.bind("inproc://old-client")
+            client.connect("inproc://old-client")
+            server.send_multipart(frames)
+            # What clients using recv_pyobj read
+            result = client.recv_pyobj()
+            assert not client.getsockopt(zmq.RCVMORE)
+        np.testing.assert_array_equal(result, np.arange(6) + 0.5j)
+
+    def test_frames_flag(self, local_storage, array_id):
+        """Test that the frames flag gets a header and a raw buffer."""
+        frames = self.respond(local_storage, {
+            "method": "array_toarray",
+            "dataset_id": array_id,
+            "key": "x",
+            "frames": True
+        })
+        assert len(frames) == 2
+        assert isinstance(frames[1], np.ndarray)
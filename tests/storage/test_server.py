@@ -0,0 +1,309 @@
+"""Tests for the worker pool of StorageServer."""
+
+import asyncio
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from qulab.storage.local import LocalStorage
+from qulab.storage.remote import RemoteStorage
+from qulab.storage import server as server_module
+from qulab.storage.server import StorageServer
+
+
+class SlowServer(StorageServer):
+    """Storage server with a handler that blocks its worker."""
+
+    async def handle_sleep(self, seconds: float) -> bool:
+        time.sleep(seconds)
+        return True
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def server(local_storage: LocalStorage):
+    """Run a storage server with workers in a background thread."""
+    srv = SlowServer(local_storage, port=free_port(), workers=4)
+    thread = threading.Thread(target=srv.run_sync, daemon=True)
+    thread.start()
+    time.sleep(0.2)
+    yield srv
+    srv.stop()
+    thread.join(timeout=5)
+
+
+class TestStorageServerWorkers:
+    """Test concurrent request handling."""
+
+    def test_slow_request_does_not_block(self, server: SlowServer):
+        """Test that ping is answered while another request is running."""
+        slow = threading.Thread(target=RemoteStorage(server.address)._call,
+                                args=("sleep", ),
+                                kwargs={"seconds": 1.0})
+        slow.start()
+        time.sleep(0.1)
+
+        start = time.perf_counter()
+        assert RemoteStorage(server.address)._call("ping") is True
+        assert time.perf_counter() - start < 0.5
+        slow.join()
+
+    def test_requests_go_to_idle_workers(self, server: SlowServer):
+        """Test that no request is queued behind a busy worker while
+        another worker is idle."""
+        slow = [
+            threading.Thread(target=RemoteStorage(server.address)._call,
+                             args=("sleep", ),
+                             kwargs={"seconds": 1.0}) for _ in range(3)
+        ]
+        for t in slow:
+            t.start()
+        time.sleep(0.1)
+
+        remote = RemoteStorage(server.address)
+        start = time.perf_counter()
+        for _ in range(8):
+            assert remote._call("ping") is True
+        assert time.perf_counter() - start < 0.5
+        for t in slow:
+            t.join()
+
+    def test_writes_to_one_dataset(self, server: SlowServer,
+                                   local_storage: LocalStorage):
+        """Test that appends from many clients to one dataset all land."""
+        ref = local_storage.create_dataset("shared", description={})
+
+        def append(client):
+            remote = RemoteStorage(server.address)
+            for j in range(10):
+                remote.get_dataset(ref.id).append((client, j),
+                                                  {"x": float(client * 10 + j)})
+
+        clients = [threading.Thread(target=append, args=(i, ))
+                   for i in range(4)]
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+
+        x = ref.get().get_array("x").toarray()
+        np.testing.assert_array_equal(x, np.arange(40.0).reshape(4, 10))
+
+    def test_remote_array_is_writable(self, server: SlowServer,
+                                      local_storage: LocalStorage):
+        """Test that arrays received without a copy can be modified."""
+        ref = local_storage.create_dataset("writable", description={})
+        ds = ref.get()
+        for i in range(4):
+            ds.append((i, ), {"x": float(i)})
+        ds.flush()
+
+        x = RemoteStorage(server.address).get_dataset(ref.id).get_array(
+            "x").toarray()
+        x[0] = 10
+        np.testing.assert_array_equal(x, [10.0, 1.0, 2.0, 3.0])
+
+    def test_locks_are_striped(self, local_storage: LocalStorage):
+        """Test that reads and writes of a dataset share a fixed lock."""
+        srv = StorageServer(local_storage, workers=0)
+        locks = {
+            id(srv._lock({"method": "dataset_append", "id": i}))
+            for i in range(1000)
+        }
+        assert locks <= set(map(id, srv._locks))
+        assert len(srv._locks) == server_module.LOCK_STRIPES
+
+        write = srv._lock({"method": "dataset_append_many", "id": 7})
+        assert srv._lock({"method": "array_toarray", "dataset_id": 7,
+                          "key": "x"}) is write
+        assert srv._lock({"method": "array_iter", "dataset_id": 7,
+                          "key": "x"}) is write
+        assert srv._lock({"method": "ping"}) is None
+
+        srv._cursors["c"] = server_module.Cursor(None, 7)
+        assert srv._lock({"method": "array_cursor", "cursor": "c"}) is write
+
+    def test_errors_are_returned(self, server: SlowServer):
+        """Test that handler errors reach the client."""
+        result = RemoteStorage(server.address)._call("nonexistent")
+        assert "error" in result
+
+
+class TestArrayCursors:
+    """Test server-side cursors over array items."""
+
+    @pytest.fixture
+    def array_server(self, local_storage: LocalStorage):
+        ref = local_storage.create_dataset("cursors", description={})
+        ds = ref.get()
+        for i in range(25):
+            ds.append((i, ), {"x": float(i)})
+        ds.flush()
+        return StorageServer(local_storage, workers=0), ref.id
+
+    def test_array_iter_resumes(self, array_server, monkeypatch):
+        """Test that array_iter pages resume from the previous page."""
+        srv, id = array_server
+        opened = []
+        open_cursor = srv._open_cursor
+        monkeypatch.setattr(
+            srv, "_open_cursor",
+            lambda *args: opened.append(args) or open_cursor(*args))
+
+        items = []
+        for start in range(0, 30, 10):
+            items.extend(asyncio.run(srv.handle_array_iter(id, "x", start, 10)))
+        assert [v for _, v in items] == [float(i) for i in range(25)]
+        assert opened == [(id, "x", 0)]
+        # The exhausted iteration leaves no cursor behind
+        assert srv._cursors == {}
+
+        page = asyncio.run(srv.handle_array_iter(id, "x", 20, 3))
+        assert [p for p, _ in page] == [(20, ), (21, ), (22, )]
+
+    def test_array_cursor(self, array_server):
+        """Test paging with opaque cursor ids."""
+        srv, id = array_server
+        result = asyncio.run(srv.handle_array_cursor(dataset_id=id, key="x",
+                                                     start=5, count=15))
+        assert result["items"][0] == ((5, ), 5.0)
+        cursor = result["cursor"]
+        result = asyncio.run(srv.handle_array_cursor(cursor=cursor, count=15))
+        assert [v for _, v in result["items"]] == [20.0, 21.0, 22.0, 23.0, 24.0]
+        assert result["cursor"] is None
+
+        with pytest.raises(KeyError):
+            asyncio.run(srv.handle_array_cursor(cursor=cursor))
+
+    def test_idle_cursors_are_evicted(self, array_server, monkeypatch):
+        """Test eviction of expired cursors and of cursors beyond the cap."""
+        srv, id = array_server
+        monkeypatch.setattr(server_module, "MAX_CURSORS", 2)
+        ids = [
+            asyncio.run(srv.handle_array_cursor(dataset_id=id, key="x",
+                                                count=1))["cursor"]
+            for _ in range(3)
+        ]
+        assert list(srv._cursors) == ids[1:]
+
+        srv._cursors[ids[1]].expires = 0
+        asyncio.run(srv.handle_array_cursor(dataset_id=id, key="x", count=1))
+        assert ids[1] not in srv._cursors
+        assert ids[2] in srv._cursors
+        assert asyncio.run(srv.handle_array_cursor_close(ids[2]))
+
+    def test_remote_iter_cursor(self, server: SlowServer,
+                                local_storage: LocalStorage):
+        """Test iterating over a remote array page by page."""
+        ref = local_storage.create_dataset("remote", description={})
+        ds = ref.get()
+        for i in range(25):
+            ds.append((i, ), {"x": float(i)})
+        ds.flush()
+
+        array = RemoteStorage(server.address).get_dataset(ref.id).get_array("x")
+        assert [v for _, v in array.iter_cursor(count=4)] == list(
+            map(float, range(25)))
+
+        it = array.iter_cursor(count=4)
+        next(it)
+        it.close()
+        assert server._cursors == {}
+
+
+
+class TestBatchedCalls:
+    """Test multi envelopes and pipelined requests."""
+
+    def test_respond_echoes_request_id(self, local_storage: LocalStorage):
+        """Test that tagged requests get their id back first."""
+        import pickle
+
+        srv = StorageServer(local_storage, workers=0)
+        frames = asyncio.run(srv.respond(pickle.dumps({
+            "method": "multi",
+            "calls": [{"method": "ping"}, {"method": "nonexistent"}],
+            "request_id": b"7",
+        })))
+        assert frames[0] == b"7"
+        ping, error = pickle.loads(frames[1])
+        assert ping is True
+        assert "error" in error
+
+        frames = asyncio.run(srv.respond(pickle.dumps({"method": "ping"})))
+        assert pickle.loads(frames[0]) is True
+
+    def test_batch(self, server: SlowServer, local_storage: LocalStorage):
+        """Test that batched calls resolve in order across envelopes."""
+        ids = [
+            local_storage.create_dataset(f"ds{i}", description={}).id
+            for i in range(25)
+        ]
+        remote = RemoteStorage(server.address)
+        with remote.batch(size=4) as batch:
+            infos = [batch.call("dataset_get", id=id) for id in ids]
+            ping = batch.call("ping")
+            missing = batch.call("dataset_get", id=10**6)
+            assert not ping.done()
+
+        assert [f.result()["name"] for f in infos] == [
+            f"ds{i}" for i in range(25)
+        ]
+        assert ping.result() is True
+        assert "error" in missing.result()
+
+    def test_batch_cancelled_on_error(self, server: SlowServer):
+        """Test that nothing is sent when the body of the batch raises."""
+        remote = RemoteStorage(server.address)
+        with pytest.raises(ValueError):
+            with remote.batch() as batch:
+                future = batch.call("ping")
+                raise ValueError()
+        assert future.cancelled()
+
+    def test_batch_fails_when_sending_fails(self, monkeypatch):
+        """Test that the futures get the error of a failed send."""
+        remote = RemoteStorage("tcp://127.0.0.1:1")
+
+        def call_many(calls, size):
+            raise ConnectionError("no reply")
+
+        monkeypatch.setattr(remote, "_call_many", call_many)
+        with pytest.raises(ConnectionError):
+            with remote.batch() as batch:
+                future = batch.call("ping")
+        with pytest.raises(ConnectionError):
+            future.result(timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_abatch_fails_when_sending_fails(self, monkeypatch):
+        """Test the async variant of a failed send."""
+        remote = RemoteStorage("tcp://127.0.0.1:1")
+
+        async def acall_many(calls, size):
+            raise ConnectionError("no reply")
+
+        monkeypatch.setattr(remote, "_acall_many", acall_many)
+        with pytest.raises(ConnectionError):
+            async with remote.abatch() as batch:
+                future = batch.call("ping")
+        with pytest.raises(ConnectionError):
+            future.result(timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_abatch(self, server: SlowServer,
+                          local_storage: LocalStorage):
+        """Test the async variant of batch()."""
+        id = local_storage.create_dataset("async", description={}).id
+        remote = RemoteStorage(server.address)
+        async with remote.abatch(size=2) as batch:
+            futures = [batch.call("dataset_get", id=id) for _ in range(5)]
+        assert [f.result()["name"] for f in futures] == ["async"] * 5
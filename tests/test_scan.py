@@ -1,2 +1,1150 @@
+import asyncio
+import pickle
+
+import dill
+import numpy as np
+import pytest
+import pytest_asyncio
+import zmq
+
+from qulab.scan import Scan
+from qulab.scan import server
+from qulab.scan.models import Record as RecordInDB
+from qulab.scan.models import create_engine, create_tables, sessionmaker
+from qulab.scan.record import BufferList, _recv_array
+from qulab.scan.scan import _vectorize_level
+from qulab.scan.server import pack_array
+
+
+@pytest.fixture(autouse=True)
+def plan_cache(tmp_path, monkeypatch):
+    from qulab.scan import scan
+
+    monkeypatch.setattr(scan, 'plan_cache_path', tmp_path / 'plans')
+    monkeypatch.setattr(scan, '_compiled_plans', {})
+    return tmp_path / 'plans'
+
+
 def test():
     assert 1 == 1
+
+
+def _fill(bufferlist, shape, value):
+    bufferlist.lu = (0, ) * len(shape)
+    bufferlist.rd = (1, ) * len(shape)
+    for pos in np.ndindex(*shape):
+        bufferlist.append(pos, value(*pos))
+    return bufferlist
+
+
+def test_bufferlist_columnar_roundtrip(tmp_path):
+    expected = np.arange(12 * 7).reshape(12, 7) + 0.5
+    bl = _fill(BufferList(tmp_path / 'bl'), (12, 7), lambda i, j: expected[i, j])
+    bl.flush()
+
+    assert np.array_equal(bl.toarray(), expected)
+    assert np.array_equal(bl[5, :], expected[5, :])
+    assert np.array_equal(bl[:, 3], expected[:, 3])
+    assert np.array_equal(bl[2:10:3, ::-2], expected[2:10:3, ::-2])
+    assert [pos for pos, _ in bl.iter()] == list(np.ndindex(12, 7))
+
+
+def test_bufferlist_mixed_values(tmp_path):
+    bl = BufferList(tmp_path / 'bl')
+    bl.lu, bl.rd = (0, ), (1, )
+    values = [1.0, 2.0, {'a': 1}, 3 + 1j, 'x']
+    for i, v in enumerate(values):
+        bl.append((i, ), v)
+    bl.flush()
+    assert [v for _, v in bl.iter()] == values
+
+
+def _scalar_values():
+    return [1.5, 2, True, 1 + 2j, np.float64(0.5), np.int32(3), np.bool_(1)]
+
+
+def test_bufferlist_scalar_types(tmp_path):
+    values = _scalar_values()
+    bl = BufferList(tmp_path / 'bl')
+    bl.lu, bl.rd = (0, ), (1, )
+    for i, v in enumerate(values):
+        bl.append((i, ), v)
+    bl.flush()
+    for got in [bl.value(), [v for _, v in bl.iter()]]:
+        assert got == values
+        assert [type(v) for v in got] == [type(v) for v in values]
+
+
+def test_bufferlist_reads_dill_stream(tmp_path):
+    file = tmp_path / 'legacy'
+    with open(file, 'wb') as f:
+        for i in range(5):
+            dill.dump(((i, ), i * 1.5), f)
+    bl = BufferList(file)
+    bl.lu, bl.rd = (0, ), (5, )
+    assert np.array_equal(bl.toarray(), np.arange(5) * 1.5)
+
+    bl.append((5, ), 7.5)
+    bl.flush()
+    assert np.array_equal(bl.toarray(), np.arange(6) * 1.5)
+
+
+def test_bufferlist_zip_members(tmp_path, monkeypatch):
+    import zipfile
+
+    from qulab.scan import record
+
+    file = tmp_path / 'archive.zip'
+    columnar = _fill(BufferList(tmp_path / 'bl'), (4, 3), lambda i, j: i + j / 10)
+    with zipfile.ZipFile(file, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        with z.open('legacy.buf', 'w') as f:
+            for i in range(5):
+                dill.dump(((i, ), i * 1.5), f)
+        z.writestr('columnar.buf', b''.join(columnar._columnar_chunks()))
+
+    reads = []
+    read_member = record._read_zip_member
+    monkeypatch.setattr(record, '_read_zip_member',
+                        lambda *a: reads.append(a) or read_member(*a))
+
+    legacy = BufferList((str(file), 'legacy.buf'))
+    legacy.lu, legacy.rd = (0, ), (5, )
+    assert np.array_equal(legacy.toarray(), np.arange(5) * 1.5)
+    assert [v for _, v in legacy.iter()] == [i * 1.5 for i in range(5)]
+    assert len(reads) == 1
+
+    bl = BufferList((str(file), 'columnar.buf'))
+    bl.lu, bl.rd = columnar.lu, columnar.rd
+    assert isinstance(bl._read_buffer(), np.memmap)
+    assert np.array_equal(bl.toarray(), columnar.toarray())
+    assert np.array_equal(bl[2, :], columnar.toarray()[2, :])
+    assert len(reads) == 2
+
+
+def test_bufferlist_block_index(tmp_path):
+    expected = np.arange(30 * 40).reshape(30, 40) * 1.0
+    bl = BufferList(tmp_path / 'bl')
+    bl.lu, bl.rd = (0, 0), (1, 1)
+    for i in range(30):
+        for j in range(40):
+            bl.append((i, j), expected[i, j])
+        bl.flush()
+
+    index_file = tmp_path / 'bl.idx'
+    assert index_file.exists()
+    bl._slice = bl._full_slice((4, slice(None)))[0]
+    buf = bl._read_buffer()
+    assert len(bl._select_blocks(buf)) == 1
+    bl._slice = None
+    assert np.array_equal(bl[4, :], expected[4, :])
+
+    index_file.unlink()
+    assert np.array_equal(bl[10:20:3, 5], expected[10:20:3, 5])
+    assert index_file.exists()
+
+
+def test_concurrent_slices(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    expected = np.arange(20 * 30).reshape(20, 30) * 1.0
+    bl = _fill(BufferList(tmp_path / 'bl'), (20, 30), lambda i, j: expected[i, j])
+    bl.flush()
+
+    class FakeRecord:
+
+        def get(self, key, buffer_to_array=False):
+            return bl
+
+    monkeypatch.setattr(server, 'get_record', lambda *args: FakeRecord())
+
+    def read(i):
+        row = bl._full_slice((i % 20, slice(None)))[0]
+        assert np.array_equal(
+            server.record_toarray(None, 1, 'z', row, tmp_path), expected[i % 20:i % 20 + 1])
+        assert np.array_equal(bl[:, i % 30], expected[:, i % 30])
+        msg = {'iter_id': None, 'record_id': 1, 'key': 'z', 'slice': row,
+               'start': 0}
+        values, end = [], False
+        while not end:
+            msg['iter_id'], items, end = server.bufferlist_iter(None, msg, tmp_path)
+            values.extend(v for _, v in items)
+        assert values == list(expected[i % 20])
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(read, range(200)))
+    assert bl._slice is None
+
+
+def test_array_reply_roundtrip():
+    ctx = zmq.Context()
+    server, client = ctx.socket(zmq.PAIR), ctx.socket(zmq.PAIR)
+    server.bind('inproc://array-reply')
+    client.connect('inproc://array-reply')
+    try:
+        x = (np.arange(24) + 1j).reshape(2, 3, 4)[:, ::2]
+        for value in [x, np.float64(1.5), [1, 'a'], np.array([{}, None])]:
+            server.send_multipart(pack_array(value), copy=False)
+            ret = _recv_array(client)
+            assert type(ret) is type(value)
+            if isinstance(value, np.ndarray) and value.dtype.kind == 'c':
+                assert ret.flags.writeable and np.array_equal(ret, value)
+    finally:
+        server.close()
+        client.close()
+        ctx.term()
+
+
+class _StreamRecord():
+
+    def __init__(self, bufferlist):
+        self.bufferlist = bufferlist
+
+    def get(self, key, buffer_to_array=False):
+        return self.bufferlist
+
+
+@pytest_asyncio.fixture
+async def stream_server(tmp_path, monkeypatch):
+    """Serve `bufferlist_stream` of the BufferList set as `.bufferlist`."""
+    import zmq.asyncio
+
+    holder = _StreamRecord(None)
+
+    async def get_record_async(session, id, datapath):
+        return holder
+
+    monkeypatch.setattr(server, 'get_record_async', get_record_async)
+    ctx = zmq.asyncio.Context()
+    sock = ctx.socket(zmq.ROUTER)
+    port = sock.bind_to_random_port('tcp://127.0.0.1')
+
+    async def loop():
+        tasks = set()
+        while True:
+            identity, msg = await sock.recv_multipart()
+            task = asyncio.create_task(
+                server.handle(None, server.Request(sock, identity, msg),
+                              tmp_path))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    task = asyncio.create_task(loop())
+    holder.url = f'tcp://127.0.0.1:{port}'
+    try:
+        yield holder
+    finally:
+        task.cancel()
+        sock.close(linger=0)
+        ctx.term()
+
+
+def _blocks(tmp_path, n):
+    """A BufferList of `n` blocks of 3 items each."""
+    bl = BufferList(tmp_path / 'stream')
+    bl.lu, bl.rd = (0, ), (1, )
+    for i in range(3 * n):
+        bl.append((i, ), float(i))
+        if i % 3 == 2:
+            bl.flush()
+    return bl
+
+
+def _stream_client(url):
+    bl = BufferList()
+    bl._data_id = url, 1, 'x'
+    return bl
+
+
+async def _wait_closed(timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if not server.streams:
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+@pytest.mark.asyncio
+async def test_stream_scalar_types(tmp_path, stream_server):
+    values = _scalar_values()
+    bl = BufferList(tmp_path / 'stream')
+    bl.lu, bl.rd = (0, ), (1, )
+    for i, v in enumerate(values):
+        bl.append((i, ), v)
+    bl.flush()
+    stream_server.bufferlist = bl
+    client = _stream_client(stream_server.url)
+    got = await asyncio.to_thread(client.value)
+    assert got == values
+    assert [type(v) for v in got] == [type(v) for v in values]
+
+
+@pytest.mark.asyncio
+async def test_stream_with_credit(tmp_path, stream_server, monkeypatch):
+    from qulab.scan import record
+
+    monkeypatch.setattr(record, '_STREAM_WINDOW', 4)
+    stream_server.bufferlist = _blocks(tmp_path, 20)
+    client = _stream_client(stream_server.url)
+    blocks = await asyncio.to_thread(lambda: list(client._iter_arrays()))
+    assert [len(pos) for pos, _ in blocks] == [3] * 20
+    assert np.array_equal(np.concatenate([v for _, v in blocks]),
+                          np.arange(60.0))
+    assert await _wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_stream_reads_on_worker(tmp_path, stream_server, monkeypatch):
+    import threading
+
+    worker = server.Worker(lambda: None, 1024)
+    monkeypatch.setattr(server, 'workers', [worker])
+    threads = set()
+    read_block = server.read_block
+
+    def read_on_thread(*args):
+        threads.add(threading.current_thread())
+        return read_block(*args)
+
+    monkeypatch.setattr(server, 'read_block', read_on_thread)
+    stream_server.bufferlist = _blocks(tmp_path, 3)
+    client = _stream_client(stream_server.url)
+    try:
+        blocks = await asyncio.to_thread(lambda: list(client._iter_arrays()))
+    finally:
+        worker.executor.shutdown()
+    assert len(blocks) == 3
+    assert threads and threading.main_thread() not in threads
+
+
+@pytest.mark.asyncio
+async def test_empty_stream(tmp_path, stream_server):
+    stream_server.bufferlist = BufferList(tmp_path / 'empty')
+    client = _stream_client(stream_server.url)
+    assert await asyncio.to_thread(lambda: list(client._iter_arrays())) == []
+    assert await _wait_closed()
+
+
+async def _open_stream(url, credit):
+    import zmq.asyncio
+
+    ctx = zmq.asyncio.Context()
+    sock = ctx.socket(zmq.DEALER)
+    sock.connect(url)
+    await sock.send_pyobj({
+        'method': 'bufferlist_stream',
+        'record_id': 1,
+        'stream_id': b'stream',
+        'key': 'x',
+        'slice': None,
+        'credit': credit
+    })
+    return ctx, sock
+
+
+async def _received(sock, timeout=0.2):
+    frames = []
+    while await sock.poll(timeout * 1000):
+        frames.append(pickle.loads((await sock.recv_multipart())[0]))
+    return frames
+
+
+@pytest.mark.asyncio
+async def test_stream_backpressure(tmp_path, stream_server):
+    stream_server.bufferlist = _blocks(tmp_path, 5)
+    ctx, sock = await _open_stream(stream_server.url, 2)
+    try:
+        # the server stops after the blocks it has credit for
+        assert len(await _received(sock)) == 2
+        assert b'stream' in server.streams
+        await sock.send_pyobj({
+            'method': 'bufferlist_stream_credit',
+            'stream_id': b'stream',
+            'credit': 1
+        })
+        assert len(await _received(sock)) == 1
+        await sock.send_pyobj({
+            'method': 'bufferlist_stream_credit',
+            'stream_id': b'stream',
+            'credit': 10
+        })
+        *headers, end = await _received(sock)
+        assert len(headers) == 2 and end == {'end': True}
+        assert await _wait_closed()
+    finally:
+        sock.close(linger=0)
+        ctx.term()
+
+
+@pytest.mark.asyncio
+async def test_stream_client_exit(tmp_path, stream_server, monkeypatch):
+    from qulab.scan import record
+
+    monkeypatch.setattr(record, '_STREAM_WINDOW', 2)
+    stream_server.bufferlist = _blocks(tmp_path, 20)
+    client = _stream_client(stream_server.url)
+
+    def read_two():
+        it = client._iter_arrays()
+        blocks = [next(it), next(it)]
+        it.close()
+        return blocks
+
+    assert len(await asyncio.to_thread(read_two)) == 2
+    assert await _wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_stream_idle_timeout(tmp_path, stream_server, monkeypatch):
+    monkeypatch.setattr(server, 'STREAM_TIMEOUT', 0.1)
+    stream_server.bufferlist = _blocks(tmp_path, 5)
+    ctx, sock = await _open_stream(stream_server.url, 1)
+    try:
+        assert len(await _received(sock)) == 1
+        # no credit granted, the server gives up on the stream
+        assert await _wait_closed(1)
+    finally:
+        sock.close(linger=0)
+        ctx.term()
+
+
+class _Socket():
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_pyobj(self, msg):
+        self.sent.append(msg)
+
+
+class _Record():
+    id = 1
+
+
+@pytest.mark.asyncio
+async def test_scan_batches_appends():
+    scan = Scan('test', database=None, batch_size=3, batch_interval=3600)
+    scan._sock, scan.record = _Socket(), _Record()
+    for i in range(4):
+        await scan._emit(0, i, i, {'x': i, '__hidden': 0})
+    assert [len(m['appends']) for m in scan._sock.sent] == [3]
+    await scan._emit(-1, 0, 0, {})
+    assert [m['method'] for m in scan._sock.sent] == ['record_append_many'] * 2
+    last, end = scan._sock.sent[1]['appends']
+    assert last == (0, 3, 3, {'x': 3})
+    assert end[:3] == (-1, 0, 0) and list(end[3]) == ['__limits__']
+
+
+def test_record_times_write_behind():
+    engine = create_engine('sqlite://')
+    create_tables(engine)
+    with sessionmaker(engine)() as session:
+        records = [RecordInDB(app='test') for _ in range(3)]
+        session.add_all(records)
+        session.commit()
+        ids = [r.id for r in records]
+        mtime = [r.mtime for r in records]
+        atime = [r.atime for r in records]
+
+        server.touch_record(ids[0], modified=True)
+        server.touch_record(ids[1])
+        server.touch_record(ids[1])
+        assert session.get(RecordInDB, ids[0]).mtime == mtime[0]
+        server.flush_record_times(session)
+        assert not server.record_times
+
+        session.expire_all()
+        r0, r1, r2 = [session.get(RecordInDB, id) for id in ids]
+        assert r0.mtime > mtime[0] and r0.atime == r0.mtime
+        assert r1.mtime == mtime[1] and r1.atime > mtime[1]
+        assert r2.mtime == mtime[2] and r2.atime == atime[2]
+
+
+def test_lru_cache_byte_budget():
+    evicted = []
+    cache = server.LRUCache(max_items=3,
+                            max_bytes=10,
+                            sizeof=len,
+                            on_evict=lambda k, v: evicted.append(k))
+    cache.put('a', 'xxxx')
+    cache.put('b', 'xxxx')
+    assert cache.get('a') == 'xxxx'
+    cache.put('c', 'xxxx')
+    assert evicted == ['b'] and cache.nbytes == 8
+    cache.put('a', 'x')
+    cache.put('d', 'x')
+    cache.put('e', 'x')
+    assert evicted == ['b', 'c'] and 'a' in cache
+    assert cache.get('missing') is None
+    assert cache.stats() == {
+        'items': 3,
+        'bytes': 3,
+        'max_items': 3,
+        'max_bytes': 10,
+        'hits': 1,
+        'misses': 1,
+        'evictions': 2
+    }
+
+
+@pytest.mark.asyncio
+async def test_workers_keep_append_order(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "data.db"}')
+    create_tables(engine)
+    Session = sessionmaker(engine)
+    description = Scan('test', database=tmp_path).description
+    description['loops'] = {0: [('x', range(200))]}
+    description['independent_variables'] = {'x'}
+    with Session() as session:
+        server.workers.extend(server.Worker(Session, 2**20) for _ in range(2))
+        try:
+            ids = [
+                server.record_create(session, description, tmp_path)
+                for _ in range(2)
+            ]
+            futures = []
+            for i in range(200):
+                for id in ids:
+                    futures.append(
+                        server.worker_of(id).submit(
+                            server.handle_record, {
+                                'method': 'record_append',
+                                'record_id': id,
+                                'level': 0,
+                                'step': i,
+                                'position': i,
+                                'variables': {
+                                    'x': i,
+                                    'y': i * id * 0.5
+                                }
+                            }, tmp_path))
+            await asyncio.gather(*futures)
+            for id in ids:
+                frames = await server.worker_of(id).submit(
+                    server.handle_record, {
+                        'method': 'record_slice',
+                        'record_id': id,
+                        'key': 'y',
+                        'slice': slice(None, None, 10)
+                    }, tmp_path)
+                header = pickle.loads(frames[0])
+                y = np.frombuffer(frames[1], dtype=header['dtype'])
+                assert np.array_equal(y, np.arange(0, 200, 10) * id * 0.5)
+        finally:
+            for worker in server.workers:
+                worker.close()
+            server.workers.clear()
+
+
+def _two_level_scan(z):
+    scan = Scan('test', database=None)
+    scan.search('x', np.linspace(0, 1, 5), level=0)
+    scan.search('y', np.arange(7), level=1)
+    scan.set('z', z)
+    return scan
+
+
+@pytest.mark.asyncio
+async def test_vectorized_level():
+    from qlispreg.expression import Symbol
+
+    x, y = np.linspace(0, 1, 5)[:, None], np.arange(7)[None, :]
+
+    vectorized = _two_level_scan(Symbol('x') * 10 + Symbol('y')**2)
+    await vectorized.run()
+    stepwise = _two_level_scan(lambda x, y: x * 10 + y**2)
+    await stepwise.run()
+
+    for scan, vectorizable in [(vectorized, True), (stepwise, False)]:
+        d = scan.description
+        block = _vectorize_level({'x': 0.5}, d['loops'][1], d['order'][1],
+                                 d['functions'])
+        assert (block is not None) == vectorizable
+
+    for scan in [vectorized, stepwise]:
+        assert np.allclose(scan.record['z'], x * 10 + y**2)
+        assert np.array_equal(scan.record['y'], np.arange(7))
+        assert scan.variables['y'] == 6
+
+
+@pytest.mark.asyncio
+async def test_vectorized_level_with_config(tmp_path):
+    from qlispreg.expression import Symbol
+
+    def make_scan(z):
+        scan = _two_level_scan(z)
+        scan.description['database'] = tmp_path
+        scan.set('gate.amp', Symbol('y') * 2)
+        return scan
+
+    vectorized = make_scan(Symbol('x') * 10 + Symbol('y')**2)
+    await vectorized.run()
+    stepwise = make_scan(lambda x, y: x * 10 + y**2)
+    await stepwise.run()
+
+    for scan, vectorizable in [(vectorized, True), (stepwise, False)]:
+        d = scan.description
+        assert 'config' in [name for group in d['order'][1] for name in group]
+        assert (_vectorize_level({'x': 0.5}, d['loops'][1], d['order'][1],
+                                 d['functions'], late=['config'])
+                is not None) == vectorizable
+        # 'gate.amp' only depends on y
+        assert np.array_equal(scan.record['gate.amp'], np.arange(7) * 2)
+        assert np.allclose(scan.record['z'],
+                           np.linspace(0, 1, 5)[:, None] * 10 +
+                           np.arange(7)[None, :]**2)
+
+    # the config is synchronized once, from the last step
+    assert vectorized.config['gate']['amp'] == 12
+
+    def block_counts(scan):
+        z = scan.record.get('z', buffer_to_array=False)
+        z.flush()
+        return list(z._load_index(z._read_buffer())['count'])
+
+    # the steps after the first of each row are written as one block
+    assert block_counts(vectorized) == [1, 6] * 5
+    assert 6 not in block_counts(stepwise)
+
+
+@pytest.mark.asyncio
+async def test_function_call():
+    from qlispreg.expression import Symbol
+
+    from qulab.scan.utils import FunctionCall
+
+    async def double(x):
+        return 2 * x
+
+    async def pending():
+        return 5
+
+    call = FunctionCall(lambda x, y=1: x + y)
+    assert call({'x': 1}) == 2
+    assert call({'x': 1, 'y': 2}, {'y': 3}) == 4
+    assert await call({'x': pending()}) == 6
+    assert await FunctionCall(double)({'x': 3}) == 6
+    assert FunctionCall(Symbol('x') * 3)({'x': 2}) == 6
+    assert await FunctionCall(lambda **kw: kw['x'])({'x': 7}) == 7
+    with pytest.raises(ValueError):
+        FunctionCall(lambda z: z)({'x': 1})
+
+
+def _array_sum(x, offset=0):
+    return float(x.sum()) + offset
+
+
+_SCALE = 2
+
+
+def _scaled(i):
+    return i * _SCALE
+
+
+@pytest.mark.asyncio
+async def test_function_pool():
+    from multiprocessing import shared_memory
+
+    from qulab.scan.process import FunctionPool, SharedArray
+
+    pool = FunctionPool(max_workers=2, threshold=1024)
+    try:
+        key, func_buf, buf, blocks = pool.pack(_array_sum, (np.ones(10), ),
+                                               {'offset': 1})
+        assert pool.pack(_array_sum)[1] is func_buf
+        assert blocks == []
+        assert await pool.run(key, func_buf, buf) == 11
+
+        x = np.arange(1000.0)
+        call = pool.pack(_array_sum, (x, ))
+        (block, ) = call[3]
+        assert isinstance(dill.loads(call[2])[0][0], SharedArray)
+        assert await pool.run(*call) == x.sum()
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=block.name)
+
+        results = await asyncio.gather(
+            *[pool.submit(lambda i: i * i, i) for i in range(20)])
+        assert results == [i * i for i in range(20)]
+
+        offset = 1
+        add = lambda i: i + offset
+        assert await pool.submit(add, 1) == 2
+        offset = 10
+        assert await pool.submit(add, 1) == 11
+
+        # rebinding a global it uses dumps the function again
+        global _SCALE
+        func_buf = pool.pack(_scaled)[1]
+        assert pool.pack(_scaled)[1] is func_buf
+        _SCALE = 3
+        try:
+            assert pool.pack(_scaled)[1] is not func_buf
+        finally:
+            _SCALE = 2
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_promise_releases_shared_memory():
+    from multiprocessing import shared_memory
+
+    scan = Scan('test', database=None, max_workers=1)
+    calls = []
+    pack = scan._executors.pack
+    scan._executors.pack = lambda *a: calls.append(pack(*a)) or calls[-1]
+    try:
+        await scan.promise(_array_sum, np.ones(200_000))
+        (block, ) = calls[0][3]
+        task = scan._prm_queue.get_nowait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=block.name)
+    finally:
+        scan._executors.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limit():
+    from qulab.scan.limit import AdaptiveLimit
+
+    limit = AdaptiveLimit(4, minimum=1, maximum=8)
+    for _ in range(4):
+        await limit.acquire()
+    assert limit.locked()
+    waiter = asyncio.create_task(limit.acquire())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    limit.release(0.01)
+    await waiter
+
+    for _ in range(200):
+        limit.observe(0.01)
+    assert int(limit.limit) == 8
+    for _ in range(20):
+        limit.observe(1.0)
+    assert int(limit.limit) < 8
+    assert [h[1] for h in limit.history][-1] == int(limit.limit)
+
+    fixed = AdaptiveLimit(4, adaptive=False)
+    for latency in [0.01, 1.0, 1.0, 1.0]:
+        fixed.observe(latency)
+    assert fixed.limit == 4 and len(fixed.history) == 1
+
+    scan = Scan('test', database=None, max_promise=10, max_message=10)
+    scan.search('x', np.arange(50), level=0)
+    scan.set('y', lambda x: x + 1)
+    await scan.run()
+    assert np.array_equal(scan.record['y'], np.arange(1, 51))
+    limits = scan.record['__limits__']
+    assert set(limits) == {'promise', 'message'}
+    assert limits['message']['limit'][0] == 10
+
+    scan = Scan('test', database=None, adaptive=False)
+    scan.search('x', np.arange(5), level=0)
+    await scan.run()
+    assert '__limits__' not in scan.record.keys()
+
+
+@pytest.mark.asyncio
+async def test_emit_plans():
+    from qulab.scan.record import Record
+
+    scan = Scan('test', database=None)
+    scan.search('x', np.arange(3), level=0)
+    scan.record = Record(None, None, scan.description)
+
+    async def pending():
+        return 2.0
+
+    for i in range(3):
+        await scan._emit(0, i, i, {
+            'x': i,
+            'y': float(i),
+            'z': pending(),
+            '__hidden': 0,
+            'self': scan,
+            '*u{i}': [1.0, 2.0],
+        })
+    assert set(scan.record.keys()) == {'x', 'y', 'z', 'u0', 'u1'}
+    assert np.array_equal(scan.record['y'], [0.0, 1.0, 2.0])
+    assert np.array_equal(scan.record['z'], [2.0] * 3)
+    assert np.array_equal(scan.record['u1'], [2.0] * 3)
+    assert len(scan.record._plans) == 1
+
+    scan.hide('y')
+    await scan._emit(0, 3, 3, {'x': 3, 'y': 3.0})
+    assert scan.record['y'].shape == (3, )
+
+
+def test_compiled_plan_cache(plan_cache, monkeypatch):
+    from qulab.scan import scan as scan_module
+    from qulab.scan.scan import assymbly
+
+    builds = []
+    build_order = scan_module._build_order
+    monkeypatch.setattr(scan_module, '_build_order',
+                        lambda *args: builds.append(1) or build_order(*args))
+
+    first = assymbly(_two_level_scan(lambda x, y: x + y).description)
+    assert len(builds) == 1
+    assert (plan_cache / f"{first['plan_key']}.pkl").exists()
+
+    again = assymbly(_two_level_scan(lambda x, y: x * y).description)
+    assert len(builds) == 1
+    assert again['plan_key'] == first['plan_key']
+    assert again['order'] == first['order']
+    assert again['axis'] == first['axis']
+
+    monkeypatch.setattr(scan_module, '_compiled_plans', {})
+    assymbly(_two_level_scan(lambda x, y: x - y).description)
+    assert len(builds) == 1
+
+    other = _two_level_scan(lambda x: x)
+    other.set('w', lambda z, y: z + y)
+    assert assymbly(other.description)['plan_key'] != first['plan_key']
+    assert len(builds) == 2
+
+
+def test_plan_cache_files_are_bounded(plan_cache, monkeypatch):
+    import os
+
+    from qulab.scan import scan as scan_module
+
+    monkeypatch.setattr(scan_module, 'PLAN_CACHE_FILES', 2)
+    for i, key in enumerate('abc'):
+        scan_module.save_compiled_plan({'key': key})
+        os.utime(plan_cache / f'{key}.pkl', (i, i))
+    assert sorted(f.stem for f in plan_cache.glob('*.pkl')) == ['b', 'c']
+
+    monkeypatch.setattr(scan_module, '_compiled_plans', {})
+    assert scan_module.load_compiled_plan('b') == {'key': 'b'}
+    scan_module.save_compiled_plan({'key': 'd'})
+    assert sorted(f.stem for f in plan_cache.glob('*.pkl')) == ['b', 'd']
+
+
+class _GridSearch():
+
+    def __init__(self, dimensions):
+        self.points = iter(np.linspace(-1, 1, 10))
+        self.told = []
+
+    def ask(self, n_points=None):
+        if n_points is not None:
+            return [self.ask() for _ in range(n_points)]
+        return [next(self.points)]
+
+    def tell(self, x, y):
+        self.told.append((x, y))
+
+    def get_result(self):
+        from scipy.optimize import OptimizeResult
+
+        x, _ = min(((x, y) for xs, ys in self.told for x, y in zip(
+            *((xs, ys) if isinstance(ys, list) else ([xs], [ys])))),
+                   key=lambda p: p[1])
+        return OptimizeResult({'x': x})
+
+
+def _optimize_scan(batch_size, method=_GridSearch):
+    scan = Scan('test', database=None)
+    opt = scan.minimize('loss', level=0, method=method, maxiter=10,
+                        batch_size=batch_size)
+    scan.search('x', opt.Real(-1, 1))
+
+    async def loss(x):
+        await asyncio.sleep(0.05)
+        return (x - 0.2)**2
+
+    # a promise, so that the points of a batch are measured concurrently
+    scan.set('loss', lambda self, x: self.promise(loss(x)))
+    return scan
+
+
+@pytest.mark.asyncio
+async def test_batch_optimizer():
+    import time
+
+    from qulab.scan.optimize import NgOptimizer
+
+    durations, told = {}, {}
+    for batch_size in [1, 4]:
+        scan = _optimize_scan(batch_size)
+        opts = []
+        create = scan.description['optimizers']['loss'].create
+        scan.description['optimizers']['loss'].create = (
+            lambda: opts.append(create()) or opts[-1])
+        start = time.perf_counter()
+        await scan.run()
+        durations[batch_size] = time.perf_counter() - start
+        told[batch_size] = [
+            len(x) if isinstance(y, list) else 1 for x, y in opts[0].told
+        ]
+        assert abs(scan.variables['x'] - 0.2) < 0.15
+
+    assert told == {1: [1] * 10, 4: [4, 4, 2]}
+    assert durations[4] < durations[1] / 2
+
+    scan = _optimize_scan(3, NgOptimizer)
+    await scan.run()
+    assert len(scan.description['optimizers']['loss'].kwds) == 1
+    assert -1 <= scan.variables['x'] <= 1
+
+
+def test_ng_optimizer_tell():
+    from qulab.scan.optimize import NgOptimizer
+    from qulab.scan.space import Real
+
+    opt = NgOptimizer([Real(-1, 1), Real(-1, 1)])
+    opt.tell([0.1, 0.2], np.asarray(np.float64(1.5)))
+    opt.tell([0.3, 0.4], np.array([2.5]))
+    opt.tell([[0.5, 0.6], [0.7, 0.8]], np.array([3.5, 4.5]))
+    result = opt.get_result(history=True)
+    assert result.x_iters == [[0.1, 0.2], [0.3, 0.4], [0.5, 0.6], [0.7, 0.8]]
+    assert [float(np.asarray(y).item()) for y in result.func_vals] == [
+        1.5, 2.5, 3.5, 4.5
+    ]
+    with pytest.raises(ValueError):
+        opt.tell([[0.5, 0.6], [0.7, 0.8]], [1.0])
+
+
+def _crashing_scan(database, fail, **kwds):
+    kwds = {'checkpoint': True, 'checkpoint_steps': 1} | kwds
+    scan = Scan('test', database=database, **kwds)
+    scan.search('x', np.arange(6), level=0)
+    scan.search('y', np.arange(4), level=1)
+
+    def z(x, y):
+        if x == fail:
+            raise RuntimeError('crash')
+        return x * 10 + y + np.random.rand() * 0
+
+    scan.set('z', z)
+    scan.set('r', lambda x: float(np.random.rand()))
+    return scan
+
+
+@pytest.mark.asyncio
+async def test_resume_from_checkpoint(tmp_path):
+    np.random.seed(1)
+    full = _crashing_scan(tmp_path, fail=None)
+    await full.run()
+
+    np.random.seed(1)
+    crashed = _crashing_scan(tmp_path, fail=3)
+    with pytest.raises(RuntimeError):
+        await crashed.run()
+    file = crashed.record._file
+    assert file.with_name(file.name + '.journal').exists()
+    assert crashed.record.last_checkpoint['position'] == 3
+
+    resumed = _crashing_scan(tmp_path, fail=None)
+    await resumed.resume(file)
+    assert resumed.record._file == file
+    for key in ['z', 'r']:
+        assert np.array_equal(resumed.record[key], full.record[key])
+
+    with open(file, 'rb') as f:
+        record = dill.load(f)
+    record.reopen(file, tmp_path)
+    assert np.array_equal(record['z'], full.record['z'])
+
+
+@pytest.mark.asyncio
+async def test_resume_between_checkpoints(tmp_path):
+    full = _crashing_scan(tmp_path, fail=None)
+    await full.run()
+
+    crashed = _crashing_scan(tmp_path, fail=3, checkpoint_steps=2)
+    with pytest.raises(RuntimeError):
+        await crashed.run()
+    # the step after the checkpoint reached the files before the crash
+    crashed.record.flush()
+    file = crashed.record._file
+    assert crashed.record.last_checkpoint['position'] == 2
+    assert crashed.record['z'].shape == (3, 4)
+
+    resumed = _crashing_scan(tmp_path, fail=None, checkpoint_steps=2)
+    await resumed.resume(file)
+    pos = resumed.record.get('z').pos()
+    assert len(pos) == len(set(pos)) == 24
+    assert np.array_equal(resumed.record['z'], full.record['z'])
+
+    with open(file, 'rb') as f:
+        record = dill.load(f)
+    record.reopen(file, tmp_path)
+    pos, z = record.get('z').items()
+    assert len(pos) == len(set(pos)) == 24
+    assert np.array_equal(record['z'], full.record['z'])
+
+
+def test_record_get_checkpoint_rolls_back(tmp_path, monkeypatch):
+    from qulab.scan.record import Record
+
+    scan = _two_level_scan(lambda x, y: x + y)
+    record = Record(None, tmp_path, scan.description)
+    record.append(1, 0, 0, {'x': 0.0, 'y': 0, 'z': 0.0})
+    record.checkpoint({'position': 1})
+    record.append(1, 1, 1, {'x': 0.0, 'y': 1, 'z': 1.0})
+    record.flush()
+    monkeypatch.setattr(server, 'get_record', lambda *args: record)
+
+    frames = server.handle_record(None, {
+        'method': 'record_get_checkpoint',
+        'record_id': 1
+    }, tmp_path)
+    assert pickle.loads(frames[0]) == {'position': 1}
+    assert record.get('z').pos() == [(0, 0)]
+    assert np.array_equal(record['z'], [[0.0]])
+
+    with open(record._file, 'rb') as f:
+        loaded = dill.load(f)
+    loaded.reopen(record._file, tmp_path)
+    assert loaded.get('z').pos() == [(0, 0)]
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_throttle(tmp_path):
+    scan = _crashing_scan(tmp_path, fail=3, checkpoint=False)
+    with pytest.raises(RuntimeError):
+        await scan.run()
+    assert scan.record.last_checkpoint is None
+
+    scan = _crashing_scan(tmp_path, fail=5, checkpoint_steps=2)
+    with pytest.raises(RuntimeError):
+        await scan.run()
+    assert scan.record.last_checkpoint['position'] == 4
+
+
+def test_checkpoint_merges_told(tmp_path):
+    from qulab.scan.record import Record
+
+    scan = _two_level_scan(lambda x, y: x + y)
+    record = Record(None, tmp_path, scan.description)
+    record.append(1, 0, 0, {'x': 0.0, 'y': 0, 'z': 0.0})
+    record.checkpoint({'position': 1, 'told': {'loss': [(0, 1.0)]}})
+    record.checkpoint({'position': 2, 'told': {'loss': [(1, 2.0)]}})
+    assert record.last_checkpoint == {
+        'position': 2,
+        'optimizers': {
+            'loss': [(0, 1.0), (1, 2.0)]
+        }
+    }
+
+    with open(record._file, 'rb') as f:
+        loaded = dill.load(f)
+    loaded.reopen(record._file, tmp_path)
+    assert loaded.last_checkpoint == record.last_checkpoint
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_sent_with_batch():
+    scan = Scan('test', database=None, batch_size=3, batch_interval=3600)
+    scan._sock, scan.record = _Socket(), _Record()
+    await scan._emit(0, 0, 0, {'x': 0})
+    await scan._checkpoint({'position': 1, 'told': {'loss': [(0, 1.0)]}})
+    await scan._emit(0, 1, 1, {'x': 1})
+    await scan._checkpoint({'position': 2, 'told': {'loss': [(1, 2.0)]}})
+    assert scan._sock.sent == []
+    await scan._emit(0, 2, 2, {'x': 2})
+    msg, = scan._sock.sent
+    assert msg['method'] == 'record_append_many'
+    assert len(msg['appends']) == 3
+    assert msg['checkpoint'] == {
+        'position': 2,
+        'told': {
+            'loss': [(0, 1.0), (1, 2.0)]
+        }
+    }
+
+
+def test_record_flush_writes_deltas(tmp_path):
+    from qulab.scan.record import Record
+
+    scan = _two_level_scan(lambda x, y: x + y)
+    record = Record(None, tmp_path, scan.description)
+    record.append(1, 0, 0, {'x': 0.0, 'y': 0, 'z': 0.0})
+    record.flush()
+    size = record._file.stat().st_size
+    journal = record._journal_file()
+    assert not journal.exists()
+
+    record.append(1, 1, 1, {'x': 0.0, 'y': 1, 'z': 1.0})
+    record.flush()
+    record.checkpoint({'position': 1})
+    assert record._file.stat().st_size == size
+    assert journal.exists()
+
+    with open(record._file, 'rb') as f:
+        loaded = dill.load(f)
+    loaded.reopen(record._file, tmp_path)
+    assert loaded.last_checkpoint == {'position': 1}
+    assert np.array_equal(loaded['z'], [[0.0, 1.0]])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('codec', [None, 'zlib', 'lzma'])
+async def test_record_export(tmp_path, codec):
+    import zipfile
+
+    from qulab.scan.record import Record
+
+    scan = _two_level_scan(lambda x, y: x * 10 + y**2)
+    scan.description['database'] = tmp_path
+    scan.set('w', lambda x: {'x': x})
+    await scan.run()
+
+    file = tmp_path / 'record.zip'
+    scan.record.export(file, codec=codec, max_workers=2)
+    with zipfile.ZipFile(file) as z:
+        suffix = '' if codec is None else f'.{codec}'
+        info = z.getinfo(f'z.buf{suffix}')
+        assert info.compress_type == zipfile.ZIP_STORED
+
+    record = Record.load(file)
+    assert record._items['z'].file == (str(file), f'z.buf{suffix}')
+    for key in ['z', 'y', 'x']:
+        assert np.array_equal(record[key], scan.record[key])
+    assert list(record['w']) == [{'x': x} for x in np.linspace(0, 1, 5)]
+    assert np.array_equal(record.get('z', buffer_to_array=False)[1:3, ::2],
+                          scan.record['z'][1:3, ::2])
+
+    with pytest.raises(ValueError):
+        scan.record.export(tmp_path / 'bad.zip', codec='nope')
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_record_export_in_chunks(tmp_path, monkeypatch, cached):
+    import zipfile
+    import zlib
+
+    from qulab.scan import record
+    from qulab.scan.record import Record
+
+    monkeypatch.setattr(record, '_EXPORT_CHUNK_SIZE', 256)
+    monkeypatch.setattr(record, '_STREAM_BLOCK_SIZE', 16)
+    expected = np.arange(20 * 7).reshape(20, 7) * 1.5
+    rec = Record(None, None if cached else tmp_path,
+                 _two_level_scan(lambda x, y: x).description)
+    rec._items['z'] = _fill(BufferList(None if cached else tmp_path / 'z'),
+                            (20, 7), lambda i, j: expected[i, j])
+    rec.scripts = lambda: []
+    rec.config = lambda: {}
+    chunks = list(rec._items['z']._columnar_chunks())
+    assert len(chunks) > 1 and max(map(len, chunks)) < 1024
+
+    file = tmp_path / 'record.zip'
+    rec.export(file, codec='zlib', max_workers=2)
+    with zipfile.ZipFile(file) as z:
+        member = z.read('z.buf.zlib')
+    assert member.startswith(record._CHUNKED_MAGIC)
+    assert np.array_equal(Record.load(file)['z'], expected)
+
+    # members compressed as a single stream by earlier versions
+    with zipfile.ZipFile(file, 'a') as z:
+        z.writestr('old.buf.zlib', zlib.compress(b''.join(chunks)))
+    old = BufferList((str(file), 'old.buf.zlib'))
+    old.lu, old.rd = (0, 0), (20, 7)
+    assert np.array_equal(old.toarray(), expected)